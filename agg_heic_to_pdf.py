@@ -1,59 +1,66 @@
 import os
-import pyheif
-from PIL import Image
-import img2pdf
+import sys
+import argparse
 import re
 
-# Set the directory containing the HEIC files
-heic_dir = 'heic'
+# The streaming PDF writer, searchable layers and HEIC engine live under scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from aggregation.pdf_writer import StreamingPDFWriter
+from aggregation.pdf_profiles import DEFAULT_PDF_PROFILE, PDF_PROFILES
+from aggregation.searchable import SearchableLayers, TEXT_SOURCES
+from converters.heic_engine import ConversionTarget, HEICConversionEngine
 
-# Directory to save the converted PNG files
-converted_dir = os.path.join(heic_dir, 'converted_images')
-os.makedirs(converted_dir, exist_ok=True)
 
-# Get a list of all HEIC files in the directory
-heic_files = [f for f in os.listdir(heic_dir) if f.lower().endswith('.heic')]
+def main():
+    parser = argparse.ArgumentParser(description="Combine HEIC logbook photos into one PDF")
+    parser.add_argument('--heic-dir', default='heic', help="Directory containing the HEIC files")
+    parser.add_argument('--output', default='EKG_1933_v4.pdf', help="Output PDF path")
+    parser.add_argument('--profile', choices=list(PDF_PROFILES), default=DEFAULT_PDF_PROFILE,
+                        help="Page encoding: lossless 'archival', 150 dpi JPEG 'web' or 300 dpi black and white 'bilevel'")
+    parser.add_argument('--workers', type=int, help="Number of HEIC decode processes (default: one per CPU core)")
+    parser.add_argument('--logbook', help="complete_logbook.json whose page text makes the PDF searchable")
+    parser.add_argument('--word-boxes', help="Tesseract word boxes saved by the digitizer, to position the text by word")
+    parser.add_argument('--outline', help="combined_logbook.json whose document groups become bookmarks")
+    parser.add_argument('--text-source', choices=TEXT_SOURCES, default='content',
+                        help="Entry text used where there are no word boxes: cleaned content or raw OCR text")
+    args = parser.parse_args()
 
-# Sort the HEIC files based on the numeric part of the filename
-heic_files.sort(key=lambda f: int(re.search(r'(\d+)', f).group(1)))
+    # Set the directory containing the HEIC files
+    heic_dir = args.heic_dir
 
-# Convert HEIC to PNG and store paths to the converted images
-converted_files = []
-for file in heic_files:
-    heic_path = os.path.join(heic_dir, file)
-    print(f"Processing file: {heic_path}")
+    # Get a list of all HEIC files in the directory
+    heic_files = [f for f in os.listdir(heic_dir) if f.lower().endswith('.heic')]
+
+    # Sort the HEIC files based on the numeric part of the filename
+    heic_files.sort(key=lambda f: int(re.search(r'(\d+)', f).group(1)))
+
+    # Page text and bookmarks, if the digitization output is given
+    layers = None
+    if args.logbook or args.word_boxes or args.outline:
+        layers = SearchableLayers(args.logbook, args.word_boxes, args.outline, args.text_source)
+
+    # Set the output PDF path
+    output_pdf_path = args.output
+
+    # HEIC files are decoded and prepared as pages across all cores, then written in order
+    engine = HEICConversionEngine([ConversionTarget('PDF', pdf_profile=args.profile)], args.workers)
+    heic_paths = [os.path.join(heic_dir, file) for file in heic_files]
     try:
-        heif_file = pyheif.read(heic_path)
-        image = Image.frombytes(
-            heif_file.mode,
-            heif_file.size,
-            heif_file.data,
-            "raw",
-            heif_file.mode,
-            heif_file.stride,
-        )
-        # Convert to RGB to ensure compatibility
-        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
-            image = image.convert('RGB')
-        
-        # Save as PNG or JPEG
-        converted_file = os.path.join(converted_dir, os.path.splitext(file)[0] + '.png')
-        image.save(converted_file, "PNG")
-        converted_files.append(converted_file)
+        with StreamingPDFWriter(output_pdf_path) as writer:
+            for file, result in zip(heic_files, engine.convert(heic_paths)):
+                if not result.success:
+                    continue
+                # RGBA pages are flattened to RGB when they are prepared
+                if layers:
+                    layers.add_page(writer, result.pdf_page, file)
+                else:
+                    writer.add_image(result.pdf_page)
+        pdf_size = os.path.getsize(output_pdf_path)
+        print(f"PDF created successfully and saved as {output_pdf_path}")
+        print(f"{args.profile} profile: {pdf_size} bytes, {pdf_size // max(len(writer.pages), 1)} bytes per page")
     except Exception as e:
-        print(f"Error processing file {heic_path}: {e}")
-
-# Set the output PDF path
-output_pdf_path = 'EKG_1933_v4.pdf'
-
-# Convert the processed PNG files to a PDF
-try:
-    with open(output_pdf_path, "wb") as f:
-        f.write(img2pdf.convert(converted_files))
-    print(f"PDF created successfully and saved as {output_pdf_path}")
-except Exception as e:
-    print(f"Error creating PDF: {e}")
-
-# Clean up: Optionally remove the converted images if not needed
-for file in converted_files:
-    os.remove(file)
\ No newline at end of file
+        print(f"Error creating PDF: {e}")
+
+
+if __name__ == "__main__":
+    main()
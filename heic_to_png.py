@@ -1,42 +1,27 @@
 import os
-import pyheif
-from PIL import Image
+import sys
+
+# HEIC files are decoded by the shared conversion engine under scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from converters.heic_engine import ConversionTarget, HEICConversionEngine, decode_heic, find_heic_files, save_image
 
 def convert_heic_to_png(heic_file_path, png_file_path):
-    # Read the HEIC file
-    heif_file = pyheif.read(heic_file_path)
-    
-    # Convert to PIL Image
-    image = Image.frombytes(
-        heif_file.mode,
-        heif_file.size,
-        heif_file.data,
-        "raw",
-        heif_file.mode,
-        heif_file.stride,
-    )
-    
-    # Save as PNG
-    image.save(png_file_path, format="PNG")
+    # Decode the HEIC file and save it as PNG
+    image = decode_heic(heic_file_path)
+    save_image(image, ConversionTarget('PNG', os.path.dirname(png_file_path) or '.'), png_file_path)
     print(f"Converted {heic_file_path} to {png_file_path}")
 
 def batch_convert_heic_to_png(subdir_1, subdir_2):
-    # Ensure the output directory exists
-    if not os.path.exists(subdir_2):
-        os.makedirs(subdir_2)
-
-    # Iterate through all files in subdir_1
-    for root, dirs, files in os.walk(subdir_1):
-        for file in files:
-            if file.lower().endswith('.heic'):
-                heic_file_path = os.path.join(root, file)
-                png_file_name = os.path.splitext(file)[0] + '.png'
-                png_file_path = os.path.join(subdir_2, png_file_name)
-                
-                # Convert and save the image
-                convert_heic_to_png(heic_file_path, png_file_path)
+    # Convert every HEIC file under subdir_1 into subdir_2, across all CPU cores;
+    # PNGs newer than their HEIC file are left as they are
+    target = ConversionTarget('PNG', subdir_2)
+    engine = HEICConversionEngine([target])
+    for result in engine.convert(find_heic_files(subdir_1)):
+        if target in result.outputs:
+            print(f"Converted {result.source} to {result.outputs[target]}")
 
-# Example usage
-subdir_1 = 'heic'
-subdir_2 = 'png'
-batch_convert_heic_to_png(subdir_1, subdir_2)
\ No newline at end of file
+if __name__ == "__main__":
+    # Example usage
+    subdir_1 = 'heic'
+    subdir_2 = 'png'
+    batch_convert_heic_to_png(subdir_1, subdir_2)
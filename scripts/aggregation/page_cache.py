@@ -0,0 +1,126 @@
+"""
+Prepared Page Cache
+
+Preparing a page for the PDF writer means reading the image headers and, for
+images that cannot be embedded as they are, decoding and deflating the whole
+bitmap. This cache keeps prepared pages on disk, keyed by a hash of the source
+path, size and modification time, so a page that appears in the full logbook
+PDF and in a chapter PDF, or in consecutive runs, is prepared only once.
+Entries are kept per output profile.
+Worker processes building chapters in parallel share the same directory;
+entries are written atomically, so concurrent writers of the same page are
+harmless.
+
+Author: Ernest K Gann Digital Archive Project
+Date: 2024
+"""
+
+import os
+import sys
+import json
+import hashlib
+import logging
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+# Add the parent directory to the path to import other modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregation.pdf_profiles import PagePreparer
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bump when prepared page output changes so stale entries are not reused
+PAGE_CACHE_VERSION = 3
+
+
+class PageCache:
+    """On-disk cache of pages prepared by a PagePreparer"""
+
+    def __init__(self, cache_dir: str, preparer: Optional[PagePreparer] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir (str): Directory that holds prepared pages
+            preparer (Optional[PagePreparer]): Prepares pages on a miss (default: archival profile)
+        """
+        self.cache_dir = cache_dir
+        self.preparer = preparer or PagePreparer()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, image_path: str) -> str:
+        """Key identifying one version of a source image prepared with this cache's profile."""
+        stat = os.stat(image_path)
+        payload = (f"{PAGE_CACHE_VERSION}\0{self.preparer.profile.cache_key}\0{os.path.abspath(image_path)}"
+                   f"\0{stat.st_size}\0{stat.st_mtime_ns}")
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return f"{base}.json", f"{base}.bin"
+
+    def prepare(self, image_path: str) -> Dict:
+        """
+        Return the prepared page for an image, preparing and storing it on a miss.
+
+        Args:
+            image_path (str): Path to the image file
+
+        Returns:
+            Dict: Prepared page as returned by pdf_writer.prepare_image; encoded
+                images point at their cached data file instead of holding the data
+        """
+        meta_path, data_path = self._paths(self.make_key(image_path))
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                source = json.load(f)
+            if source.pop('cached_data', False):
+                source['path'] = data_path
+                source['spans'] = [(0, os.path.getsize(data_path))]
+            self.hits += 1
+            return source
+        except (OSError, ValueError):
+            pass
+
+        self.misses += 1
+        source = self.preparer.prepare(image_path)
+        try:
+            self._store(source, meta_path, data_path)
+        except (OSError, TypeError, ValueError) as e:
+            # The page itself is fine; it just is not cached
+            logger.warning(f"Could not cache prepared page {image_path}: {e}")
+        return source
+
+    def prepare_decoded(self, img: Image.Image) -> Dict:
+        """Prepare an already decoded image; these have no file to key them by, so are not cached."""
+        return self.preparer.prepare_decoded(img)
+
+    @staticmethod
+    def _store(source: Dict, meta_path: str, data_path: str) -> None:
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        suffix = f".{os.getpid()}.tmp"
+        meta = {key: value for key, value in source.items() if key != 'data'}
+        try:
+            if 'data' in source:
+                with open(data_path + suffix, 'wb') as f:
+                    f.write(source['data'])
+                os.replace(data_path + suffix, data_path)
+                meta['cached_data'] = True
+            # Metadata last, so an entry is only visible once its data is in place
+            with open(meta_path + suffix, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(meta_path + suffix, meta_path)
+        finally:
+            for temp_path in (data_path + suffix, meta_path + suffix):
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    def get_stats(self) -> Dict:
+        """Hit and miss counts for this process."""
+        return {'hits': self.hits, 'misses': self.misses}
@@ -3,7 +3,12 @@ PDF Aggregator
 
 This module provides functionality to combine multiple images into a single PDF document.
 It's designed for creating comprehensive PDFs from Ernest K Gann's 1933 logbook images
-with proper ordering and formatting.
+with proper ordering and formatting. Given the digitization output, the PDF is made
+searchable with an invisible OCR text layer and gets an outline of its documents.
+Chapter PDFs are built in parallel worker processes, and prepared pages are cached
+on disk so pages shared by the full PDF and a chapter are only prepared once.
+Output profiles trade size for fidelity: lossless archival pages, downsampled JPEG
+pages for the website, or bilevel pages.
 
 Author: Ernest K Gann Digital Archive Project
 Date: 2024
@@ -11,15 +16,117 @@ Date: 2024
 
 import os
 import re
-import img2pdf
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
-from typing import List, Optional, Dict
+from typing import List, Dict, Optional, Tuple
 import logging
 
+# Add the parent directory to the path to import other modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregation.pdf_writer import StreamingPDFWriter
+from aggregation.page_cache import PageCache
+from aggregation.pdf_profiles import DEFAULT_PDF_PROFILE, PDF_PROFILES, PagePreparer
+from aggregation.searchable import SearchableLayers, TEXT_SOURCES, load_documents, page_key
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Ways of splitting the logbook into chapter PDFs
+CHAPTER_GROUPINGS = ('filename', 'documents', 'dates')
+
+
+def build_pdf(output_file: str, image_paths: List[str], layers: Optional[SearchableLayers] = None,
+              page_cache_dir: Optional[str] = None, profile: str = DEFAULT_PDF_PROFILE) -> Dict:
+    """
+    Create a PDF from a list of image paths.
+    
+    A plain function so chapter PDFs can be built in worker processes.
+    
+    Args:
+        output_file (str): Path for the output PDF file
+        image_paths (List[str]): List of image file paths
+        layers (Optional[SearchableLayers]): Page text and bookmarks for a searchable PDF
+        page_cache_dir (Optional[str]): Directory of the shared prepared-page cache
+        profile (str): Output profile from PDF_PROFILES
+        
+    Returns:
+        Dict: PDF creation statistics
+    """
+    if not image_paths:    
+        logger.warning("No valid images found for PDF creation")
+        return {
+            'success': False,
+            'error': 'No valid images found',
+            'total_images': 0,
+            'processed_images': 0
+        }
+    
+    logger.info(f"Creating PDF from {len(image_paths)} images")
+    
+    processed_images = 0
+    methods = {'jpeg': 0, 'png': 0, 'converted': 0}
+    text_layers = {'words': 0, 'page': 0, '': 0}
+    bookmarks = 0
+    
+    preparer = PagePreparer(profile)
+    page_cache = PageCache(page_cache_dir, preparer) if page_cache_dir else None
+    image_bytes = 0
+    
+    try:
+        with StreamingPDFWriter(output_file, page_cache or preparer) as writer:
+            for image_path in image_paths:
+                try:
+                    if layers:
+                        page, bookmarked = layers.add_page(writer, image_path, image_path)
+                        bookmarks += bookmarked
+                    else:
+                        page = writer.add_image(image_path)
+                except Exception as e:
+                    logger.warning(f"Skipping invalid image {image_path}: {e}")
+                    continue
+                processed_images += 1
+                image_bytes += page.image_bytes
+                methods[page.method] += 1
+                text_layers[page.text_layer] += 1
+    
+            if not processed_images:
+                raise ValueError('No valid images could be prepared')
+    
+        file_size = os.path.getsize(output_file) if os.path.exists(output_file) else 0
+        logger.info(f"PDF created successfully: {output_file} ({profile} profile, {file_size} bytes, "
+                    f"{file_size // processed_images} bytes per page)")
+    
+        stats = {
+            'success': True,
+            'output_file': output_file,
+            'total_images': len(image_paths),
+            'processed_images': processed_images,
+            'passthrough_images': methods['jpeg'] + methods['png'],
+            'converted_images': methods['converted'],
+            'word_text_pages': text_layers['words'],
+            'page_text_pages': text_layers['page'],
+            'bookmarks': bookmarks,
+            'page_cache': page_cache.get_stats() if page_cache else None,
+            'profile': profile,
+            'image_bytes': image_bytes,
+            'bytes_per_page': file_size // processed_images,
+            'file_size': file_size
+        }
+    
+        return stats
+    
+    except Exception as e:
+        logger.error(f"Error creating PDF: {e}")
+        return {
+            'success': False,
+            'error': str(e),
+            'total_images': len(image_paths),
+            'processed_images': processed_images
+        }
+
 
 class PDFAggregator:
     """
@@ -29,16 +136,29 @@ class PDFAggregator:
     maintaining proper ordering and ensuring compatibility with OCR tools.
     """
     
-    def __init__(self, input_dir: str = "data/png", output_file: str = "output/EKG_1933_Logbook.pdf"):
+    def __init__(self, input_dir: str = "data/png", output_file: str = "output/EKG_1933_Logbook.pdf",
+                 layers: Optional[SearchableLayers] = None, page_cache_dir: Optional[str] = None,
+                 profile: str = DEFAULT_PDF_PROFILE):
         """
         Initialize the PDF aggregator.
         
         Args:
             input_dir (str): Directory containing images to combine
             output_file (str): Path for the output PDF file
+            layers (Optional[SearchableLayers]): Page text and bookmarks for a searchable PDF
+            page_cache_dir (Optional[str]): Directory of the prepared-page cache shared by the
+                full and chapter PDFs (no cache if None)
+            profile (str): Output profile from PDF_PROFILES: 'archival', 'web' or 'bilevel'
         """
+        if profile not in PDF_PROFILES:
+            raise ValueError(f"Unknown PDF profile: {profile} (choose from {', '.join(PDF_PROFILES)})")
         self.input_dir = input_dir
         self.output_file = output_file
+        self.layers = layers
+        self.page_cache_dir = page_cache_dir
+        self.profile = profile
+        # Validated image lists by extensions, so chapters do not re-validate every image
+        self._image_files: Dict[Tuple[str, ...], List[str]] = {}
         self._ensure_directories()
     
     def _ensure_directories(self) -> None:
@@ -81,38 +201,16 @@ class PDFAggregator:
             logger.error(f"Invalid image file {image_path}: {e}")
             return False
     
-    def prepare_image_for_pdf(self, image_path: str) -> Optional[str]:
-        """
-        Prepare an image for PDF conversion by ensuring proper format.
-        
-        Args:
-            image_path (str): Path to the image file
-            
-        Returns:
-            Optional[str]: Path to prepared image, or None if preparation failed
-        """
-        try:
-            with Image.open(image_path) as img:
-                # Convert to RGB if necessary
-                if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
-                    img = img.convert('RGB')
-                
-                # Create temporary file for converted image
-                temp_path = image_path.replace('.png', '_temp.png').replace('.jpg', '_temp.jpg')
-                img.save(temp_path, "PNG")
-                
-                return temp_path
-                
-        except Exception as e:
-            logger.error(f"Error preparing image {image_path}: {e}")
-            return None
-    
-    def get_image_files(self, extensions: List[str] = None) -> List[str]:
+    def get_image_files(self, extensions: List[str] = None, refresh: bool = False) -> List[str]:
         """
         Get list of image files from the input directory.
         
+        The directory is scanned and validated once per set of extensions;
+        later calls reuse the list unless refresh is True.
+        
         Args:
             extensions (List[str]): List of file extensions to include
+            refresh (bool): Rescan the input directory
             
         Returns:
             List[str]: List of image file paths
@@ -120,6 +218,10 @@ class PDFAggregator:
         if extensions is None:
             extensions = ['.png', '.jpg', '.jpeg', '.tiff', '.bmp']
         
+        cache_key = tuple(extensions)
+        if not refresh and cache_key in self._image_files:
+            return list(self._image_files[cache_key])
+        
         image_files = []
         for file in os.listdir(self.input_dir):
             if any(file.lower().endswith(ext) for ext in extensions):
@@ -129,95 +231,26 @@ class PDFAggregator:
         
         # Sort files numerically
         image_files = self.sort_files_numerically(image_files)
+        self._image_files[cache_key] = image_files
         
-        return image_files
+        return list(image_files)
     
     def create_pdf_from_images(self, image_paths: List[str], cleanup_temp: bool = True) -> Dict:
         """
         Create a PDF from a list of image paths.
         
+        Pages are streamed to the output one at a time. JPEG and compatible PNG
+        images are embedded as they are; other images are converted in memory.
+        With searchable layers, pages get their text layer and bookmarks.
+        
         Args:
             image_paths (List[str]): List of image file paths
-            cleanup_temp (bool): Whether to clean up temporary files
+            cleanup_temp (bool): Unused; no temporary files are created
             
         Returns:
             Dict: PDF creation statistics
         """
-        if not image_paths:
-            logger.warning("No valid images found for PDF creation")
-            return {
-                'success': False,
-                'error': 'No valid images found',
-                'total_images': 0,
-                'processed_images': 0
-            }
-        
-        logger.info(f"Creating PDF from {len(image_paths)} images")
-        
-        # Prepare images for PDF conversion
-        prepared_images = []
-        temp_files = []
-        
-        for image_path in image_paths:
-            prepared_path = self.prepare_image_for_pdf(image_path)
-            if prepared_path:
-                prepared_images.append(prepared_path)
-                if prepared_path != image_path:
-                    temp_files.append(prepared_path)
-            else:
-                logger.warning(f"Skipping invalid image: {image_path}")
-        
-        if not prepared_images:
-            logger.error("No valid images could be prepared for PDF creation")
-            return {
-                'success': False,
-                'error': 'No valid images could be prepared',
-                'total_images': len(image_paths),
-                'processed_images': 0
-            }
-        
-        # Create PDF
-        try:
-            with open(self.output_file, "wb") as f:
-                f.write(img2pdf.convert(prepared_images))
-            
-            logger.info(f"PDF created successfully: {self.output_file}")
-            
-            # Clean up temporary files
-            if cleanup_temp:
-                for temp_file in temp_files:
-                    try:
-                        os.remove(temp_file)
-                    except Exception as e:
-                        logger.warning(f"Could not remove temporary file {temp_file}: {e}")
-            
-            stats = {
-                'success': True,
-                'output_file': self.output_file,
-                'total_images': len(image_paths),
-                'processed_images': len(prepared_images),
-                'file_size': os.path.getsize(self.output_file) if os.path.exists(self.output_file) else 0
-            }
-            
-            return stats
-            
-        except Exception as e:
-            logger.error(f"Error creating PDF: {e}")
-            
-            # Clean up temporary files on error
-            if cleanup_temp:
-                for temp_file in temp_files:
-                    try:
-                        os.remove(temp_file)
-                    except Exception:
-                        pass
-            
-            return {
-                'success': False,
-                'error': str(e),
-                'total_images': len(image_paths),
-                'processed_images': len(prepared_images)
-            }
+        return build_pdf(self.output_file, image_paths, self.layers, self.page_cache_dir, self.profile)
     
     def batch_create_pdf(self, extensions: List[str] = None) -> Dict:
         """
@@ -272,67 +305,128 @@ class PDFAggregator:
             'processing_rate': 1.0 if pdf_exists and image_files else 0.0
         }
     
-    def create_chapter_pdfs(self, output_dir: str = "output") -> Dict:
+    def group_chapters(self, image_paths: List[str], chapter_by: str = 'filename',
+                       documents_file: Optional[str] = None) -> List[Dict]:
+        """
+        Split page images into chapters.
+        
+        Args:
+            image_paths (List[str]): Page images in order
+            chapter_by (str): 'filename' groups by the first number in each file name;
+                'documents' makes each DocumentCombiner document group a chapter, and
+                'dates' joins consecutive document groups with the same date
+            documents_file (Optional[str]): combined_logbook.json, required unless chapter_by is 'filename'
+            
+        Returns:
+            List[Dict]: Chapters in order, each with 'name', 'title' and 'images'
+        """
+        if chapter_by not in CHAPTER_GROUPINGS:
+            raise ValueError(f"Unknown chapter grouping: {chapter_by} (choose from {', '.join(CHAPTER_GROUPINGS)})")
+        
+        if chapter_by == 'filename':
+            # Group images by chapter (assuming naming convention)
+            chapters = {}
+            for image_path in image_paths:
+                filename = os.path.basename(image_path)
+                # Extract chapter number from filename
+                match = re.search(r'(\d+)', filename)
+                if match:
+                    chapters.setdefault(int(match.group(1)), []).append(image_path)
+            return [{'name': f"chapter_{chapter_num:03d}", 'title': f"Chapter {chapter_num}",
+                     'images': self.sort_files_numerically(images)}
+                    for chapter_num, images in chapters.items()]
+        
+        if not documents_file:
+            raise ValueError(f"Chapters by {chapter_by} need the combined logbook (documents_file)")
+        
+        images_by_page = {page_key(image_path): image_path for image_path in image_paths}
+        groups = []
+        for document in load_documents(documents_file):
+            images = [images_by_page[page] for page in document['pages'] if page in images_by_page]
+            if not images:
+                continue
+            if chapter_by == 'dates':
+                # Undated documents stay with the chapter before them
+                date = document['date'] or (groups[-1]['title'] if groups else 'Undated')
+                if groups and groups[-1]['title'] == date:
+                    groups[-1]['images'].extend(images)
+                    continue
+                groups.append({'title': date, 'images': images})
+            else:
+                groups.append({'title': document['title'], 'images': images})
+        
+        for index, group in enumerate(groups, 1):
+            # A page shared by consecutive documents is only included once
+            group['images'] = list(dict.fromkeys(group['images']))
+            group['name'] = f"chapter_{index:03d}"
+        return groups
+    
+    def create_chapter_pdfs(self, output_dir: str = "output", chapter_by: str = 'filename',
+                            documents_file: Optional[str] = None, workers: int = 1,
+                            extensions: List[str] = None) -> Dict:
         """
         Create individual PDFs for each chapter/section.
         
         Args:
             output_dir (str): Directory to save chapter PDFs
+            chapter_by (str): How pages are grouped into chapters, see group_chapters()
+            documents_file (Optional[str]): combined_logbook.json for grouping by documents or dates
+            workers (int): Worker processes building chapters; 1 builds them in this process
+            extensions (List[str]): Image extensions to include, as for batch_create_pdf()
             
         Returns:
             Dict: Chapter PDF creation statistics
         """
         # Get all image files
-        all_images = self.get_image_files()
+        all_images = self.get_image_files(extensions)
         
         if not all_images:
             logger.warning("No images found for chapter PDF creation")
-            return {'chapters_created': 0, 'error': 'No images found'}
+            return {'chapters_created': 0, 'total_chapters': 0, 'output_directory': output_dir,
+                    'error': 'No images found'}
         
-        # Group images by chapter (assuming naming convention)
-        chapters = {}
-        for image_path in all_images:
-            filename = os.path.basename(image_path)
-            # Extract chapter number from filename
-            match = re.search(r'(\d+)', filename)
-            if match:
-                chapter_num = int(match.group(1))
-                if chapter_num not in chapters:
-                    chapters[chapter_num] = []
-                chapters[chapter_num].append(image_path)
+        try:
+            chapters = self.group_chapters(all_images, chapter_by, documents_file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not group chapters: {e}")
+            return {'chapters_created': 0, 'total_chapters': 0, 'output_directory': output_dir,
+                    'error': str(e)}
         
         # Create PDF for each chapter
         os.makedirs(output_dir, exist_ok=True)
-        chapters_created = 0
+        jobs = [(os.path.join(output_dir, f"{chapter['name']}.pdf"), chapter['images'], self.layers,
+                 self.page_cache_dir, self.profile) for chapter in chapters]
         
-        for chapter_num, chapter_images in chapters.items():
-            # Sort images within chapter
-            chapter_images = self.sort_files_numerically(chapter_images)
-            
-            # Create chapter PDF
-            chapter_pdf = os.path.join(output_dir, f"chapter_{chapter_num:03d}.pdf")
-            
-            # Create temporary aggregator for this chapter
-            temp_aggregator = PDFAggregator(
-                input_dir="",  # Not used for this operation
-                output_file=chapter_pdf
-            )
-            
-            stats = temp_aggregator.create_pdf_from_images(chapter_images)
-            
+        if workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+                results = list(executor.map(build_pdf, *zip(*jobs)))
+        else:
+            results = [build_pdf(*job) for job in jobs]
+        
+        chapters_created = 0
+        cache_hits = 0
+        total_size = 0
+        for chapter, (chapter_pdf, *_), stats in zip(chapters, jobs, results):
+            chapter['file_size'] = stats.get('file_size', 0)
             if stats['success']:
                 chapters_created += 1
-                logger.info(f"Created chapter PDF: {chapter_pdf}")
+                cache_hits += (stats['page_cache'] or {}).get('hits', 0)
+                total_size += stats['file_size']
+                logger.info(f"Created chapter PDF: {chapter_pdf} ({chapter['title']})")
             else:
                 logger.error(f"Failed to create chapter PDF {chapter_pdf}: {stats.get('error', 'Unknown error')}")
         
         return {
             'chapters_created': chapters_created,
             'total_chapters': len(chapters),
-            'output_directory': output_dir
+            'output_directory': output_dir,
+            'page_cache_hits': cache_hits,
+            'total_size': total_size,
+            'chapters': [{'file': job[0], 'title': chapter['title'], 'pages': len(chapter['images']),
+                          'file_size': chapter['file_size']}
+                         for chapter, job in zip(chapters, jobs)]
         }
 
-
 def main():
     """Main function to run the PDF aggregator."""
     import argparse
@@ -342,12 +436,32 @@ def main():
     parser.add_argument("--output-file", default="output/EKG_1933_Logbook.pdf", help="Output PDF file")
     parser.add_argument("--extensions", nargs="+", default=[".png", ".jpg", ".jpeg"], help="Image extensions to include")
     parser.add_argument("--create-chapters", action="store_true", help="Create individual chapter PDFs")
+    parser.add_argument("--chapter-by", choices=CHAPTER_GROUPINGS, default="filename",
+                        help="Group chapters by file name numbers, or by the document groups or dates in --outline")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes building chapter PDFs")
+    parser.add_argument("--page-cache", help="Prepared-page cache directory (default: .cache/pdf_pages next to the output)")
+    parser.add_argument("--no-page-cache", action="store_true", help="Prepare every page afresh")
+    parser.add_argument("--logbook", help="complete_logbook.json whose page text makes the PDF searchable")
+    parser.add_argument("--word-boxes", help="Tesseract word boxes saved by the digitizer, to position the text by word")
+    parser.add_argument("--outline", help="combined_logbook.json whose document groups become bookmarks")
+    parser.add_argument("--text-source", choices=TEXT_SOURCES, default="content",
+                        help="Entry text used where there are no word boxes: cleaned content or raw OCR text")
+    parser.add_argument("--profile", choices=list(PDF_PROFILES), default=DEFAULT_PDF_PROFILE,
+                        help="Page encoding: lossless 'archival' pages, 150 dpi JPEG 'web' pages small enough "
+                             "to serve from the website, or 300 dpi black and white 'bilevel' pages")
     parser.add_argument("--test", action="store_true", help="Run in test mode")
     
     args = parser.parse_args()
     
-    # Initialize aggregator
-    aggregator = PDFAggregator(args.input_dir, args.output_file)
+    # Initialize aggregator, with a text layer and outline if any digitization output is given
+    layers = None
+    if args.logbook or args.word_boxes or args.outline:
+        layers = SearchableLayers(args.logbook, args.word_boxes, args.outline, args.text_source)
+    page_cache_dir = None
+    if not args.no_page_cache:
+        page_cache_dir = args.page_cache or os.path.join(os.path.dirname(args.output_file) or '.', '.cache', 'pdf_pages')
+    aggregator = PDFAggregator(args.input_dir, args.output_file, layers, page_cache_dir, args.profile)
     
     if args.test:
         # Test mode - just show stats
@@ -367,16 +481,29 @@ def main():
             print(f"  Output file: {stats['output_file']}")
             print(f"  Total images: {stats['total_images']}")
             print(f"  Processed images: {stats['processed_images']}")
-            print(f"  File size: {stats['file_size']} bytes")
+            print(f"  Passed through: {stats['passthrough_images']}, converted: {stats['converted_images']}")
+            if layers:
+                print(f"  Text layer: {stats['word_text_pages']} pages by word, "
+                      f"{stats['page_text_pages']} by page; {stats['bookmarks']} bookmarks")
+            print(f"  Profile: {stats['profile']}")
+            print(f"  File size: {stats['file_size']} bytes ({stats['bytes_per_page']} bytes per page)")
         else:
             print(f"PDF creation failed: {stats.get('error', 'Unknown error')}")
         
         if args.create_chapters:
-            chapter_stats = aggregator.create_chapter_pdfs()
+            chapter_stats = aggregator.create_chapter_pdfs(
+                os.path.dirname(args.output_file) or '.', args.chapter_by, args.outline, args.workers,
+                args.extensions)
             print(f"Chapter PDFs:")
             print(f"  Chapters created: {chapter_stats['chapters_created']}")
             print(f"  Total chapters: {chapter_stats['total_chapters']}")
             print(f"  Output directory: {chapter_stats['output_directory']}")
+            if chapter_stats.get('error'):
+                print(f"  Error: {chapter_stats['error']}")
+            else:
+                print(f"  Total size: {chapter_stats['total_size']} bytes")
+                if page_cache_dir:
+                    print(f"  Pages reused from the page cache: {chapter_stats['page_cache_hits']}")
 
 
 if __name__ == "__main__":
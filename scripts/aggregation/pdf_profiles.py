@@ -0,0 +1,171 @@
+"""
+PDF Output Profiles
+
+This module defines the size tiers of the logbook PDF. The archival profile
+embeds every page losslessly at full resolution. The web profile resamples
+pages to a target resolution and stores them as JPEG, small enough to serve
+from the website next to complete_logbook.json. The bilevel profile binarizes
+each page with Otsu's threshold and stores it as 1-bit CCITT Group 4 data, the
+smallest form for pages that are mostly handwriting and print.
+
+Pages are sized from the target resolution: the longest side of a page
+becomes max_inches long, which also gives every page of the document the
+same size. Pages already smaller than that at the target resolution are kept
+as they are and given a lower resolution instead.
+
+Author: Ernest K Gann Digital Archive Project
+Date: 2024
+"""
+
+import io
+import os
+import sys
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple, Union
+
+from PIL import Image, ImageOps, features
+
+# Add the parent directory to the path to import other modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregation.pdf_writer import PDF_COLOR_SPACES, prepare_decoded_image, prepare_image
+from ocr.image_utils import otsu_threshold
+
+# TIFF tags used to pull the Group 4 data out of a single-strip TIFF
+TIFF_STRIP_OFFSETS = 273
+TIFF_STRIP_BYTE_COUNTS = 279
+
+
+@dataclass(frozen=True)
+class PDFProfile:
+    """How pages are encoded for one size tier"""
+    name: str
+    encoding: str                  # 'lossless', 'jpeg' or 'bilevel'
+    dpi: Optional[int] = None      # Target resolution; None keeps every source pixel
+    max_inches: float = 11.0       # Longest page side when resampling to dpi
+    jpeg_quality: int = 70
+
+    @property
+    def cache_key(self) -> str:
+        """Identifies everything that affects the prepared pages, e.g. for the page cache."""
+        return f"{self.name} {self.encoding} dpi={self.dpi} max={self.max_inches} q={self.jpeg_quality}"
+
+
+PDF_PROFILES: Dict[str, PDFProfile] = {
+    # Every page as it is, lossless (the default)
+    'archival': PDFProfile('archival', 'lossless'),
+    # Color JPEG at 150 dpi, for downloading from the website
+    'web': PDFProfile('web', 'jpeg', dpi=150),
+    # Black and white at 300 dpi with CCITT Group 4, for reading the text
+    'bilevel': PDFProfile('bilevel', 'bilevel', dpi=300)
+}
+DEFAULT_PDF_PROFILE = 'archival'
+
+
+def get_pdf_profile(profile: Union[str, PDFProfile]) -> PDFProfile:
+    """Look up a profile by name (profiles may also be passed directly)."""
+    if isinstance(profile, PDFProfile):
+        return profile
+    if profile not in PDF_PROFILES:
+        raise ValueError(f"Unknown PDF profile: {profile} (choose from {', '.join(PDF_PROFILES)})")
+    return PDF_PROFILES[profile]
+
+
+def _resample(img: Image.Image, profile: PDFProfile) -> Tuple[Image.Image, Tuple[float, float]]:
+    """
+    Scale an image down so its longest side is at most max_inches at the profile's dpi.
+
+    Returns:
+        Tuple[Image.Image, Tuple[float, float]]: The image and the dpi that makes its
+            longest side max_inches long
+    """
+    max_side = int(profile.dpi * profile.max_inches)
+    scale = max_side / max(img.size)
+    if scale >= 1:
+        # Too small to scale down; a lower dpi still gives the page its full size
+        dpi = max(img.size) / profile.max_inches
+        return img, (dpi, dpi)
+    resized = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.LANCZOS)
+    return resized, (profile.dpi, profile.dpi)
+
+
+def _group4(bilevel: Image.Image) -> Optional[bytes]:
+    """Encode a 1-bit image as raw CCITT Group 4 data, or None without libtiff."""
+    if not features.check('libtiff'):
+        return None
+    buffer = io.BytesIO()
+    # One strip, so the TIFF holds a single continuous Group 4 stream
+    bilevel.save(buffer, 'TIFF', compression='group4', strip_size=2 ** 31 - 1)
+    buffer.seek(0)
+    with Image.open(buffer) as tiff:
+        offsets = tiff.tag_v2.get(TIFF_STRIP_OFFSETS)
+        counts = tiff.tag_v2.get(TIFF_STRIP_BYTE_COUNTS)
+    if not offsets or len(offsets) != 1:
+        return None
+    return buffer.getvalue()[offsets[0]:offsets[0] + counts[0]]
+
+
+def prepare_decoded_for_profile(original: Image.Image, profile: PDFProfile) -> Dict:
+    """Encode a decoded image for the jpeg or bilevel encoding of a profile."""
+    img = ImageOps.exif_transpose(original)
+
+    if profile.encoding == 'jpeg':
+        if img.mode not in ('L', 'RGB'):
+            img = img.convert('L' if img.mode in ('1', 'LA', 'I', 'I;16', 'F') else 'RGB')
+        img, dpi = _resample(img, profile)
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=profile.jpeg_quality, optimize=True)
+        entries = f"/ColorSpace {PDF_COLOR_SPACES[img.mode]} /BitsPerComponent 8 /Filter /DCTDecode"
+        return {'method': 'converted', 'entries': entries, 'size': img.size, 'dpi': dpi, 'rotate': 0,
+                'data': buffer.getvalue()}
+
+    gray, dpi = _resample(img.convert('L'), profile)
+    threshold = otsu_threshold(gray)
+    bilevel = gray.point(lambda value: 255 if value > threshold else 0).convert('1', dither=Image.NONE)
+    data = _group4(bilevel)
+    if data is not None:
+        # libtiff codes 0 bits (black here) as white runs; BlackIs1 decodes those back to 0 bits
+        entries = (f"/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /CCITTFaxDecode "
+                   f"/DecodeParms << /K -1 /Columns {bilevel.width} /Rows {bilevel.height} /BlackIs1 true >>")
+    else:
+        data = zlib.compress(bilevel.tobytes(), 9)
+        entries = "/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /FlateDecode"
+    return {'method': 'converted', 'entries': entries, 'size': bilevel.size, 'dpi': dpi, 'rotate': 0,
+            'data': data}
+
+
+class PagePreparer:
+    """
+    Prepares pages for StreamingPDFWriter with a profile's encoding.
+    """
+
+    def __init__(self, profile: Union[str, PDFProfile] = DEFAULT_PDF_PROFILE):
+        """
+        Initialize the preparer.
+
+        Args:
+            profile: Profile name from PDF_PROFILES, or a PDFProfile
+        """
+        self.profile = get_pdf_profile(profile)
+
+    def prepare(self, image_path: str) -> Dict:
+        """
+        Prepare an image file.
+
+        Args:
+            image_path (str): Path to the image file
+
+        Returns:
+            Dict: Prepared page in the form returned by pdf_writer.prepare_image
+        """
+        if self.profile.encoding == 'lossless':
+            return prepare_image(image_path)
+        with Image.open(image_path) as img:
+            return prepare_decoded_for_profile(img, self.profile)
+
+    def prepare_decoded(self, img: Image.Image) -> Dict:
+        """Prepare an already decoded image."""
+        if self.profile.encoding == 'lossless':
+            return prepare_decoded_image(img)
+        return prepare_decoded_for_profile(img, self.profile)
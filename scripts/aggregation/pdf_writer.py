@@ -0,0 +1,468 @@
+"""
+Streaming PDF Writer
+
+This module writes image PDFs one page at a time, for assembling Ernest K
+Gann's 1933 logbook scans into a single document. Each page is written to the
+output file as soon as it is added, so memory use stays at about one page
+however many pages the document has.
+
+Images that PDF can hold as they are go into the file untouched, copied in
+chunks straight from the source: JPEG files as DCT streams, and non-interlaced
+PNG files without transparency as their original deflate data with PNG
+predictors. Any other image is converted in memory and stored losslessly. No
+temporary image files are created.
+
+Pages can carry an invisible text layer (PDF text render mode 3) so the
+document is searchable, either word by word over OCR bounding boxes or as
+plain lines of page text, and the document can have an outline of bookmarks.
+
+Author: Ernest K Gann Digital Archive Project
+Date: 2024
+"""
+
+import os
+import zlib
+import struct
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Resolution assumed for images without DPI information (the img2pdf default)
+DEFAULT_DPI = 96.0
+COPY_CHUNK_SIZE = 1024 * 1024
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# PNG color type -> (PDF color components, allowed bit depths) for passthrough
+PNG_PASSTHROUGH = {
+    0: (1, (1, 2, 4, 8)),   # Grayscale
+    2: (3, (8,)),           # RGB
+    3: (1, (1, 2, 4, 8))    # Palette
+}
+PDF_COLOR_SPACES = {'1': '/DeviceGray', 'L': '/DeviceGray', 'RGB': '/DeviceRGB', 'CMYK': '/DeviceCMYK'}
+# EXIF orientation -> page /Rotate for orientations that are pure rotations
+EXIF_ROTATION = {1: 0, 3: 180, 6: 90, 8: 270}
+
+# The text layer uses Courier, whose glyphs are all 0.6 em wide, so a word can be
+# stretched to its box exactly without embedding font metrics
+TEXT_FONT = '/Courier'
+TEXT_GLYPH_WIDTH = 0.6
+# Page-level text is laid out as at least this many lines within these margins
+TEXT_MIN_LINES = 40
+TEXT_MARGIN = 0.05
+
+
+@dataclass
+class PageInfo:
+    """Placement of a page written by StreamingPDFWriter"""
+    number: int            # 1-based page number
+    width: float           # Page size in points, before /Rotate
+    height: float
+    pixel_width: int
+    pixel_height: int
+    rotate: int
+    method: str            # 'jpeg', 'png' (passed through) or 'converted'
+    image_bytes: int       # Size of the embedded image stream
+    text_layer: str = ''   # 'words', 'page' or '' for none
+
+
+@dataclass
+class TextLayer:
+    """Invisible text placed over a page image for searching and copying"""
+    text: str = ''                 # Page text, used when there are no word boxes
+    words: List[Tuple[str, float, float, float, float]] = field(default_factory=list)  # (word, left, top, right, bottom)
+    size: Tuple[float, float] = (0, 0)   # Width and height of the space the boxes are measured in
+
+
+def _text_literal(text: str) -> bytes:
+    """Encode text as a WinAnsi string literal for a content stream."""
+    data = text.encode('cp1252', errors='replace')
+    for char, escaped in ((b'\\', b'\\\\'), (b'(', b'\\('), (b')', b'\\)'), (b'\r', b'\\r'), (b'\n', b'\\n')):
+        data = data.replace(char, escaped)
+    return b'(' + data + b')'
+
+
+def _pdf_string(text: str) -> bytes:
+    """Encode text as a PDF string literal, using UTF-16 when it is not plain ASCII."""
+    if all(32 <= ord(char) < 127 for char in text):
+        escaped = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+        return f"({escaped})".encode('ascii')
+    return b'<FEFF' + text.encode('utf-16-be').hex().upper().encode('ascii') + b'>'
+
+
+def _page_size(pixels: Tuple[int, int], dpi) -> Tuple[float, float]:
+    """Page size in points for an image of the given size and resolution."""
+    try:
+        dpi_x, dpi_y = (float(value) for value in dpi)
+    except (TypeError, ValueError):
+        dpi_x = dpi_y = DEFAULT_DPI
+    dpi_x = dpi_x if dpi_x > 1 else DEFAULT_DPI
+    dpi_y = dpi_y if dpi_y > 1 else DEFAULT_DPI
+    return pixels[0] * 72.0 / dpi_x, pixels[1] * 72.0 / dpi_y
+
+
+def _plain_dpi(dpi) -> Optional[Tuple[float, float]]:
+    """Resolution as plain floats; Pillow reports TIFF and EXIF resolutions as IFDRational."""
+    try:
+        dpi_x, dpi_y = (float(value) for value in dpi)
+    except (TypeError, ValueError):
+        return None
+    return dpi_x, dpi_y
+
+
+def _png_layout(path: str) -> Optional[Dict]:
+    """
+    Read the header chunks of a PNG file and locate its image data.
+
+    Returns:
+        Optional[Dict]: Size, color type, bit depth, palette, resolution and
+            (offset, length) of every IDAT chunk, or None if it is not a PNG
+    """
+    with open(path, 'rb') as f:
+        if f.read(8) != PNG_SIGNATURE:
+            return None
+        layout = {'idat': [], 'palette': None, 'transparency': False}
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            length, chunk_type = struct.unpack('>I4s', header)
+            if chunk_type == b'IDAT':
+                layout['idat'].append((f.tell(), length))
+                f.seek(length + 4, os.SEEK_CUR)
+                continue
+            if chunk_type == b'IEND':
+                return layout
+
+            data = f.read(length)
+            f.seek(4, os.SEEK_CUR)  # CRC
+            if chunk_type == b'IHDR':
+                (layout['width'], layout['height'], layout['bit_depth'], layout['color_type'],
+                 _, _, layout['interlace']) = struct.unpack('>IIBBBBB', data)
+            elif chunk_type == b'PLTE':
+                layout['palette'] = data
+            elif chunk_type == b'tRNS':
+                layout['transparency'] = True
+
+
+def prepare_image(image_path: str) -> Dict:
+    """
+    Decide how to embed an image, reading no more of it than needed.
+
+    Args:
+        image_path (str): Path to the image file
+
+    Returns:
+        Dict: Image dictionary entries, pixel size, dpi, rotation and either
+            the file and spans to copy or converted stream data
+    """
+    with Image.open(image_path) as img:
+        image_format = img.format
+        mode = img.mode
+        size = img.size
+        dpi = _plain_dpi(img.info.get('dpi'))
+        orientation = img.getexif().get(0x0112, 1) if image_format in ('JPEG', 'PNG') else 1
+        adobe = 'adobe' in img.info
+
+    rotate = EXIF_ROTATION.get(orientation)
+    if rotate is not None:
+        if image_format == 'JPEG' and mode in PDF_COLOR_SPACES and mode != '1':
+            entries = f"/ColorSpace {PDF_COLOR_SPACES[mode]} /BitsPerComponent 8 /Filter /DCTDecode"
+            if mode == 'CMYK' and adobe:
+                # Adobe CMYK JPEGs store inverted values
+                entries += " /Decode [1 0 1 0 1 0 1 0]"
+            return {'method': 'jpeg', 'entries': entries, 'size': size, 'dpi': dpi, 'rotate': rotate,
+                    'path': image_path, 'spans': [(0, os.path.getsize(image_path))]}
+
+        if image_format == 'PNG':
+            layout = _png_layout(image_path)
+            passthrough = PNG_PASSTHROUGH.get(layout['color_type']) if layout else None
+            if (passthrough and layout['bit_depth'] in passthrough[1] and not layout['interlace']
+                    and not layout['transparency'] and layout['idat']
+                    and (layout['color_type'] != 3 or layout['palette'])):
+                colors, _ = passthrough
+                if layout['color_type'] == 3:
+                    entries_count = len(layout['palette']) // 3
+                    color_space = (f"[/Indexed /DeviceRGB {entries_count - 1} "
+                                   f"<{layout['palette'][:entries_count * 3].hex()}>]")
+                else:
+                    color_space = '/DeviceGray' if colors == 1 else '/DeviceRGB'
+                entries = (f"/ColorSpace {color_space} /BitsPerComponent {layout['bit_depth']} "
+                           f"/Filter /FlateDecode /DecodeParms << /Predictor 15 /Colors {colors} "
+                           f"/BitsPerComponent {layout['bit_depth']} /Columns {layout['width']} >>")
+                return {'method': 'png', 'entries': entries, 'size': size,
+                        'dpi': dpi, 'rotate': rotate, 'path': image_path, 'spans': layout['idat']}
+
+    with Image.open(image_path) as img:
+        return prepare_decoded_image(img)
+
+
+def prepare_decoded_image(original: Image.Image) -> Dict:
+    """Store a decoded image losslessly as a deflated raw bitmap."""
+    dpi = _plain_dpi(original.info.get('dpi'))
+    img = ImageOps.exif_transpose(original)
+    if img.mode in ('RGBA', 'LA', 'P', 'PA') or img.mode not in PDF_COLOR_SPACES:
+        img = img.convert('L' if img.mode in ('LA', 'I', 'I;16', 'F') else 'RGB')
+    mode = img.mode
+    size = img.size
+    data = zlib.compress(img.tobytes(), 6)
+
+    bits = 1 if mode == '1' else 8
+    entries = f"/ColorSpace {PDF_COLOR_SPACES[mode]} /BitsPerComponent {bits} /Filter /FlateDecode"
+    return {'method': 'converted', 'entries': entries, 'size': size, 'dpi': dpi, 'rotate': 0, 'data': data}
+
+
+class StreamingPDFWriter:
+    """
+    Writes a PDF incrementally, one image page at a time.
+
+    Use as a context manager, or call close() to finish the document. The
+    output only replaces output_path once it is complete; if the writer is
+    abandoned because of an exception the partial file is removed.
+    """
+
+    def __init__(self, output_path: str, preparer=None):
+        """
+        Start a new PDF.
+
+        Args:
+            output_path (str): Path of the PDF to create
+            preparer: Prepares page images, e.g. a pdf_profiles.PagePreparer for another
+                output profile or a page_cache.PageCache; by default pages are embedded
+                losslessly by prepare_image()
+        """
+        self.output_path = output_path
+        self.preparer = preparer
+        self._temp_path = f"{output_path}.tmp"
+        self._file = open(self._temp_path, 'wb', buffering=COPY_CHUNK_SIZE)
+        self._offsets: Dict[int, int] = {}
+        self._next_id = 1
+        self._catalog_id = self._new_id()
+        self._pages_id = self._new_id()
+        self.pages: List[PageInfo] = []
+        self._page_ids: List[int] = []
+        self._bookmarks: List[Tuple[str, int]] = []
+        self._font_id: Optional[int] = None
+
+        self._file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self) -> 'StreamingPDFWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _new_id(self) -> int:
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+
+    def _begin(self, object_id: int) -> None:
+        self._offsets[object_id] = self._file.tell()
+        self._file.write(f"{object_id} 0 obj\n".encode('ascii'))
+
+    def _write_object(self, object_id: int, body: bytes) -> None:
+        self._begin(object_id)
+        self._file.write(body)
+        self._file.write(b'\nendobj\n')
+
+    def _write_stream(self, object_id: int, dictionary: bytes, data: bytes) -> None:
+        self._begin(object_id)
+        self._file.write(b'<< ' + dictionary + f" /Length {len(data)} >>\nstream\n".encode('ascii'))
+        self._file.write(data)
+        self._file.write(b'\nendstream\nendobj\n')
+
+    def _write_stream_from_file(self, object_id: int, dictionary: bytes, path: str,
+                                spans: List[Tuple[int, int]]) -> int:
+        """Write a stream whose data is copied in chunks from spans (offset, length) of a file."""
+        length = sum(span_length for _, span_length in spans)
+        self._begin(object_id)
+        self._file.write(b'<< ' + dictionary + f" /Length {length} >>\nstream\n".encode('ascii'))
+        with open(path, 'rb') as source:
+            for offset, span_length in spans:
+                source.seek(offset)
+                remaining = span_length
+                while remaining:
+                    chunk = source.read(min(COPY_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise IOError(f"Unexpected end of file in {path}")
+                    self._file.write(chunk)
+                    remaining -= len(chunk)
+        self._file.write(b'\nendstream\nendobj\n')
+        return length
+
+    def add_image(self, image: Union[str, Image.Image, Dict], text_layer: Optional[TextLayer] = None) -> PageInfo:
+        """
+        Append one image as a page sized to the image's resolution.
+
+        Args:
+            image: Path to the image file, an already decoded image (always converted),
+                or a page already prepared, e.g. in a worker process, by prepare_image
+            text_layer (Optional[TextLayer]): Invisible text to put over the image
+
+        Returns:
+            PageInfo: Where and how the page was written
+        """
+        # Everything that can fail on a bad image happens before anything is written
+        if isinstance(image, dict):
+            source = image
+        elif isinstance(image, str):
+            source = self.preparer.prepare(image) if self.preparer else prepare_image(image)
+        else:
+            source = self.preparer.prepare_decoded(image) if self.preparer else prepare_decoded_image(image)
+        width, height = _page_size(source['size'], source['dpi'])
+
+        image_id = self._new_id()
+        dictionary = (f"/Type /XObject /Subtype /Image /Width {source['size'][0]} "
+                      f"/Height {source['size'][1]} {source['entries']}").encode('ascii')
+        if 'data' in source:
+            self._write_stream(image_id, dictionary, source['data'])
+            image_bytes = len(source['data'])
+        else:
+            image_bytes = self._write_stream_from_file(image_id, dictionary, source['path'], source['spans'])
+
+        page = PageInfo(
+            number=len(self.pages) + 1,
+            width=width,
+            height=height,
+            pixel_width=source['size'][0],
+            pixel_height=source['size'][1],
+            rotate=source['rotate'],
+            method=source['method'],
+            image_bytes=image_bytes
+        )
+        self._write_page(page, image_id, text_layer)
+        return page
+
+    def add_bookmark(self, title: str, page_number: int) -> None:
+        """
+        Add an outline entry; entries appear in the order they are added.
+
+        Args:
+            title (str): Bookmark title
+            page_number (int): 1-based page the bookmark opens, possibly one not added yet
+        """
+        self._bookmarks.append((title, page_number))
+
+    def _text_commands(self, page: PageInfo, text_layer: TextLayer) -> bytes:
+        """Content stream commands drawing a text layer invisibly, or b'' if it is empty."""
+        box_width, box_height = text_layer.size
+        # Word boxes measured on a rotated copy of the page cannot be placed; fall back to page text
+        use_words = (text_layer.words and box_width > 0 and box_height > 0 and
+                     abs((box_width / box_height) / (page.width / page.height) - 1) < 0.15)
+
+        commands = []
+        if use_words:
+            scale_x = page.width / box_width
+            scale_y = page.height / box_height
+            for word, left, top, right, bottom in text_layer.words:
+                size = (bottom - top) * scale_y
+                if size <= 0 or right <= left:
+                    continue
+                stretch = 100 * (right - left) * scale_x / (TEXT_GLYPH_WIDTH * size * len(word))
+                commands.append(f"/F0 {size:.2f} Tf {stretch:.2f} Tz 1 0 0 1 {left * scale_x:.2f} "
+                                f"{page.height - bottom * scale_y:.2f} Tm ".encode('ascii')
+                                + _text_literal(word) + b' Tj')
+            page.text_layer = 'words'
+        else:
+            lines = [line.strip() for line in text_layer.text.splitlines() if line.strip()]
+            leading = page.height * (1 - 2 * TEXT_MARGIN) / max(len(lines), TEXT_MIN_LINES)
+            size = leading * 0.8
+            line_width = page.width * (1 - 2 * TEXT_MARGIN)
+            for index, line in enumerate(lines):
+                stretch = min(100.0, 100 * line_width / (TEXT_GLYPH_WIDTH * size * len(line)))
+                commands.append(f"/F0 {size:.2f} Tf {stretch:.2f} Tz 1 0 0 1 {page.width * TEXT_MARGIN:.2f} "
+                                f"{page.height * (1 - TEXT_MARGIN) - (index + 1) * leading:.2f} Tm ".encode('ascii')
+                                + _text_literal(line) + b' Tj')
+            page.text_layer = 'page' if lines else ''
+
+        if not commands:
+            return b''
+        return b'\nBT 3 Tr\n' + b'\n'.join(commands) + b'\nET'
+
+    def _write_page(self, page: PageInfo, image_id: int, text_layer: Optional[TextLayer]) -> None:
+        content = f"q {page.width:.4f} 0 0 {page.height:.4f} 0 0 cm /Im0 Do Q".encode('ascii')
+        text = self._text_commands(page, text_layer) if text_layer else b''
+        fonts = ''
+        if text:
+            content += text
+            if self._font_id is None:
+                self._font_id = self._new_id()
+                self._write_object(self._font_id, f"<< /Type /Font /Subtype /Type1 /BaseFont {TEXT_FONT} "
+                                                  f"/Encoding /WinAnsiEncoding >>".encode('ascii'))
+            fonts = f" /Font << /F0 {self._font_id} 0 R >>"
+
+        content_id = self._new_id()
+        self._write_stream(content_id, b'', content)
+
+        page_id = self._new_id()
+        rotate = f" /Rotate {page.rotate}" if page.rotate else ""
+        self._write_object(page_id, (
+            f"<< /Type /Page /Parent {self._pages_id} 0 R /MediaBox [0 0 {page.width:.4f} {page.height:.4f}]"
+            f"{rotate} /Resources << /XObject << /Im0 {image_id} 0 R >>{fonts} >> /Contents {content_id} 0 R >>"
+        ).encode('ascii'))
+
+        self.pages.append(page)
+        self._page_ids.append(page_id)
+
+    def _write_outline(self) -> Optional[int]:
+        """Write the bookmarks that point at existing pages; returns the outline root id."""
+        bookmarks = [(title, number) for title, number in self._bookmarks if 1 <= number <= len(self._page_ids)]
+        if not bookmarks:
+            return None
+
+        outline_id = self._new_id()
+        item_ids = [self._new_id() for _ in bookmarks]
+        for index, (title, number) in enumerate(bookmarks):
+            links = f" /Prev {item_ids[index - 1]} 0 R" if index else ""
+            if index + 1 < len(item_ids):
+                links += f" /Next {item_ids[index + 1]} 0 R"
+            self._write_object(item_ids[index], b'<< /Title ' + _pdf_string(title) + (
+                f" /Parent {outline_id} 0 R{links} /Dest [{self._page_ids[number - 1]} 0 R /Fit] >>"
+            ).encode('ascii'))
+        self._write_object(outline_id, (f"<< /Type /Outlines /First {item_ids[0]} 0 R /Last {item_ids[-1]} 0 R "
+                                        f"/Count {len(item_ids)} >>").encode('ascii'))
+        return outline_id
+
+    def close(self) -> None:
+        """Write the page tree, outline, catalog and cross-reference table, and move the PDF into place."""
+        if self._file is None:
+            return
+
+        kids = ' '.join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object(self._pages_id,
+                           f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>".encode('ascii'))
+        outline_id = self._write_outline()
+        outlines = f" /Outlines {outline_id} 0 R /PageMode /UseOutlines" if outline_id else ""
+        self._write_object(self._catalog_id,
+                           f"<< /Type /Catalog /Pages {self._pages_id} 0 R{outlines} >>".encode('ascii'))
+
+        xref_offset = self._file.tell()
+        size = self._next_id
+        self._file.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode('ascii'))
+        for object_id in range(1, size):
+            self._file.write(f"{self._offsets[object_id]:010d} 00000 n \n".encode('ascii'))
+        self._file.write(f"trailer\n<< /Size {size} /Root {self._catalog_id} 0 R >>\n"
+                         f"startxref\n{xref_offset}\n%%EOF\n".encode('ascii'))
+
+        self._file.close()
+        self._file = None
+        os.replace(self._temp_path, self.output_path)
+
+    def abort(self) -> None:
+        """Discard the partial PDF."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            try:
+                os.remove(self._temp_path)
+            except OSError:
+                pass
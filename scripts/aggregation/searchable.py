@@ -0,0 +1,144 @@
+"""
+Searchable PDF Layers
+
+This module gathers what a searchable logbook PDF needs on top of the page
+images: the text of each page from the digitization pipeline's
+complete_logbook.json, Tesseract word boxes where they were saved, and outline
+bookmarks from the document groups built by DocumentCombiner
+(combined_logbook.json). Pages are matched to logbook entries by file name
+without extension, so PNG, JPEG and HEIC scans of a page all find its text.
+
+Author: Ernest K Gann Digital Archive Project
+Date: 2024
+"""
+
+import os
+import sys
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+# Add the parent directory to the path to import other modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregation.pdf_writer import PageInfo, StreamingPDFWriter, TextLayer
+from ocr.word_boxes import read_word_boxes, word_boxes_path
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Entry fields that can provide the page-level text
+TEXT_SOURCES = ('content', 'raw_ocr_text')
+
+
+def page_key(filename: str) -> str:
+    """Name shared by every scan and entry of the same page."""
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def _load_entries(path: str) -> List[Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('entries', [])
+
+
+def load_documents(outline_file: str) -> List[Dict]:
+    """
+    Read the document groups built by DocumentCombiner.
+
+    Args:
+        outline_file (str): combined_logbook.json
+
+    Returns:
+        List[Dict]: Documents in order, each with 'title', 'date' and the
+            page keys of its source entries in 'pages'
+    """
+    documents = []
+    for document in _load_entries(outline_file):
+        pages = [page_key(source) for source in document.get('source_entries') or []]
+        if pages:
+            documents.append({
+                'title': document.get('document_title') or 'Logbook Entry',
+                'date': document.get('date_entry'),
+                'pages': pages
+            })
+    return documents
+
+
+class SearchableLayers:
+    """
+    Text layers and bookmarks for the pages of a logbook PDF.
+    """
+
+    def __init__(self, logbook_file: Optional[str] = None, word_boxes_dir: Optional[str] = None,
+                 outline_file: Optional[str] = None, text_source: str = 'content'):
+        """
+        Load the page texts and document groups.
+
+        Args:
+            logbook_file (Optional[str]): complete_logbook.json with the text of each page
+            word_boxes_dir (Optional[str]): Directory of Tesseract word boxes saved by the digitizer
+            outline_file (Optional[str]): combined_logbook.json with DocumentCombiner's document groups
+            text_source (str): Entry field used for page-level text, 'content' (cleaned) or 'raw_ocr_text'
+        """
+        if text_source not in TEXT_SOURCES:
+            raise ValueError(f"Unknown text source: {text_source} (choose from {', '.join(TEXT_SOURCES)})")
+        self.word_boxes_dir = word_boxes_dir
+
+        self.page_texts: Dict[str, str] = {}
+        if logbook_file:
+            for entry in _load_entries(logbook_file):
+                text = entry.get(text_source) or entry.get('content') or entry.get('raw_ocr_text') or ''
+                if entry.get('filename') and text:
+                    self.page_texts[page_key(entry['filename'])] = text
+            logger.info(f"Loaded text for {len(self.page_texts)} pages from {logbook_file}")
+
+        # First page of each document -> bookmark title
+        self.bookmarks: Dict[str, str] = {}
+        if outline_file:
+            for document in load_documents(outline_file):
+                title = f"{document['title']} ({document['date']})" if document['date'] else document['title']
+                self.bookmarks.setdefault(document['pages'][0], title)
+            logger.info(f"Loaded {len(self.bookmarks)} document bookmarks from {outline_file}")
+
+    def text_layer(self, image_name: str) -> Optional[TextLayer]:
+        """
+        Text layer for a page: word-positioned when Tesseract boxes were saved,
+        otherwise the page text from the logbook.
+
+        Args:
+            image_name (str): Page image file name or path
+
+        Returns:
+            Optional[TextLayer]: The layer, or None if there is no text for the page
+        """
+        key = page_key(image_name)
+        boxes = read_word_boxes(word_boxes_path(self.word_boxes_dir, key)) if self.word_boxes_dir else None
+        text = self.page_texts.get(key, '')
+        if boxes is None and not text:
+            return None
+        if boxes is None:
+            return TextLayer(text=text)
+        return TextLayer(text=text, words=boxes.words, size=(boxes.width, boxes.height))
+
+    def bookmark(self, image_name: str) -> Optional[str]:
+        """Title of the document starting on this page, if any."""
+        return self.bookmarks.get(page_key(image_name))
+
+    def add_page(self, writer: StreamingPDFWriter, image, image_name: str) -> Tuple[PageInfo, bool]:
+        """
+        Add a page image with its text layer and bookmark to a StreamingPDFWriter.
+
+        Args:
+            writer (StreamingPDFWriter): Writer to add the page to
+            image: Image path, decoded image or prepared page, passed to writer.add_image
+            image_name (str): Page image file name used to find its text
+
+        Returns:
+            Tuple[PageInfo, bool]: The written page and whether it got a bookmark
+        """
+        page = writer.add_image(image, self.text_layer(image_name))
+        title = self.bookmark(image_name)
+        if title:
+            writer.add_bookmark(title, page.number)
+        return page, bool(title)
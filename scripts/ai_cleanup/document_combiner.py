@@ -8,8 +8,9 @@ import json
 import re
 import os
 import sys
+import argparse
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, FrozenSet, List, Optional, Tuple
 from dataclasses import dataclass
 
 # Add the parent directory to the path so we can import modules
@@ -29,9 +30,58 @@ class DocumentGroup:
     confidence: float
     date_inferred: bool = False
 
+@dataclass(frozen=True)
+class EntryFeatures:
+    """Everything continuation scoring needs to know about one entry, computed once"""
+    content: str
+    page_number: int
+    date_entry: Optional[str]
+    location: str  # Lowercased
+    location_words: Tuple[str, ...]
+    doc_type: str
+    doc_type_confidence: float
+    start_types: FrozenSet[str]  # Document types whose start patterns match
+    end_types: FrozenSet[str]  # Document types whose end patterns match
+    proper_nouns: FrozenSet[str]
+    ends_incomplete: bool
+    starts_mid_sentence: bool
+    has_page_marker: bool
+
+# Patterns used for every entry, compiled once
+LETTER_DATE_PATTERN = re.compile(r'\d{1,2}(?:st|nd|rd|th)?\s+(?:january|february|march|april|may|june|july|august|september|october|november|december)')
+NUMBERED_ITEM_PATTERN = re.compile(r'^\d+\.|\(\d+\)', re.MULTILINE)
+ENDS_INCOMPLETE_PATTERN = re.compile(r'[a-z,;]\s*$')
+STARTS_LOWERCASE_PATTERN = re.compile(r'^[a-z]')
+PAGE_MARKER_PATTERN = re.compile(r'Page\s+\d+|^\d+\.\s*$|\(-?\d+-?\)|^-\d+-', re.IGNORECASE)
+PROPER_NOUN_PATTERN = re.compile(r'\b[A-Z][a-z]+\b')
+
+# Grouping engines for create_document_groups
+GROUPING_METHODS = ('greedy', 'optimal')
+
 class DocumentCombiner:
-    def __init__(self):
+    def __init__(self, grouping: str = 'greedy', window: int = 10, threshold: float = 0.5):
+        """
+        Args:
+            grouping: 'greedy' grows each group page by page; 'optimal' finds the best
+                segmentation of the whole page sequence by dynamic programming
+            window: Lookahead in entries; also the longest group the optimal engine builds
+            threshold: Continuation confidence needed to join two entries
+        """
+        if grouping not in GROUPING_METHODS:
+            raise ValueError(f"Unknown grouping method: {grouping}")
+        self.grouping = grouping
+        self.window = max(1, window)
+        self.threshold = threshold
         self.document_patterns = self._create_document_patterns()
+        self.compiled_patterns = {
+            doc_type: {
+                kind: [re.compile(pattern, re.IGNORECASE | re.MULTILINE) for pattern in kind_patterns]
+                for kind, kind_patterns in patterns.items()
+            }
+            for doc_type, patterns in self.document_patterns.items()
+        }
+        # id(entry) -> (entry, features); the entry is kept so its id cannot be reused
+        self._feature_cache: Dict[int, Tuple[Dict, EntryFeatures]] = {}
         
     def _create_document_patterns(self) -> Dict[str, Dict]:
         """Create patterns to identify different document types"""
@@ -124,38 +174,41 @@ class DocumentCombiner:
     
     def identify_document_type(self, content: str) -> Tuple[str, float]:
         """Identify the type of document and confidence level"""
+        doc_type, score, _, _ = self._classify(content)
+        return doc_type, score
+    
+    def _classify(self, content: str) -> Tuple[str, float, FrozenSet[str], FrozenSet[str]]:
+        """Return (type, confidence, types with a start match, types with an end match)"""
         if not content:
-            return 'unknown', 0.0
+            return 'unknown', 0.0, frozenset(), frozenset()
         
         content_lower = content.lower()
         scores = {}
+        start_types = set()
+        end_types = set()
         
-        for doc_type, patterns in self.document_patterns.items():
+        for doc_type, patterns in self.compiled_patterns.items():
             score = 0.0
             
             # Check start patterns
-            for pattern in patterns['start_patterns']:
-                if re.search(pattern, content, re.IGNORECASE | re.MULTILINE):
-                    score += 0.4
-                    break  # Only count one start pattern
+            if any(pattern.search(content) for pattern in patterns['start_patterns']):
+                score += 0.4  # Only count one start pattern
+                start_types.add(doc_type)
             
             # Check end patterns  
-            for pattern in patterns['end_patterns']:
-                if re.search(pattern, content, re.IGNORECASE | re.MULTILINE):
-                    score += 0.3
-                    break  # Only count one end pattern
+            if any(pattern.search(content) for pattern in patterns['end_patterns']):
+                score += 0.3  # Only count one end pattern
+                end_types.add(doc_type)
             
             # Check continuation patterns
-            for pattern in patterns['continuation_patterns']:
-                if re.search(pattern, content, re.IGNORECASE | re.MULTILINE):
-                    score += 0.2
-                    break  # Only count one continuation pattern
+            if any(pattern.search(content) for pattern in patterns['continuation_patterns']):
+                score += 0.2  # Only count one continuation pattern
             
             # Additional heuristics
             if doc_type == 'letter':
                 if any(word in content_lower for word in ['dear', 'sincerely', 'yours truly', 'regards']):
                     score += 0.1
-                if re.search(r'\d{1,2}(?:st|nd|rd|th)?\s+(?:january|february|march|april|may|june|july|august|september|october|november|december)', content_lower):
+                if LETTER_DATE_PATTERN.search(content_lower):
                     score += 0.1
             
             elif doc_type == 'telegram':
@@ -171,7 +224,7 @@ class DocumentCombiner:
                     score += 0.1
             
             elif doc_type == 'list':
-                numbered_items = len(re.findall(r'^\d+\.|\(\d+\)', content, re.MULTILINE))
+                numbered_items = len(NUMBERED_ITEM_PATTERN.findall(content))
                 if numbered_items > 3:
                     score += 0.2
                 if any(word in content_lower for word in ['specification', 'equipment', 'item', 'description']):
@@ -179,80 +232,113 @@ class DocumentCombiner:
             
             scores[doc_type] = min(score, 1.0)  # Cap at 1.0
         
+        start_types, end_types = frozenset(start_types), frozenset(end_types)
         if not scores:
-            return 'unknown', 0.0
+            return 'unknown', 0.0, start_types, end_types
         
         best_type = max(scores, key=scores.get)
         best_score = scores[best_type]
         
         # Require minimum confidence
         if best_score < 0.3:
-            return 'unknown', best_score
+            return 'unknown', best_score, start_types, end_types
         
-        return best_type, best_score
+        return best_type, best_score, start_types, end_types
+    
+    def get_features(self, entry: Dict) -> EntryFeatures:
+        """Return the cached features of an entry, computing them on first use"""
+        cached = self._feature_cache.get(id(entry))
+        if cached is not None and cached[0] is entry:
+            return cached[1]
+        
+        content = (entry.get('content') or '').strip()
+        location = (entry.get('location') or '').lower()
+        doc_type, doc_type_confidence, start_types, end_types = self._classify(content)
+        features = EntryFeatures(
+            content=content,
+            page_number=entry.get('page_number', 0),
+            date_entry=entry.get('date_entry'),
+            location=location,
+            location_words=tuple(location.split()),
+            doc_type=doc_type,
+            doc_type_confidence=doc_type_confidence,
+            start_types=start_types,
+            end_types=end_types,
+            proper_nouns=frozenset(PROPER_NOUN_PATTERN.findall(content)),
+            ends_incomplete=bool(ENDS_INCOMPLETE_PATTERN.search(content)) or content.endswith('...'),
+            starts_mid_sentence=(bool(STARTS_LOWERCASE_PATTERN.search(content))
+                                 or content.startswith('and ') or content.startswith('but ')),
+            has_page_marker=bool(PAGE_MARKER_PATTERN.search(content))
+        )
+        self._feature_cache[id(entry)] = (entry, features)
+        return features
+    
+    def clear_feature_cache(self) -> None:
+        """Forget cached features, e.g. after entries were edited"""
+        self._feature_cache.clear()
     
     def is_continuation(self, entry1: Dict, entry2: Dict) -> Tuple[bool, float]:
-        """Check if entry2 is a continuation of entry1"""
-        content1 = entry1.get('content', '').strip()
-        content2 = entry2.get('content', '').strip()
-        
-        if not content1 or not content2:
+        """Check if entry2 is a continuation of entry1, i.e. scores at least the threshold"""
+        return self.continuation_score(self.get_features(entry1), self.get_features(entry2))
+    
+    def continuation_score(self, features1: EntryFeatures, features2: EntryFeatures) -> Tuple[bool, float]:
+        """Score a continuation from precomputed features"""
+        if not features1.content or not features2.content:
             return False, 0.0
         
         confidence = 0.0
         
         # Check page numbers (sequential)
-        page1 = entry1.get('page_number', 0)
-        page2 = entry2.get('page_number', 0)
+        page1 = features1.page_number
+        page2 = features2.page_number
         if page1 and page2 and abs(page2 - page1) <= 5:  # Within 5 pages
             confidence += 0.2
         
         # Check dates (same or close)
-        date1 = entry1.get('date_entry')
-        date2 = entry2.get('date_entry')
+        date1 = features1.date_entry
+        date2 = features2.date_entry
         if date1 and date2 and date1 == date2:
             confidence += 0.3
         elif date1 and not date2:  # One has date, other doesn't
             confidence += 0.1
         
         # Check location consistency
-        loc1 = (entry1.get('location') or '').lower()
-        loc2 = (entry2.get('location') or '').lower()
+        loc1 = features1.location
+        loc2 = features2.location
         if loc1 and loc2:
             if loc1 == loc2:
                 confidence += 0.2
-            elif any(word in loc2 for word in loc1.split()) or any(word in loc1 for word in loc2.split()):
+            elif (any(word in loc2 for word in features1.location_words)
+                  or any(word in loc1 for word in features2.location_words)):
                 confidence += 0.1
         
         # Check content continuation patterns
         
         # 1. First document ends incomplete
-        if re.search(r'[a-z,;]\s*$', content1) or content1.endswith('...'):
+        if features1.ends_incomplete:
             confidence += 0.3
         
         # 2. Second document starts mid-sentence or continues
-        if re.search(r'^[a-z]', content2) or content2.startswith('and ') or content2.startswith('but '):
+        if features2.starts_mid_sentence:
             confidence += 0.3
         
         # 3. Page markers
-        if re.search(r'Page\s+\d+|^\d+\.\s*$|\(-?\d+-?\)|^-\d+-', content1, re.IGNORECASE):
+        if features1.has_page_marker:
             confidence += 0.2
         
         # 4. Same document type
-        type1, conf1 = self.identify_document_type(content1)
-        type2, conf2 = self.identify_document_type(content2)
-        if type1 == type2 and type1 != 'unknown':
+        if features1.doc_type == features2.doc_type and features1.doc_type != 'unknown':
             confidence += 0.2
         
         # 5. Content similarity (same topic/characters)
-        # Extract key words and names
-        words1 = set(re.findall(r'\b[A-Z][a-z]+\b', content1))  # Proper nouns
-        words2 = set(re.findall(r'\b[A-Z][a-z]+\b', content2))
+        # Key words and names
+        words1 = features1.proper_nouns
+        words2 = features2.proper_nouns
         if words1 and words2:
-            overlap = len(words1.intersection(words2)) / len(words1.union(words2))
+            overlap = len(words1 & words2) / len(words1 | words2)
             confidence += overlap * 0.2
         
-        return confidence >= 0.5, confidence
+        return confidence >= self.threshold, confidence
     
     def combine_entries(self, entries: List[Dict]) -> str:
         """Combine multiple entries into a single coherent document"""
@@ -317,6 +403,15 @@ class DocumentCombiner:
         # Sort entries by page number for processing
         sorted_entries = sorted(entries, key=lambda x: x.get('page_number', 0))
         
+        if self.grouping == 'optimal':
+            index_groups = self._group_optimal(sorted_entries)
+        else:
+            index_groups = self._group_greedy(sorted_entries)
+        
+        return [self._build_group(sorted_entries, indices) for indices in index_groups]
+    
+    def _group_greedy(self, sorted_entries: List[Dict]) -> List[List[int]]:
+        """Grow each group from its first entry, looking ahead up to window entries"""
         groups = []
         used_indices = set()
         
@@ -329,69 +424,126 @@ class DocumentCombiner:
                 continue
             
             # Start a new group
-            group_entries = [entry]
-            group_indices = {i}
+            group_indices = [i]
             
             # Look for continuations
-            for j in range(i + 1, min(i + 10, len(sorted_entries))):  # Look ahead up to 10 entries
+            for j in range(i + 1, min(i + self.window, len(sorted_entries))):  # Look ahead
                 if j in used_indices:
                     continue
                 
-                next_entry = sorted_entries[j]
-                
                 # Check if this entry continues the current group
-                is_cont, confidence = self.is_continuation(group_entries[-1], next_entry)
+                is_cont, confidence = self.is_continuation(sorted_entries[group_indices[-1]], sorted_entries[j])
                 
-                if is_cont and confidence > 0.5:
-                    group_entries.append(next_entry)
-                    group_indices.add(j)
-                elif len(group_entries) > 1:
+                if is_cont and confidence > self.threshold:
+                    group_indices.append(j)
+                elif len(group_indices) > 1:
                     # Stop looking if we have a multi-entry group and find a non-continuation
                     break
             
             # Mark used indices
             used_indices.update(group_indices)
-            
-            # Determine document type
-            all_content = ' '.join(e.get('content', '') for e in group_entries)
-            doc_type, type_confidence = self.identify_document_type(all_content)
-            
-            # Create combined content
-            combined_content = self.combine_entries(group_entries)
-            
-            # Get best date and location
-            best_date = None
-            best_location = None
-            date_inferred = True
-            
-            for e in group_entries:
-                if e.get('date_entry') and not best_date:
-                    best_date = e['date_entry']
-                    date_inferred = e.get('date_inferred', False)
-                if e.get('location') and not best_location:
-                    best_location = e['location']
-            
-            # Create title
-            title = self.create_document_title(doc_type, combined_content, best_location, best_date)
-            
-            # Create group
-            group = DocumentGroup(
-                id=f"doc_{entry.get('page_number', i)}_{doc_type}",
-                document_type=doc_type,
-                title=title,
-                date_entry=best_date,
-                location=best_location,
-                entries=group_entries,
-                combined_content=combined_content,
-                is_complete=self.is_document_complete(doc_type, combined_content),
-                confidence=type_confidence,
-                date_inferred=date_inferred
-            )
-            
-            groups.append(group)
+            groups.append(group_indices)
         
         return groups
     
+    def _group_optimal(self, sorted_entries: List[Dict]) -> List[List[int]]:
+        """
+        Split the page sequence into the highest-scoring runs of consecutive entries
+        
+        Every pair of entries at most window - 1 apart is scored once. A run scores
+        the sum of (confidence - threshold) / distance over all pairs inside it, so
+        adjacent pages count most and pairs below the threshold push runs apart.
+        best[j] is the best total for the first j entries; each run is at most
+        window entries long and its score is extended incrementally, which makes
+        the whole search O(n * window).
+        """
+        n = len(sorted_entries)
+        features = [self.get_features(entry) for entry in sorted_entries]
+        
+        # Sparse pair matrix: margins[a][d - 1] is the weighted margin of pair (a, a + d)
+        margins = []
+        for a in range(n):
+            row = []
+            for b in range(a + 1, min(a + self.window, n)):
+                _, confidence = self.continuation_score(features[a], features[b])
+                row.append((confidence - self.threshold) / (b - a))
+            margins.append(row)
+        
+        best = [0.0] * (n + 1)
+        run_start = [0] * (n + 1)
+        # row_sums[a] = margins of pairs (a, b) for a < b <= j, maintained as j advances
+        row_sums = [0.0] * n
+        for j in range(n):
+            for a in range(max(0, j - self.window + 1), j):
+                row_sums[a] += margins[a][j - a - 1]
+            
+            # A run i..j scores the row sums of a = i..j; grow it leftwards from j
+            best[j + 1] = best[j]
+            run_start[j + 1] = j
+            run_score = 0.0
+            for i in range(j - 1, max(0, j - self.window + 1) - 1, -1):
+                run_score += row_sums[i]
+                if best[i] + run_score > best[j + 1]:
+                    best[j + 1] = best[i] + run_score
+                    run_start[j + 1] = i
+        
+        # Walk back through the chosen runs
+        groups = []
+        j = n
+        while j > 0:
+            i = run_start[j]
+            groups.append(list(range(i, j)))
+            j = i
+        groups.reverse()
+        
+        # Like the greedy engine, very short entries never make a document on their own
+        return [group for group in groups
+                if len(group) > 1 or len(features[group[0]].content) >= 20]
+    
+    def _build_group(self, sorted_entries: List[Dict], indices: List[int]) -> DocumentGroup:
+        """Create a DocumentGroup from the entries at the given sorted positions"""
+        i = indices[0]
+        entry = sorted_entries[i]
+        group_entries = [sorted_entries[index] for index in indices]
+        
+        # Determine document type
+        all_content = ' '.join(e.get('content', '') for e in group_entries)
+        doc_type, type_confidence = self.identify_document_type(all_content)
+        
+        # Create combined content
+        combined_content = self.combine_entries(group_entries)
+        
+        # Get best date and location
+        best_date = None
+        best_location = None
+        date_inferred = True
+        
+        for e in group_entries:
+            if e.get('date_entry') and not best_date:
+                best_date = e['date_entry']
+                date_inferred = e.get('date_inferred', False)
+            if e.get('location') and not best_location:
+                best_location = e['location']
+        
+        # Create title
+        title = self.create_document_title(doc_type, combined_content, best_location, best_date)
+        
+        # Create group
+        group = DocumentGroup(
+            id=f"doc_{entry.get('page_number', i)}_{doc_type}",
+            document_type=doc_type,
+            title=title,
+            date_entry=best_date,
+            location=best_location,
+            entries=group_entries,
+            combined_content=combined_content,
+            is_complete=self.is_document_complete(doc_type, combined_content),
+            confidence=type_confidence,
+            date_inferred=date_inferred
+        )
+        
+        return group
+    
     def create_document_title(self, doc_type: str, content: str, location: str, date: str) -> str:
         """Create an appropriate title for the document"""
         
@@ -472,7 +624,9 @@ class DocumentCombiner:
         entries = logbook_data.get('entries', [])
         
         # Create document groups
+        self.clear_feature_cache()
         document_groups = self.create_document_groups(entries)
+        self.clear_feature_cache()
         
         # Convert back to entry format
         combined_entries = []
@@ -511,10 +665,24 @@ class DocumentCombiner:
         return result
 
 def main():
-    # Load the cleaned logbook
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    logbook_path = os.path.join(script_dir, '..', '..', 'website', 'public', 'data', 'cleaned_logbook.json')
+    data_dir = os.path.join(script_dir, '..', '..', 'website', 'public', 'data')
+    
+    parser = argparse.ArgumentParser(description="Combine multi-page letters, telegrams and reports")
+    parser.add_argument("--input", default=os.path.join(data_dir, 'cleaned_logbook.json'),
+                        help="Cleaned logbook JSON")
+    parser.add_argument("--output", default=os.path.join(data_dir, 'combined_logbook.json'),
+                        help="Where to write the combined logbook")
+    parser.add_argument("--grouping", choices=GROUPING_METHODS, default='greedy',
+                        help="Greedy page-by-page grouping, or optimal segmentation of the whole sequence")
+    parser.add_argument("--window", type=int, default=10,
+                        help="Entries to look ahead; also the longest group the optimal engine builds")
+    parser.add_argument("--threshold", type=float, default=0.5,
+                        help="Continuation confidence needed to join two entries")
+    args = parser.parse_args()
     
+    # Load the cleaned logbook
+    logbook_path = args.input
     try:
         with open(logbook_path, 'r', encoding='utf-8') as f:
             logbook_data = json.load(f)
@@ -523,11 +691,11 @@ def main():
         return
     
     # Create combiner and process
-    combiner = DocumentCombiner()
+    combiner = DocumentCombiner(grouping=args.grouping, window=args.window, threshold=args.threshold)
     combined_data = combiner.process_logbook(logbook_data)
     
     # Save combined logbook
-    output_path = os.path.join(script_dir, '..', '..', 'website', 'public', 'data', 'combined_logbook.json')
+    output_path = args.output
     with open(output_path, 'w', encoding='utf-8') as f:
         json.dump(combined_data, f, indent=2, ensure_ascii=False)
     
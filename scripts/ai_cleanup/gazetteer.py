@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Gazetteer index of journey places and date cues
+Finds every known place name and date cue in a text, with offsets, in one
+scan, so location and date inference no longer test each name separately
+"""
+
+import re
+import json
+import hashlib
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules', 'gazetteer.json')
+
+
+@dataclass(frozen=True)
+class GazetteerHit:
+    """One occurrence of a gazetteer term in a text"""
+    term: str             # Term as it appears in the gazetteer
+    kind: str             # 'place' or 'date_cue'
+    value: str            # Canonical place name, or the date for a date cue
+    priority: int         # Position in the gazetteer list; lower wins
+    start: int
+    end: int
+
+
+class TermTrie:
+    """
+    Trie of lowercase terms compiled into a single regular expression
+
+    The regex engine walks the trie in C, which plays the role of an
+    Aho-Corasick automaton: each search finds the next position where any term
+    starts, and every term starting there is reported, overlapping ones included.
+    """
+
+    def __init__(self, terms: List[str]):
+        self.terms = set(terms)
+        root: Dict = {}
+        for term in self.terms:
+            node = root
+            for char in term:
+                node = node.setdefault(char, {})
+            node[''] = True  # End of a term
+        self.pattern = re.compile(self._to_regex(root)) if self.terms else None
+
+        # Terms that are prefixes of a longer term start at the same position as it
+        self._prefix_terms = {
+            term: [other for other in self.terms if term.startswith(other)]
+            for term in self.terms
+        }
+
+    def _to_regex(self, node: Dict) -> str:
+        branches = [re.escape(char) + self._to_regex(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Greedy optional, so the longest term starting at a position is matched
+        if '' in node:
+            return f"(?:{body})?"
+        return body
+
+    def find_all(self, text: str) -> List[Tuple[int, str]]:
+        """Return (start, term) for every occurrence of every term in lowercase text"""
+        hits = []
+        if self.pattern is None:
+            return hits
+        position = 0
+        while True:
+            match = self.pattern.search(text, position)
+            if not match:
+                return hits
+            for term in self._prefix_terms[match.group(0)]:
+                hits.append((match.start(), term))
+            # Restart just past the match start so overlapping terms are found too
+            position = match.start() + 1
+
+
+class Gazetteer:
+    """Index of place names and date cues for the journey"""
+
+    def __init__(self, places: List[str], date_cues: List[Tuple[str, str]]):
+        # lowercase term -> [(kind, term, value, priority)]
+        self.entries: Dict[str, List[Tuple[str, str, str, int]]] = {}
+        for priority, place in enumerate(places):
+            self.entries.setdefault(place.lower(), []).append(('place', place, place, priority))
+        for priority, (cue, date) in enumerate(date_cues):
+            self.entries.setdefault(cue.lower(), []).append(('date_cue', cue, date, priority))
+        self.trie = TermTrie(list(self.entries))
+        # Identifies the exact gazetteer contents, e.g. for caches of inferred fields
+        canonical = json.dumps([places, [list(cue) for cue in date_cues]], ensure_ascii=False)
+        self.fingerprint = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+        # Location and date inference usually scan the same text back to back
+        self._last_scan: Tuple[Optional[str], List[GazetteerHit]] = (None, [])
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_GAZETTEER_PATH) -> 'Gazetteer':
+        """Build the index from a gazetteer JSON file"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['places'], [(cue['term'], cue['date']) for cue in data['date_cues']])
+
+    @staticmethod
+    def _lower(text: str) -> str:
+        """Lowercase text without changing its length, so offsets stay valid"""
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            return lowered
+        return ''.join(char.lower()[:1] or char for char in text)
+
+    def find(self, text: str, kind: Optional[str] = None) -> List[GazetteerHit]:
+        """
+        Find every gazetteer term in text (case-insensitive substring match)
+
+        Args:
+            text: Text to scan
+            kind: Only return hits of this kind ('place' or 'date_cue')
+
+        Returns:
+            Hits ordered by position in the text
+        """
+        if not text:
+            return []
+        if self._last_scan[0] == text:
+            hits = self._last_scan[1]
+        else:
+            hits = []
+            for start, term in self.trie.find_all(self._lower(text)):
+                for entry_kind, name, value, priority in self.entries[term]:
+                    hits.append(GazetteerHit(name, entry_kind, value, priority, start, start + len(term)))
+            self._last_scan = (text, hits)
+        return [hit for hit in hits if kind is None or hit.kind == kind]
+
+    def best(self, text: str, kind: str) -> Optional[GazetteerHit]:
+        """Return the hit of the given kind that comes first in the gazetteer, if any"""
+        return self.best_in(self.find(text, kind), kind)
+
+    def best_in(self, hits: List[GazetteerHit], kind: str) -> Optional[GazetteerHit]:
+        """Like best(), for hits that were already found"""
+        matching = [hit for hit in hits if hit.kind == kind]
+        return min(matching, key=lambda hit: (hit.priority, hit.start)) if matching else None
+
+
+@lru_cache(maxsize=None)
+def load_gazetteer(path: str = DEFAULT_GAZETTEER_PATH) -> Gazetteer:
+    """Load the gazetteer; each file is only indexed once per process"""
+    return Gazetteer.load(path)
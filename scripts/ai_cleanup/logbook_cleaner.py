@@ -8,158 +8,93 @@ import json
 import re
 import os
 import sys
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 
 # Add the parent directory to the path so we can import modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ai_cleanup.rule_engine import DEFAULT_RULES_PATH, load_rule_set
+from ai_cleanup.gazetteer import DEFAULT_GAZETTEER_PATH, load_gazetteer
+
+# Bump when clean_entry logic changes so memoized results are not reused
+CLEANER_VERSION = 1
+
+class CleaningMemo:
+    """On-disk memo of cleaned entries keyed by a hash of the input entry and rule set"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.entries: Dict[str, Dict] = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get('entries', {})
+        except (OSError, ValueError):
+            pass
+    
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+    
+    def save(self, results: Dict[str, Dict]) -> None:
+        """Replace the memo with the given results, dropping entries that are no longer used"""
+        self.entries = results
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CLEANER_VERSION, 'entries': results}, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+# Per-process cleaner used by the worker pool
+_worker_cleaner = None
+
+def _init_worker(rules_path: str, gazetteer_path: str):
+    global _worker_cleaner
+    _worker_cleaner = LogbookCleaner(rules_path, gazetteer_path)
+
+def _clean_chunk(entries: List[Dict]) -> List[Dict]:
+    return [_worker_cleaner.clean_entry(entry) for entry in entries]
 
 class LogbookCleaner:
-    def __init__(self):
+    def __init__(self, rules_path: str = DEFAULT_RULES_PATH, gazetteer_path: str = DEFAULT_GAZETTEER_PATH):
+        self.rules_path = rules_path
+        self.gazetteer_path = gazetteer_path
+        self.rules = load_rule_set(rules_path)
+        self.gazetteer = load_gazetteer(gazetteer_path)
+        # Changes whenever the rules, the gazetteer or the cleaning code change
+        self.fingerprint = hashlib.sha256(
+            f"{CLEANER_VERSION}:{self.rules.fingerprint}:{self.gazetteer.fingerprint}".encode('utf-8')
+        ).hexdigest()
         self.location_to_date_mapping = self._create_location_date_mapping()
         self.known_locations = self._create_known_locations()
         
     def _create_location_date_mapping(self) -> Dict[str, str]:
         """Create a mapping of locations to approximate dates based on Ernest's journey"""
-        return {
-            # Journey route based on historical context
-            "chicago": "1933-01",
-            "new york": "1933-01", 
-            "southampton": "1933-01-28",
-            "london": "1933-01-29",
-            "england": "1933-02",
-            "liverpool": "1933-02",
-            "portugal": "1933-02",
-            "lisbon": "1933-02",
-            "spain": "1933-02",
-            "france": "1933-03",
-            "paris": "1933-03",
-            "switzerland": "1933-03",
-            "germany": "1933-03",
-            "berlin": "1933-03",
-            "poland": "1933-04",
-            "russia": "1933-04",
-            "moscow": "1933-04",
-            "egypt": "1933-04",
-            "cairo": "1933-04",
-            "suez": "1933-04",
-            "india": "1933-05",
-            "bombay": "1933-05",
-            "calcutta": "1933-05",
-            "burma": "1933-05",
-            "rangoon": "1933-05",
-            "straits settlements": "1933-05",
-            "singapore": "1933-05",
-            "kuala lumpur": "1933-05",
-            "penang": "1933-05",
-            "china": "1933-06",
-            "shanghai": "1933-06",
-            "hong kong": "1933-06",
-            "hongkong": "1933-06",
-            "nanking": "1933-06",
-            "peking": "1933-06",
-            "tientsin": "1933-06",
-            "japan": "1933-07",
-            "tokyo": "1933-07",
-            "yokohama": "1933-07",
-            "philippines": "1933-08",
-            "manila": "1933-08",
-            "hawaii": "1933-09",
-            "honolulu": "1933-09",
-            "pacific": "1933-09",
-            "san francisco": "1933-09",
-            "california": "1933-09",
-            "united states": "1933-09",
-            "america": "1933-09"
-        }
+        # Journey route based on historical context, kept in rules/gazetteer.json
+        return {cue: date for _, cue, date, _ in self._gazetteer_entries('date_cue')}
     
     def _create_known_locations(self) -> List[str]:
         """Create a list of known locations from the journey"""
-        return [
-            "Chicago", "New York", "Southampton", "London", "England", "Liverpool", 
-            "Portugal", "Lisbon", "Spain", "France", "Paris", "Switzerland", 
-            "Germany", "Berlin", "Poland", "Russia", "Moscow", "Egypt", "Cairo", 
-            "Suez", "India", "Bombay", "Calcutta", "Burma", "Rangoon", 
-            "Straits Settlements", "Singapore", "Kuala Lumpur", "Penang", 
-            "China", "Shanghai", "Hong Kong", "Nanking", "Peking", "Tientsin", 
-            "Japan", "Tokyo", "Yokohama", "Philippines", "Manila", "Hawaii", 
-            "Honolulu", "San Francisco", "California", "Antwerp", "Melbourne House"
-        ]
+        return [place for _, place, _, _ in self._gazetteer_entries('place')]
+    
+    def _gazetteer_entries(self, kind: str) -> List[Tuple[str, str, str, int]]:
+        entries = [entry for entries in self.gazetteer.entries.values() for entry in entries if entry[0] == kind]
+        return sorted(entries, key=lambda entry: entry[3])
     
     def clean_text(self, text: str) -> str:
         """Clean OCR artifacts and improve text quality"""
         if not text:
             return ""
-            
-        # Remove common OCR artifacts
-        text = re.sub(r'[^\w\s\.\,\!\?\;\:\-\(\)\[\]\{\}\"\'\$\%\&\@\#\*\+\=\<\>\/\\\|\_\~\`\^]', '', text)
-        
-        # Fix common OCR errors
-        ocr_fixes = {
-            r'\bI\b(?=\s+[a-z])': 'I',  # Standalone I
-            r'\bto-morrow\b': 'tomorrow',
-            r'\bto-day\b': 'today',
-            r'\bto-night\b': 'tonight',
-            r'\bper cent\b': 'percent',
-            r'\bper-cent\b': 'percent',
-            r'\bfavour\b': 'favor',
-            r'\bfavourable\b': 'favorable',
-            r'\bcolour\b': 'color',
-            r'\bhonour\b': 'honor',
-            r'\bcentre\b': 'center',
-            r'\btheatre\b': 'theater',
-            r'\bconneotor\b': 'connector',
-            r'\bsele otor\b': 'selector',
-            r'\boffereing\b': 'offering',
-            r'\bpreceeding\b': 'preceding',
-            r'\bregretable\b': 'regrettable',
-            r'\btravelling\b': 'traveling',
-            r'\bneighbouring\b': 'neighboring',
-            r'\bRumours\b': 'Rumors',
-            r'\brumours\b': 'rumors',
-            r'\bManchukoa\b': 'Manchukuo',
-            r'\bTokio\b': 'Tokyo',
-            r'\bAutomatio\b': 'Automatic',
-            r'\bspecially\b': 'especially',
-            r'\bover-estimated\b': 'overestimated',
-            r'\bover-burdened\b': 'overburdened',
-            r'\bG\.\$': 'G.$',  # Currency formatting
-            r'\bU\.\s*S\.\s*A\.': 'U.S.A.',
-            r'\bW\.\s*C\.\s*2\.': 'W.C.2.',
-            r'\bP\.\s*A\.\s*X\.': 'P.A.X.',
-            r'\bHSB\/EMO\b': 'HSB/EMO',
-            r'\b\d+\s+[A-Z]\s+\d+\b': '',  # Remove random number-letter-number patterns
-            r'\bdan\s+t\b': '',  # Remove OCR artifacts
-            r'\b[A-Z]{1,2}\s+\d+\s+[A-Z]\s*\b': '',  # Remove random codes
-            r'\b\d+\s+[A-Z]\s+\d+\s+[A-Z]\s*\b': '',  # Remove more random codes
-            r'\bContext:\s*$': '',  # Remove trailing "Context:"
-            r'\bOriginal:\s*IMG_\d+\.png\s*$': '',  # Remove trailing image references
-            r'\bConfidence:\s*\d+%\s*$': '',  # Remove confidence scores
-        }
-        
-        for pattern, replacement in ocr_fixes.items():
-            text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
-        
-        # Fix spacing issues
-        text = re.sub(r'\s+', ' ', text)  # Multiple spaces to single
-        text = re.sub(r'\s+([,.!?;:])', r'\1', text)  # Remove space before punctuation
-        text = re.sub(r'([,.!?;:])\s*([A-Z])', r'\1 \2', text)  # Ensure space after punctuation
-        text = re.sub(r'([a-z])([A-Z])', r'\1 \2', text)  # Add space between camelCase
         
-        # Fix paragraph breaks
-        text = re.sub(r'\n\s*\n', '\n\n', text)  # Standardize paragraph breaks
-        text = re.sub(r'\n([A-Z])', r'\n\n\1', text)  # Add paragraph break before new sentences
-        
-        # Remove standalone numbers and letters at the beginning of lines
-        text = re.sub(r'^\s*\d+\s*$', '', text, flags=re.MULTILINE)
-        text = re.sub(r'^\s*[A-Z]\s*$', '', text, flags=re.MULTILINE)
-        text = re.sub(r'^\s*[A-Z]\d+\s*$', '', text, flags=re.MULTILINE)
-        
-        # Clean up final text
-        text = text.strip()
-        text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)  # Max 2 consecutive newlines
-        
-        return text
+        # The fix table and spacing passes live in rules/ocr_fixes.json, compiled once
+        return self.rules.apply(text)
     
     def infer_date_from_content(self, content: str, location: str) -> Optional[str]:
         """Infer date from content and location"""
@@ -192,18 +127,17 @@ class LogbookCleaner:
         
         # If no explicit date found, use location mapping
         if location:
-            location_lower = location.lower()
-            for loc, date in self.location_to_date_mapping.items():
-                if loc in location_lower:
-                    return date
+            hit = self.gazetteer.best(location, 'date_cue')
+            if hit:
+                return hit.value
         
         # Look for location clues in content
-        content_lower = content.lower()
-        for loc, date in self.location_to_date_mapping.items():
-            if loc in content_lower:
-                return date
+        hit = self.gazetteer.best(content, 'date_cue')
+        if hit:
+            return hit.value
         
         # Look for sequential clues
+        content_lower = content.lower()
         if 'arrived in japan' in content_lower and 'tenth of july' in content_lower:
             return '1933-07-10'
         
@@ -234,9 +168,9 @@ class LogbookCleaner:
                     return match
         
         # Check for known locations in content
-        for location in self.known_locations:
-            if location.lower() in content.lower():
-                return location
+        hit = self.gazetteer.best(content, 'place')
+        if hit:
+            return hit.value
         
         return None
     
@@ -278,15 +212,33 @@ class LogbookCleaner:
         
         return cleaned_entry
     
-    def clean_logbook(self, logbook_data: Dict) -> Dict:
-        """Clean the entire logbook"""
+    def entry_key(self, entry: Dict) -> str:
+        """Hash of an input entry and the current rule set, used as its memo key"""
+        payload = json.dumps(entry, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(f"{self.fingerprint}:{payload}".encode('utf-8')).hexdigest()
+    
+    def clean_logbook(self, logbook_data: Dict, workers: int = 1, chunk_size: int = 32,
+                      memo: Optional[CleaningMemo] = None) -> Dict:
+        """Clean the entire logbook
+        
+        Entries found in the memo are reused; the rest are cleaned in chunks
+        across a pool of worker processes when workers > 1.
+        """
         cleaned_data = logbook_data.copy()
+        entries = logbook_data.get('entries', [])
+        
+        # Reuse entries whose input and rules have not changed
+        keys = [self.entry_key(entry) for entry in entries]
+        cleaned_entries = [memo.get(key) if memo else None for key in keys]
+        pending = [index for index, cleaned in enumerate(cleaned_entries) if cleaned is None]
         
-        # Clean each entry
-        cleaned_entries = []
-        for entry in logbook_data.get('entries', []):
-            cleaned_entry = self.clean_entry(entry)
-            cleaned_entries.append(cleaned_entry)
+        # Clean each remaining entry
+        results = self._clean_entries([entries[index] for index in pending], workers, chunk_size)
+        for index, cleaned_entry in zip(pending, results):
+            cleaned_entries[index] = cleaned_entry
+        
+        if memo:
+            memo.save(dict(zip(keys, cleaned_entries)))
         
         cleaned_data['entries'] = cleaned_entries
         
@@ -295,12 +247,38 @@ class LogbookCleaner:
         cleaned_data['metadata']['cleaned_entries'] = len(cleaned_entries)
         
         return cleaned_data
+    
+    def _clean_entries(self, entries: List[Dict], workers: int, chunk_size: int) -> List[Dict]:
+        """Clean entries in order, fanning chunks out to worker processes if worthwhile"""
+        chunk_size = max(1, chunk_size)
+        # Starting a pool costs more than cleaning a couple of chunks inline
+        if workers <= 1 or len(entries) <= chunk_size * 2:
+            return [self.clean_entry(entry) for entry in entries]
+        
+        chunks = [entries[i:i + chunk_size] for i in range(0, len(entries), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(self.rules_path, self.gazetteer_path)) as pool:
+            return [entry for chunk in pool.map(_clean_chunk, chunks) for entry in chunk]
 
 def main():
-    # Load the original logbook
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    logbook_path = os.path.join(script_dir, '..', '..', 'website', 'public', 'data', 'complete_logbook.json')
+    data_dir = os.path.join(script_dir, '..', '..', 'website', 'public', 'data')
     
+    parser = argparse.ArgumentParser(description="Clean OCR artifacts and infer missing dates in the logbook")
+    parser.add_argument("--input", default=os.path.join(data_dir, 'complete_logbook.json'),
+                        help="Logbook JSON to clean")
+    parser.add_argument("--output", default=os.path.join(data_dir, 'cleaned_logbook.json'),
+                        help="Where to write the cleaned logbook")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes for cleaning entries")
+    parser.add_argument("--chunk-size", type=int, default=32, help="Entries sent to a worker at a time")
+    parser.add_argument("--memo", default=os.path.join(script_dir, '.cache', 'cleaning_memo.json'),
+                        help="Memo of cleaned entries; only changed entries or rules are reprocessed")
+    parser.add_argument("--no-memo", action="store_true", help="Clean every entry from scratch")
+    args = parser.parse_args()
+    
+    # Load the original logbook
+    logbook_path = args.input
     try:
         with open(logbook_path, 'r', encoding='utf-8') as f:
             logbook_data = json.load(f)
@@ -308,17 +286,24 @@ def main():
         print(f"Error: Could not find logbook at {logbook_path}")
         return
     
+    memo = None
+    if not args.no_memo:
+        os.makedirs(os.path.dirname(os.path.abspath(args.memo)), exist_ok=True)
+        memo = CleaningMemo(args.memo)
+    
     # Create cleaner and process
     cleaner = LogbookCleaner()
-    cleaned_data = cleaner.clean_logbook(logbook_data)
+    cleaned_data = cleaner.clean_logbook(logbook_data, workers=args.workers, chunk_size=args.chunk_size, memo=memo)
     
     # Save cleaned logbook
-    output_path = os.path.join(script_dir, '..', '..', 'website', 'public', 'data', 'cleaned_logbook.json')
+    output_path = args.output
     with open(output_path, 'w', encoding='utf-8') as f:
         json.dump(cleaned_data, f, indent=2, ensure_ascii=False)
     
     print(f"Cleaned logbook saved to {output_path}")
     print(f"Processed {len(cleaned_data['entries'])} entries")
+    if memo:
+        print(f"Reused {memo.hits} unchanged entries, cleaned {memo.misses}")
     
     # Print some statistics
     inferred_dates = sum(1 for entry in cleaned_data['entries'] if entry.get('date_inferred'))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Compiled rewrite rules for OCR clean-up
+Loads a rule set from a JSON data file and compiles it once, so cleaning
+many entries costs one scan per pipeline step instead of one per rule
+"""
+
+import re
+import json
+import hashlib
+import os
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules', 'ocr_fixes.json')
+
+REGEX_FLAGS = {
+    'IGNORECASE': re.IGNORECASE,
+    'MULTILINE': re.MULTILINE,
+    'DOTALL': re.DOTALL,
+    'VERBOSE': re.VERBOSE
+}
+
+
+def _compile_flags(names: List[str]) -> int:
+    """Turn flag names from the rules file into re flags"""
+    flags = 0
+    for name in names or []:
+        if name not in REGEX_FLAGS:
+            raise ValueError(f"Unknown regex flag in rule set: {name}")
+        flags |= REGEX_FLAGS[name]
+    return flags
+
+
+class FixTable:
+    """
+    A table of literal fixes matched by one alternation in a single scan
+    
+    At each position the first rule (in table order) that matches wins. To keep
+    the scan cheap, a word boundary shared by every rule is tested once, and
+    runs of rules starting with a literal character are grouped by that
+    character, so only the rules that can possibly match are tried.
+    """
+
+    def __init__(self, rules: List[Dict], flags: int = 0):
+        self.replacements: Dict[str, str] = {}
+        patterns = []
+        for index, rule in enumerate(rules):
+            pattern = rule['pattern']
+            # Rules share one pattern, so their own group numbers and names would collide
+            if re.search(r'\(\?P[<=]|\\[1-9]', pattern):
+                raise ValueError(f"Fix rules cannot use named groups or backreferences: {pattern}")
+            re.compile(pattern, flags)  # Report a bad rule on its own, not as part of the alternation
+            self.replacements[f"r{index}"] = rule['replacement']
+            patterns.append(pattern)
+
+        self.pattern = re.compile(self._build_pattern(patterns, flags), flags) if patterns else None
+
+    @staticmethod
+    def _build_pattern(patterns: List[str], flags: int) -> str:
+        """Combine rule patterns into one alternation with a named group per rule"""
+        prefix = ''
+        if all(pattern.startswith(r'\b') for pattern in patterns):
+            prefix = r'\b'
+            patterns = [pattern[2:] for pattern in patterns]
+
+        # Consecutive rules that start with a plain literal character are grouped by it.
+        # Rules with different first characters can never match at the same position,
+        # so this keeps first-rule-wins order; any other rule closes the current group.
+        blocks: List = []
+        group: Optional[Dict[str, List[Tuple[int, str]]]] = None
+        for index, pattern in enumerate(patterns):
+            literal_start = (pattern[:1].isalnum() and '|' not in pattern
+                             and pattern[1:2] not in ('*', '?', '+', '{'))
+            if literal_start:
+                if group is None:
+                    group = {}
+                    blocks.append(group)
+                first = pattern[0].lower() if flags & re.IGNORECASE else pattern[0]
+                group.setdefault(first, []).append((index, pattern[1:]))
+            else:
+                group = None
+                blocks.append((index, pattern))
+
+        alternatives = []
+        for block in blocks:
+            if isinstance(block, dict):
+                for first, members in block.items():
+                    inner = '|'.join(f"(?P<r{index}>{rest})" for index, rest in members)
+                    alternatives.append(f"{re.escape(first)}(?:{inner})")
+            else:
+                index, pattern = block
+                alternatives.append(f"(?P<r{index}>{pattern})")
+
+        return f"{prefix}(?:{'|'.join(alternatives)})"
+
+    def _replace(self, match) -> str:
+        # Each rule's named group is the outermost capturing group it matched, so it closes last
+        return self.replacements[match.lastgroup]
+
+    def apply(self, text: str) -> str:
+        if self.pattern is None:
+            return text
+        return self.pattern.sub(self._replace, text)
+
+
+class RuleSet:
+    """An ordered pipeline of compiled clean-up steps"""
+
+    def __init__(self, data: Dict):
+        self.version = data.get('version', 1)
+        self.steps: List[Callable[[str], str]] = []
+        for step in data['pipeline']:
+            kind = step.get('type', 'regex')
+            if kind == 'regex':
+                pattern = re.compile(step['pattern'], _compile_flags(step.get('flags')))
+                self.steps.append(lambda text, p=pattern, r=step['replacement']: p.sub(r, text))
+            elif kind == 'fixes':
+                self.steps.append(FixTable(step['rules'], _compile_flags(step.get('flags'))).apply)
+            elif kind == 'strip':
+                self.steps.append(str.strip)
+            else:
+                raise ValueError(f"Unknown rule step type: {kind}")
+
+        # Identifies the exact rules, e.g. for caches of cleaned text
+        canonical = json.dumps(data, sort_keys=True, ensure_ascii=False)
+        self.fingerprint = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def apply(self, text: str) -> str:
+        """Run text through every step in order"""
+        for step in self.steps:
+            text = step(text)
+        return text
+
+
+@lru_cache(maxsize=None)
+def load_rule_set(path: str = DEFAULT_RULES_PATH) -> RuleSet:
+    """Load and compile a rule set; each file is only compiled once per process"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return RuleSet(json.load(f))
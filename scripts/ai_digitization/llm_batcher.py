@@ -0,0 +1,82 @@
+"""
+Micro-batcher for GPT requests issued by concurrent pages.
+
+Pages running in parallel each submit their text and await a result. The
+batcher packs submissions into a single request once batch_size texts are
+waiting, or once the oldest one has waited linger seconds, whichever comes
+first.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class LLMBatcher:
+    """Collects texts from concurrent callers and processes them in groups."""
+
+    def __init__(self, process_batch: Callable[[List[str]], Awaitable[List[Any]]],
+                 batch_size: int = 4, linger: float = 2.0):
+        """
+        Initialize the batcher.
+
+        Args:
+            process_batch (Callable): Coroutine function mapping a list of texts to
+                a list of results in the same order
+            batch_size (int): Number of texts that triggers an immediate flush
+            linger (float): Seconds to wait for a batch to fill before flushing anyway
+        """
+        self.process_batch = process_batch
+        self.batch_size = max(1, batch_size)
+        self.linger = linger
+        self.batches_sent = 0
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, text: str) -> Any:
+        """Queue a text for the next batch and wait for its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.linger, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """Send everything that is waiting as one batch."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        # Keep a reference so the task is not garbage collected mid-flight
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        self.batches_sent += 1
+        try:
+            results = await self.process_batch([text for text, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Batch returned {len(results)} results for {len(batch)} texts")
+        except Exception as e:
+            logger.error(f"Batch of {len(batch)} texts failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
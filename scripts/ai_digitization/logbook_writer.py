@@ -0,0 +1,95 @@
+"""
+Streaming writer for the complete_logbook.json master dataset.
+
+The master file is assembled from the run journal one entry at a time, so
+memory use stays flat however large the archive grows. The output is
+byte-for-byte what json.dump(..., indent=2) would produce for the same data,
+and it replaces the previous file atomically, so the website always reads
+either the old or the new version of the file, never a partial one.
+"""
+
+import os
+import json
+from typing import Dict, Iterable
+
+# Confidence bands used in the processing report
+HIGH_CONFIDENCE = 0.9
+MEDIUM_CONFIDENCE = 0.7
+
+
+def summarize_entries(entries: Iterable[Dict]) -> Dict:
+    """
+    Collect page counts and confidence statistics in a single pass.
+
+    Args:
+        entries (Iterable[Dict]): Logbook entry dictionaries
+
+    Returns:
+        Dict: Entry count, per-method counts and confidence statistics
+    """
+    summary = {
+        "total_entries": 0,
+        "method_counts": {},
+        "confidence_min": None,
+        "confidence_max": None,
+        "confidence_sum": 0.0,
+        "high_confidence_files": 0,
+        "medium_confidence_files": 0,
+        "low_confidence_files": 0
+    }
+
+    for entry in entries:
+        confidence = entry["confidence_score"]
+        method = entry["processing_method"]
+        summary["total_entries"] += 1
+        summary["method_counts"][method] = summary["method_counts"].get(method, 0) + 1
+        summary["confidence_sum"] += confidence
+        if summary["confidence_min"] is None or confidence < summary["confidence_min"]:
+            summary["confidence_min"] = confidence
+        if summary["confidence_max"] is None or confidence > summary["confidence_max"]:
+            summary["confidence_max"] = confidence
+
+        if confidence >= HIGH_CONFIDENCE:
+            summary["high_confidence_files"] += 1
+        elif confidence >= MEDIUM_CONFIDENCE:
+            summary["medium_confidence_files"] += 1
+        else:
+            summary["low_confidence_files"] += 1
+
+    total = summary["total_entries"]
+    summary["confidence_average"] = summary["confidence_sum"] / total if total else 0
+    return summary
+
+
+def _indented(value, depth: int) -> str:
+    """Serialize value as it would appear nested depth levels deep in an indent=2 dump."""
+    text = json.dumps(value, indent=2, ensure_ascii=False)
+    return text.replace('\n', '\n' + '  ' * depth)
+
+
+def write_complete_logbook(output_path: str, metadata: Dict, entries: Iterable[Dict]) -> int:
+    """
+    Write the master dataset, streaming entries straight to disk.
+
+    Args:
+        output_path (str): Destination, normally complete_logbook.json
+        metadata (Dict): Contents of the "metadata" block
+        entries (Iterable[Dict]): Entry dictionaries in page order
+
+    Returns:
+        int: Number of entries written
+    """
+    temp_path = f"{output_path}.tmp"
+    count = 0
+    with open(temp_path, 'w', encoding='utf-8', buffering=1024 * 1024) as f:
+        f.write('{\n  "metadata": ')
+        f.write(_indented(metadata, 1))
+        f.write(',\n  "entries": [')
+        for entry in entries:
+            f.write(',\n    ' if count else '\n    ')
+            f.write(_indented(entry, 2))
+            count += 1
+        f.write('\n  ]\n}' if count else ']\n}')
+
+    os.replace(temp_path, output_path)
+    return count
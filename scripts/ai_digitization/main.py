@@ -15,26 +15,39 @@ Features:
 """
 
 import os
+import sys
 import json
 import logging
 import argparse
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 from dataclasses import dataclass, asdict
 import asyncio
 import aiohttp
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
 load_dotenv()
 
-from PIL import Image
-import pytesseract
-from spellchecker import SpellChecker
 import openai
 from openai import AsyncOpenAI
 
+# Add the parent directory to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ai_digitization.result_cache import ResultCache, file_sha256
+from ai_digitization.run_journal import RunJournal
+from ai_digitization.logbook_writer import summarize_entries, write_complete_logbook
+from ai_digitization.metrics import PipelineMetrics
+from ai_digitization.llm_batcher import LLMBatcher
+from ai_digitization.rate_limiter import ProviderRateLimiter
+from ai_digitization import ocr_worker
+from ai_digitization.preprocessing import ImagePreprocessor
+from ocr.tesseract_engine import DEFAULT_PROFILE as DEFAULT_TESSERACT_PROFILE, PROFILES as TESSERACT_PROFILES
+from ocr.word_boxes import word_boxes_path
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -58,13 +71,147 @@ class LogbookEntry:
     confidence_score: float
     processing_method: str
     timestamp: str
+
+# Models, prompts and engine settings; all of these are part of the result cache keys
+OPENAI_MODEL = "gpt-4o"
+
+OCR_PROMPT = "Extract all text from this handwritten logbook page. Preserve the original layout and any dates, locations, or special notations. Return only the extracted text without commentary."
+
+IMPROVE_SYSTEM_PROMPT = """You are an expert at transcribing and improving handwritten logbook entries from 1933. 
+            Your task is to clean up OCR text while preserving the original meaning and historical authenticity.
+            
+            Guidelines:
+            - Correct obvious spelling errors and OCR mistakes
+            - Preserve period-appropriate language and terminology
+            - Maintain original dates, locations, and proper nouns
+            - Fill in obvious gaps but mark uncertain additions with [?]
+            - Keep the original structure and formatting
+            - This is Ernest K. Gann's world tour logbook from 1933"""
+
+METADATA_SYSTEM_PROMPT = """Extract structured information from this 1933 logbook entry. 
+                        Return ONLY a valid JSON object with these exact keys: date_entry, location, weather, activities, people_mentioned. 
+                        Use null for missing information. Do not include any explanations or additional text."""
+
+METADATA_KEYS = ["date_entry", "location", "weather", "activities", "people_mentioned"]
+
+# Single-call alternative to IMPROVE_SYSTEM_PROMPT + METADATA_SYSTEM_PROMPT; also used for multi-page batches
+COMBINED_SYSTEM_PROMPT = IMPROVE_SYSTEM_PROMPT + """
+            
+            You will receive one or more pages, each introduced by a line like "=== PAGE p1 ===".
+            For every page return its improved text in "content", and extract date_entry, location,
+            weather, activities and people_mentioned from it. Use null for missing information.
+            Copy each page's id into "page_id" and return the pages in the order given."""
+
+_NULLABLE_STRING = {"type": ["string", "null"]}
+COMBINED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "logbook_pages",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "pages": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "page_id": {"type": "string"},
+                            "content": {"type": "string"},
+                            **{key: _NULLABLE_STRING for key in METADATA_KEYS}
+                        },
+                        "required": ["page_id", "content"] + METADATA_KEYS,
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["pages"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# Maximum number of in-flight calls per backend, shared by all concurrent pages
+DEFAULT_BACKEND_LIMITS = {
+    "tesseract": os.cpu_count() or 1,
+    "google_vision": 8,
+    "openai": 4
+}
+
+# Default per-provider budgets (requests/min, tokens/min); match these to your account quotas
+DEFAULT_RATE_LIMITS = {
+    "openai": {"requests_per_minute": 500, "tokens_per_minute": 30000},
+    "google_vision": {"requests_per_minute": 1800, "tokens_per_minute": None}
+}
+
+# Rough prompt-token cost of one image in a vision request
+IMAGE_TOKEN_ESTIMATE = 1000
+
+# List prices in USD, used only for the cost estimates in metrics.json
+OPENAI_PRICING = {
+    "gpt-4o": {"prompt_per_million": 2.50, "completion_per_million": 10.00}
+}
+GOOGLE_VISION_PRICE_PER_REQUEST = 1.50 / 1000
     
 class AIDigitizer:
     """Main digitization class with multiple AI backends."""
     
-    def __init__(self, openai_api_key: str, google_credentials_path: Optional[str] = None):
-        self.openai_client = AsyncOpenAI(api_key=openai_api_key)
-        self.spell_checker = SpellChecker()
+    def __init__(self, openai_api_key: str, google_credentials_path: Optional[str] = None,
+                 backend_limits: Optional[Dict[str, int]] = None,
+                 engine_timeout: Optional[float] = None,
+                 good_enough_confidence: Optional[float] = None,
+                 cache: Optional[ResultCache] = None,
+                 llm_mode: str = "separate",
+                 llm_batch_size: int = 1,
+                 llm_batch_max_chars: int = 1500,
+                 llm_batch_linger: float = 2.0,
+                 rate_limiters: Optional[Dict[str, ProviderRateLimiter]] = None,
+                 tesseract_workers: Optional[int] = None,
+                 tesseract_profile: str = DEFAULT_TESSERACT_PROFILE,
+                 preprocessor: Optional[ImagePreprocessor] = None,
+                 metrics: Optional[PipelineMetrics] = None,
+                 word_boxes_dir: Optional[str] = None):
+        # Retries are handled by our own rate limiters, so the client must not retry too
+        self.openai_client = AsyncOpenAI(api_key=openai_api_key, max_retries=0)
+        self.cache = cache
+        self.preprocessor = preprocessor
+        self.metrics = metrics or PipelineMetrics()
+        
+        # Local OCR runs in worker processes, one per core by default
+        self.tesseract_workers = tesseract_workers or os.cpu_count() or 1
+        if tesseract_profile not in TESSERACT_PROFILES:
+            raise ValueError(f"Unknown Tesseract profile: {tesseract_profile}")
+        self.tesseract_profile = TESSERACT_PROFILES[tesseract_profile]
+        self._ocr_pool: Optional[ProcessPoolExecutor] = None
+        # Tesseract word boxes for each page are saved here for the searchable PDF
+        self.word_boxes_dir = word_boxes_dir
+        
+        # "separate" makes two GPT calls per page (improve, then metadata); "combined"
+        # makes one structured-output call. Batching packs short pages into one call.
+        self.llm_mode = "combined" if llm_batch_size > 1 else llm_mode
+        self.llm_batch_max_chars = llm_batch_max_chars
+        self.llm_batcher = None
+        if llm_batch_size > 1:
+            self.llm_batcher = LLMBatcher(self._combined_request, batch_size=llm_batch_size,
+                                          linger=llm_batch_linger)
+        
+        # OCR engines race each other; slow engines are abandoned after engine_timeout
+        # seconds, or as soon as any engine reaches good_enough_confidence
+        self.engine_timeout = engine_timeout
+        self.good_enough_confidence = good_enough_confidence
+        
+        # Per-backend semaphores so concurrent pages cannot flood a single service
+        limits = dict(DEFAULT_BACKEND_LIMITS, tesseract=self.tesseract_workers)
+        limits.update(backend_limits or {})
+        self.backend_semaphores = {
+            backend: asyncio.Semaphore(max(1, limit)) for backend, limit in limits.items()
+        }
+        
+        # Shared request/token budgets with retry and backoff for the cloud providers
+        self.rate_limiters = {
+            provider: ProviderRateLimiter(provider, **budget) for provider, budget in DEFAULT_RATE_LIMITS.items()
+        }
+        self.rate_limiters.update(rate_limiters or {})
         
         # Initialize Google Vision if credentials provided
         self.google_vision = None
@@ -77,73 +224,172 @@ class AIDigitizer:
             except ImportError:
                 logger.warning("Google Cloud Vision not available, install with: pip install google-cloud-vision")
     
-    async def extract_text_tesseract(self, image_path: str) -> Tuple[str, float]:
-        """Extract text using Tesseract OCR."""
-        try:
-            img = Image.open(image_path)
-            # Optimize image for OCR
-            img = img.convert('L')  # Convert to grayscale
-            text = pytesseract.image_to_string(img, config='--psm 6')
+    async def _chat_completion(self, stage: str, **kwargs):
+        """Issue a chat completion within the OpenAI slot and rate budget, retrying transient errors."""
+        limiter = self.rate_limiters["openai"]
+        estimated_tokens = self._estimate_tokens(kwargs)
+        
+        with self.metrics.stage(stage) as sample:
+            sample["bytes_uploaded"] = len(json.dumps(kwargs["messages"]).encode('utf-8'))
             
-            # Calculate confidence based on spelling accuracy
-            words = text.split()
-            if not words:
-                return "", 0.0
+            def create():
+                # The slot and rate budget are ours from here on
+                self.metrics.end_queue(sample)
+                return self.openai_client.chat.completions.create(**kwargs)
             
-            misspelled = self.spell_checker.unknown(words)
-            confidence = max(0.0, 1.0 - (len(misspelled) / len(words)))
+            async with self.backend_semaphores["openai"]:
+                response = await limiter.call(create, estimated_tokens=estimated_tokens)
             
-            return text.strip(), confidence
+            usage = getattr(response, 'usage', None)
+            limiter.record_tokens(getattr(usage, 'total_tokens', None) or estimated_tokens, estimated_tokens)
+            sample["prompt_tokens"] = getattr(usage, 'prompt_tokens', None) or 0
+            sample["completion_tokens"] = getattr(usage, 'completion_tokens', None) or 0
+            pricing = OPENAI_PRICING.get(kwargs.get("model"), {})
+            sample["cost_usd"] = (sample["prompt_tokens"] * pricing.get("prompt_per_million", 0)
+                                  + sample["completion_tokens"] * pricing.get("completion_per_million", 0)) / 1e6
+        return response
+    
+    @staticmethod
+    def _estimate_tokens(request: Dict) -> int:
+        """Estimate prompt plus completion tokens for a chat request (about 4 characters per token)."""
+        characters = 0
+        images = 0
+        for message in request.get("messages", []):
+            content = message.get("content")
+            if isinstance(content, str):
+                characters += len(content)
+                continue
+            for part in content or []:
+                if part.get("type") == "text":
+                    characters += len(part.get("text", ""))
+                else:
+                    images += 1
+        prompt_tokens = characters // 4 + images * IMAGE_TOKEN_ESTIMATE
+        return prompt_tokens + request.get("max_tokens", prompt_tokens)
+    
+    async def _cached_ocr(self, image_path: str, engine: str, model: str, prompt: str,
+                          run: Callable, refresh: bool = False) -> Tuple[str, float]:
+        """
+        Return a cached OCR result for this image and engine, or run the engine and cache it.
+        
+        With refresh=True the engine always runs and its result replaces the cached one.
+        """
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key("ocr", self.cache.file_digest(image_path), engine, model, prompt)
+            cached = None if refresh else self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"{engine}: cache hit for {Path(image_path).name}")
+                return cached["text"], cached["confidence"]
+        
+        text, confidence = await run()
+        
+        if cache_key:
+            self.cache.set(cache_key, {"text": text, "confidence": confidence})
+        return text, confidence
+    
+    async def extract_text_tesseract(self, image_path: str, boxes_path: Optional[str] = None) -> Tuple[str, float]:
+        """Extract text using Tesseract OCR, saving word boxes to boxes_path if given."""
+        async def run():
+            with self.metrics.stage("tesseract") as sample:
+                async with self.backend_semaphores["tesseract"]:
+                    self.metrics.end_queue(sample)
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self._get_ocr_pool(), ocr_worker.tesseract_ocr,
+                                                      image_path, self.tesseract_profile.name, boxes_path)
+        
+        try:
+            # Word boxes are only written when Tesseract runs, so a cached result cannot supply missing ones
+            return await self._cached_ocr(image_path, "tesseract", "tesseract",
+                                          self.tesseract_profile.cache_key, run,
+                                          refresh=bool(boxes_path) and not os.path.exists(boxes_path))
         except Exception as e:
             logger.error(f"Tesseract OCR failed for {image_path}: {e}")
             return "", 0.0
     
+    def _get_ocr_pool(self) -> ProcessPoolExecutor:
+        """Start the Tesseract worker pool on first use."""
+        if self._ocr_pool is None:
+            self._ocr_pool = ProcessPoolExecutor(max_workers=self.tesseract_workers,
+                                                 initializer=ocr_worker.init_worker,
+                                                 initargs=(self.tesseract_profile.name,))
+        return self._ocr_pool
+    
+    def close(self) -> None:
+        """Shut down the Tesseract worker pool."""
+        if self._ocr_pool is not None:
+            self._ocr_pool.shutdown()
+            self._ocr_pool = None
+    
     async def extract_text_google_vision(self, image_path: str) -> Tuple[str, float]:
         """Extract text using Google Cloud Vision API."""
         if not self.google_vision:
             return "", 0.0
         
+        async def run():
+            # The Vision client is blocking, so run it off the event loop
+            with self.metrics.stage("google_vision") as sample:
+                loop = asyncio.get_running_loop()
+                
+                def detect():
+                    # The slot and rate budget are ours from here on
+                    self.metrics.end_queue(sample)
+                    return loop.run_in_executor(None, self._google_vision_ocr, image_path)
+                
+                async with self.backend_semaphores["google_vision"]:
+                    result = await self.rate_limiters["google_vision"].call(detect)
+                sample["bytes_uploaded"] = os.path.getsize(image_path)
+                sample["cost_usd"] = GOOGLE_VISION_PRICE_PER_REQUEST
+                return result
+        
         try:
-            with open(image_path, 'rb') as image_file:
-                content = image_file.read()
-            
-            # Use the current Google Vision API syntax
-            from google.cloud import vision
-            image = vision.Image(content=content)
-            response = self.google_vision.text_detection(image=image)
-            
-            if response.text_annotations:
-                text = response.text_annotations[0].description
-                # Google Vision provides inherent confidence
-                confidence = min(1.0, len(text) / 100)  # Rough confidence based on text length
-                return text.strip(), confidence
-            
-            return "", 0.0
+            return await self._cached_ocr(image_path, "google_vision", "text_detection", "", run)
         except Exception as e:
             logger.error(f"Google Vision failed for {image_path}: {e}")
             return "", 0.0
     
+    def _google_vision_ocr(self, image_path: str) -> Tuple[str, float]:
+        """Run a blocking Google Vision text detection request."""
+        with open(image_path, 'rb') as image_file:
+            content = image_file.read()
+        
+        # Use the current Google Vision API syntax
+        from google.cloud import vision
+        image = vision.Image(content=content)
+        response = self.google_vision.text_detection(image=image)
+        if response.error.message:
+            raise RuntimeError(f"Google Vision error: {response.error.message}")
+        
+        if response.text_annotations:
+            text = response.text_annotations[0].description
+            # Google Vision provides inherent confidence
+            confidence = min(1.0, len(text) / 100)  # Rough confidence based on text length
+            return text.strip(), confidence
+        
+        return "", 0.0
+    
     async def extract_text_openai_vision(self, image_path: str) -> Tuple[str, float]:
         """Extract text using OpenAI GPT-4 Vision."""
-        try:
+        async def run():
             with open(image_path, 'rb') as image_file:
                 import base64
                 base64_image = base64.b64encode(image_file.read()).decode('utf-8')
             
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-4o",
+            response = await self._chat_completion(
+                "openai_vision",
+                model=OPENAI_MODEL,
                 messages=[
                     {
                         "role": "user",
                         "content": [
                             {
                                 "type": "text", 
-                                "text": "Extract all text from this handwritten logbook page. Preserve the original layout and any dates, locations, or special notations. Return only the extracted text without commentary."
+                                "text": OCR_PROMPT
                             },
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/png;base64,{base64_image}"
+                                    "url": f"data:{ImagePreprocessor.mime_type(image_path)};base64,{base64_image}"
                                 }
                             }
                         ]
@@ -156,49 +402,58 @@ class AIDigitizer:
             # OpenAI Vision typically has high accuracy for clear images
             confidence = 0.85 if len(text) > 50 else 0.6
             return text.strip(), confidence
+        
+        try:
+            return await self._cached_ocr(image_path, "openai_vision", OPENAI_MODEL, OCR_PROMPT, run)
         except Exception as e:
             logger.error(f"OpenAI Vision failed for {image_path}: {e}")
             return "", 0.0
     
     async def improve_text_with_gpt4(self, text: str, context: str = "") -> str:
         """Enhance extracted text using GPT-4."""
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key("improve", OPENAI_MODEL, IMPROVE_SYSTEM_PROMPT, text, context)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached["text"]
+        
         try:
-            system_prompt = """You are an expert at transcribing and improving handwritten logbook entries from 1933. 
-            Your task is to clean up OCR text while preserving the original meaning and historical authenticity.
-            
-            Guidelines:
-            - Correct obvious spelling errors and OCR mistakes
-            - Preserve period-appropriate language and terminology
-            - Maintain original dates, locations, and proper nouns
-            - Fill in obvious gaps but mark uncertain additions with [?]
-            - Keep the original structure and formatting
-            - This is Ernest K. Gann's world tour logbook from 1933"""
-            
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-4o",
+            response = await self._chat_completion(
+                "gpt_improve",
+                model=OPENAI_MODEL,
                 messages=[
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": IMPROVE_SYSTEM_PROMPT},
                     {"role": "user", "content": f"Raw OCR text to improve:\n\n{text}\n\nContext: {context}"}
                 ],
                 temperature=0.3
             )
             
-            return response.choices[0].message.content.strip()
+            improved_text = response.choices[0].message.content.strip()
+            if cache_key:
+                self.cache.set(cache_key, {"text": improved_text})
+            return improved_text
         except Exception as e:
             logger.error(f"GPT-4 improvement failed: {e}")
             return text
     
     async def extract_metadata(self, improved_text: str) -> Dict[str, Optional[str]]:
         """Extract structured metadata from improved text."""
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key("metadata", OPENAI_MODEL, METADATA_SYSTEM_PROMPT, improved_text)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
         try:
-            response = await self.openai_client.chat.completions.create(
-                model="gpt-4o",
+            response = await self._chat_completion(
+                "gpt_metadata",
+                model=OPENAI_MODEL,
                 messages=[
                     {
                         "role": "system", 
-                        "content": """Extract structured information from this 1933 logbook entry. 
-                        Return ONLY a valid JSON object with these exact keys: date_entry, location, weather, activities, people_mentioned. 
-                        Use null for missing information. Do not include any explanations or additional text."""
+                        "content": METADATA_SYSTEM_PROMPT
                     },
                     {"role": "user", "content": f"Extract metadata from this logbook entry:\n\n{improved_text}"}
                 ],
@@ -215,7 +470,10 @@ class AIDigitizer:
             else:
                 json_text = response_text
             
-            return json.loads(json_text)
+            metadata = json.loads(json_text)
+            if cache_key:
+                self.cache.set(cache_key, metadata)
+            return metadata
         except json.JSONDecodeError as e:
             logger.error(f"JSON parsing failed: {e}. Response was: {response_text[:200]}...")
             return {"date_entry": None, "location": None, "weather": None, "activities": None, "people_mentioned": None}
@@ -223,35 +481,105 @@ class AIDigitizer:
             logger.error(f"Metadata extraction failed: {e}")
             return {"date_entry": None, "location": None, "weather": None, "activities": None, "people_mentioned": None}
     
+    async def improve_and_extract(self, text: str, context: str = "") -> Tuple[str, Dict[str, Optional[str]]]:
+        """Improve text and extract its metadata with a single GPT-4 call."""
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key("combined", OPENAI_MODEL, COMBINED_SYSTEM_PROMPT, text, context)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached["content"], cached["metadata"]
+        
+        result = None
+        # Short pages share a request with other pages that are in flight
+        if self.llm_batcher and not context and len(text) <= self.llm_batch_max_chars:
+            try:
+                result = await self.llm_batcher.submit(text)
+            except Exception as e:
+                logger.warning(f"Batched GPT-4 cleanup failed, retrying page on its own: {e}")
+        
+        if result is None:
+            try:
+                result = (await self._combined_request([text], context))[0]
+            except Exception as e:
+                logger.error(f"Combined GPT-4 cleanup failed: {e}")
+                return text, {key: None for key in METADATA_KEYS}
+        
+        improved_text, metadata = result
+        if cache_key:
+            self.cache.set(cache_key, {"content": improved_text, "metadata": metadata})
+        return improved_text, metadata
+    
+    async def _combined_request(self, texts: List[str], context: str = "") -> List[Tuple[str, Dict[str, Optional[str]]]]:
+        """Send one or more pages in a single structured-output request."""
+        page_ids = [f"p{i}" for i in range(1, len(texts) + 1)]
+        pages = "\n\n".join(f"=== PAGE {page_id} ===\n{text}" for page_id, text in zip(page_ids, texts))
+        
+        response = await self._chat_completion(
+            "gpt_combined",
+            model=OPENAI_MODEL,
+            messages=[
+                {"role": "system", "content": COMBINED_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Raw OCR text to improve:\n\n{pages}\n\nContext: {context}"}
+            ],
+            temperature=0.3,
+            response_format=COMBINED_RESPONSE_FORMAT
+        )
+        
+        data = json.loads(response.choices[0].message.content)
+        returned = {page.get("page_id"): page for page in data.get("pages", [])}
+        
+        results = []
+        for page_id, text in zip(page_ids, texts):
+            if page_id not in returned:
+                raise ValueError(f"Response is missing page {page_id}")
+            page = returned[page_id]
+            improved_text = (page.get("content") or "").strip() or text
+            results.append((improved_text, {key: page.get(key) for key in METADATA_KEYS}))
+        return results
+    
     async def process_image(self, image_path: str) -> LogbookEntry:
         """Process a single image through the complete pipeline."""
         logger.info(f"Processing {image_path}")
         
+        # Tesseract gets a cleaned-up page and the cloud engines a smaller upload
+        tesseract_input, cloud_input = await self._prepare_inputs(image_path)
+        
         # Try multiple OCR methods and pick the best result
+        tesseract = self.extract_text_tesseract
+        if self.word_boxes_dir:
+            tesseract = partial(tesseract, boxes_path=word_boxes_path(self.word_boxes_dir, image_path))
         methods = [
-            ("tesseract", self.extract_text_tesseract),
-            ("google_vision", self.extract_text_google_vision),
-            ("openai_vision", self.extract_text_openai_vision)
+            ("tesseract", tesseract, tesseract_input),
+            ("google_vision", self.extract_text_google_vision, cloud_input),
+            ("openai_vision", self.extract_text_openai_vision, cloud_input)
         ]
         
+        results = await self._race_ocr_engines(image_path, methods)
+        
+        # Pick the best result, preferring earlier engines on ties
         best_text = ""
         best_confidence = 0.0
         best_method = "none"
         
-        for method_name, method_func in methods:
-            text, confidence = await method_func(image_path)
-            logger.info(f"{method_name}: confidence={confidence:.2f}, length={len(text)}")
-            
+        for method_name, _, _ in methods:
+            if method_name not in results:
+                continue
+            text, confidence = results[method_name]
             if confidence > best_confidence:
                 best_text = text
                 best_confidence = confidence
                 best_method = method_name
         
-        # Improve the best result with GPT-4
-        improved_text = await self.improve_text_with_gpt4(best_text)
-        
-        # Extract metadata
-        metadata = await self.extract_metadata(improved_text)
+        if self.llm_mode == "combined":
+            # Improve the best result and extract metadata in one GPT-4 call
+            improved_text, metadata = await self.improve_and_extract(best_text)
+        else:
+            # Improve the best result with GPT-4
+            improved_text = await self.improve_text_with_gpt4(best_text)
+            
+            # Extract metadata
+            metadata = await self.extract_metadata(improved_text)
         
         # Create logbook entry
         entry = LogbookEntry(
@@ -269,12 +597,121 @@ class AIDigitizer:
         logger.info(f"Completed {image_path} - Method: {best_method}, Confidence: {best_confidence:.2f}")
         return entry
     
+    async def _prepare_inputs(self, image_path: str) -> Tuple[str, str]:
+        """Return the (Tesseract, cloud) input paths for a page, falling back to the original image."""
+        if not self.preprocessor:
+            return image_path, image_path
+        
+        try:
+            digest = self.cache.file_digest(image_path) if self.cache else file_sha256(image_path)
+            with self.metrics.stage("preprocess"):
+                variants = await self.preprocessor.prepare(image_path, digest, self._get_ocr_pool())
+            return variants["tesseract"], variants["cloud"]
+        except Exception as e:
+            logger.warning(f"Preprocessing failed for {image_path}, using the original image: {e}")
+            return image_path, image_path
+    
+    async def _run_ocr_engine(self, method_name: str, method_func: Callable, image_path: str) -> Tuple[str, float]:
+        """Run one OCR engine, giving up after the per-engine timeout."""
+        try:
+            if self.engine_timeout:
+                return await asyncio.wait_for(method_func(image_path), timeout=self.engine_timeout)
+            return await method_func(image_path)
+        except asyncio.TimeoutError:
+            logger.warning(f"{method_name} timed out after {self.engine_timeout}s for {image_path}")
+            return "", 0.0
+    
+    async def _race_ocr_engines(self, image_path: str, methods: List[Tuple[str, Callable, str]]) -> Dict[str, Tuple[str, float]]:
+        """
+        Launch all OCR engines at once and collect their results as they finish.
+        
+        If good_enough_confidence is set, the engines still running are cancelled
+        as soon as one result reaches it.
+        """
+        tasks = {
+            asyncio.create_task(self._run_ocr_engine(method_name, method_func, engine_input)): method_name
+            for method_name, method_func, engine_input in methods
+        }
+        results = {}
+        pending = set(tasks)
+        
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    method_name = tasks[task]
+                    text, confidence = task.result()
+                    results[method_name] = (text, confidence)
+                    logger.info(f"{method_name}: confidence={confidence:.2f}, length={len(text)}")
+                
+                if (pending and self.good_enough_confidence is not None and
+                        any(confidence >= self.good_enough_confidence for _, confidence in results.values())):
+                    logger.info(f"Good-enough result for {image_path}, cancelling "
+                                f"{', '.join(sorted(tasks[task] for task in pending))}")
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        
+        return results
+    
     def _extract_page_number(self, filename: str) -> Optional[int]:
         """Extract page number from filename if possible."""
         import re
         match = re.search(r'(\d+)', filename)
         return int(match.group(1)) if match else None
 
+async def process_pages(digitizer: AIDigitizer, png_files: List[Path], concurrency: int = 1,
+                        on_complete: Optional[Callable] = None,
+                        collect_results: bool = True) -> List[Tuple[Path, Optional[LogbookEntry], Optional[Exception]]]:
+    """
+    Run pages through a bounded pool of worker tasks.
+    
+    Pages complete in any order, but the returned list of (png_file, entry, error)
+    tuples is always in the same order as png_files. on_complete is called with the
+    same tuple as each page finishes. With collect_results=False nothing is kept
+    and an empty list is returned, so on_complete must persist each result.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for index, png_file in enumerate(png_files):
+        queue.put_nowait((index, png_file))
+    
+    results: List[Optional[Tuple[Path, Optional[LogbookEntry], Optional[Exception]]]] = (
+        [None] * len(png_files) if collect_results else [])
+    completed = 0
+    
+    async def worker():
+        nonlocal completed
+        while True:
+            try:
+                index, png_file = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            
+            try:
+                result = (png_file, await digitizer.process_image(str(png_file)), None)
+            except Exception as e:
+                logger.error(f"Failed to process {png_file}: {e}")
+                result = (png_file, None, e)
+            
+            if on_complete:
+                try:
+                    on_complete(*result)
+                except Exception as e:
+                    logger.error(f"Failed to save results for {png_file}: {e}")
+                    result = (png_file, None, e)
+            
+            if collect_results:
+                results[index] = result
+            completed += 1
+            logger.info(f"Progress: {completed}/{len(png_files)} ({completed/len(png_files)*100:.1f}%)")
+    
+    worker_count = max(1, min(concurrency, len(png_files)))
+    await asyncio.gather(*(worker() for _ in range(worker_count)))
+    return results
+
 async def main():
     """Main processing function."""
     parser = argparse.ArgumentParser(description="Digitize Ernest K. Gann 1933 Logbook")
@@ -283,6 +720,50 @@ async def main():
     parser.add_argument("--openai-key", help="OpenAI API key (or set OPENAI_API_KEY env var)")
     parser.add_argument("--google-credentials", help="Path to Google Cloud credentials JSON")
     parser.add_argument("--max-files", type=int, help="Maximum number of files to process")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of pages processed at the same time")
+    parser.add_argument("--tesseract-workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes for local Tesseract OCR")
+    parser.add_argument("--tesseract-profile", choices=sorted(TESSERACT_PROFILES), default=DEFAULT_TESSERACT_PROFILE,
+                        help="Tesseract settings: 'regions' OCRs each detected text region, "
+                             "'block' the whole page as one block (the old --psm 6)")
+    parser.add_argument("--no-word-boxes", action="store_true",
+                        help="Do not save Tesseract word boxes (used for the searchable PDF's text layer)")
+    parser.add_argument("--openai-concurrency", type=int, default=DEFAULT_BACKEND_LIMITS["openai"],
+                        help="Maximum in-flight OpenAI requests across all pages")
+    parser.add_argument("--google-concurrency", type=int, default=DEFAULT_BACKEND_LIMITS["google_vision"],
+                        help="Maximum in-flight Google Vision requests across all pages")
+    parser.add_argument("--openai-rpm", type=int, default=DEFAULT_RATE_LIMITS["openai"]["requests_per_minute"],
+                        help="OpenAI requests-per-minute budget")
+    parser.add_argument("--openai-tpm", type=int, default=DEFAULT_RATE_LIMITS["openai"]["tokens_per_minute"],
+                        help="OpenAI tokens-per-minute budget")
+    parser.add_argument("--google-rpm", type=int, default=DEFAULT_RATE_LIMITS["google_vision"]["requests_per_minute"],
+                        help="Google Vision requests-per-minute budget")
+    parser.add_argument("--max-retries", type=int, default=5,
+                        help="Retries for rate-limited (429) or failed (5xx) API calls before falling back")
+    parser.add_argument("--engine-timeout", type=float, default=120.0,
+                        help="Seconds to wait for each OCR engine before giving up on it")
+    parser.add_argument("--good-enough", type=float,
+                        help="Cancel slower OCR engines once one reaches this confidence (e.g. 0.9)")
+    parser.add_argument("--cache-dir", help="Directory for cached OCR/GPT results (default: <output-dir>/.cache)")
+    parser.add_argument("--cache-size-mb", type=int, default=1024, help="Maximum cache size before old entries are evicted")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the result cache entirely")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached results but store fresh ones")
+    parser.add_argument("--no-preprocess", action="store_true",
+                        help="Send original images to every engine instead of preprocessed variants")
+    parser.add_argument("--cloud-max-side", type=int, default=2048,
+                        help="Longest edge in pixels of images uploaded to cloud engines")
+    parser.add_argument("--cloud-format", choices=["jpeg", "webp"], default="jpeg",
+                        help="Encoding of images uploaded to cloud engines")
+    parser.add_argument("--llm-mode", choices=["separate", "combined"], default="separate",
+                        help="Use two GPT calls per page (improve, then metadata) or one combined call")
+    parser.add_argument("--llm-batch-size", type=int, default=1,
+                        help="Pack up to this many short pages into one combined GPT call (implies --llm-mode combined)")
+    parser.add_argument("--llm-batch-max-chars", type=int, default=1500,
+                        help="Pages with longer OCR text than this are never batched")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip pages recorded in the run journal by a previous run and rebuild outputs from it")
+    parser.add_argument("--logbook-interval", type=int, default=25,
+                        help="Rebuild complete_logbook.json after every N finished pages (0 = only at the end)")
     
     args = parser.parse_args()
     
@@ -296,73 +777,161 @@ async def main():
     # Get Google credentials path from environment if not specified
     google_credentials = args.google_credentials or os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
     
-    # Initialize digitizer
-    digitizer = AIDigitizer(openai_key, google_credentials)
-    
     # Create output directory
     output_dir = Path(args.output_dir)
     output_dir.mkdir(exist_ok=True)
     
+    # Set up the result cache
+    cache = ResultCache(
+        args.cache_dir or str(output_dir / ".cache"),
+        max_bytes=args.cache_size_mb * 1024 * 1024,
+        enabled=not args.no_cache,
+        refresh=args.refresh
+    )
+    
+    # Page variants live next to the result cache and are reused across runs
+    preprocessor = None
+    if not args.no_preprocess:
+        preprocessor = ImagePreprocessor(
+            str(Path(args.cache_dir or output_dir / ".cache") / "variants"),
+            max_side=args.cloud_max_side,
+            cloud_format=args.cloud_format
+        )
+    
+    # Initialize digitizer
+    digitizer = AIDigitizer(
+        openai_key,
+        google_credentials,
+        backend_limits={
+            "openai": args.openai_concurrency,
+            "google_vision": args.google_concurrency
+        },
+        engine_timeout=args.engine_timeout,
+        good_enough_confidence=args.good_enough,
+        cache=cache,
+        llm_mode=args.llm_mode,
+        llm_batch_size=args.llm_batch_size,
+        llm_batch_max_chars=args.llm_batch_max_chars,
+        rate_limiters={
+            "openai": ProviderRateLimiter("openai", args.openai_rpm, args.openai_tpm, max_retries=args.max_retries),
+            "google_vision": ProviderRateLimiter("google_vision", args.google_rpm, max_retries=args.max_retries)
+        },
+        tesseract_workers=args.tesseract_workers,
+        tesseract_profile=args.tesseract_profile,
+        preprocessor=preprocessor,
+        word_boxes_dir=None if args.no_word_boxes else str(output_dir / "word_boxes")
+    )
+    
     # Get PNG files
     input_dir = Path(args.input_dir)
-    png_files = list(input_dir.glob("*.png"))
+    png_files = sorted(input_dir.glob("*.png"),
+                       key=lambda p: (digitizer._extract_page_number(p.name) or 0, p.name))
     
     if args.max_files:
         png_files = png_files[:args.max_files]
     
+    # Every finished page is checkpointed to the journal; --resume skips pages already in it
+    journal = RunJournal(str(output_dir / "run_journal.jsonl"))
+    journal.start(resume=args.resume)
+    pending_files = [png_file for png_file in png_files if png_file.name not in journal.offsets]
+    if args.resume:
+        logger.info(f"Resuming: {len(png_files) - len(pending_files)} pages already complete, "
+                    f"{len(pending_files)} remaining")
+    
     # Initialize tracking variables
     start_time = datetime.now()
-    entries = []
-    failed_files = []
-    processing_stats = {
-        "tesseract": 0,
-        "google_vision": 0,
-        "openai_vision": 0,
-        "failed": 0
-    }
-    confidence_scores = []
+    page_names = [png_file.name for png_file in png_files]
+    failures = {}
+    saved_pages = 0
     
     logger.info(f"Starting processing of {len(png_files)} PNG files at {start_time}")
     logger.info(f"Output directory: {output_dir.absolute()}")
+    logger.info(f"Concurrency: {args.concurrency} page(s) in flight")
+    
+    def write_master_dataset(processing_date: datetime) -> Tuple[Dict, Dict]:
+        """Rebuild complete_logbook.json from the journal; returns (summary, processing stats)."""
+        with digitizer.metrics.stage("logbook_write"):
+            return build_master_dataset(processing_date)
+    
+    def build_master_dataset(processing_date: datetime) -> Tuple[Dict, Dict]:
+        summary = summarize_entries(journal.iter_entries(page_names))
+        processing_stats = {
+            "tesseract": 0,
+            "google_vision": 0,
+            "openai_vision": 0,
+            "failed": len(failures)
+        }
+        for method, count in summary["method_counts"].items():
+            processing_stats[method] = processing_stats.get(method, 0) + count
+        
+        attempted = summary["total_entries"] + len(failures)
+        metadata = {
+            "total_entries": summary["total_entries"],
+            "processing_date": processing_date.isoformat(),
+            "source": "Ernest K. Gann 1933 World Tour Logbook",
+            "processing_stats": processing_stats,
+            "success_rate": (summary["total_entries"] / attempted * 100) if attempted > 0 else 0,
+            "average_confidence": summary["confidence_average"]
+        }
+        write_complete_logbook(str(output_dir / "complete_logbook.json"), metadata,
+                               journal.iter_entries(page_names))
+        return summary, processing_stats
+    
+    def record_failure(png_file: Path, error: Optional[Exception]):
+        failures[png_file.name] = {
+            "filename": png_file.name,
+            "error": str(error),
+            "timestamp": datetime.now().isoformat()
+        }
     
-    # Process files
-    for i, png_file in enumerate(png_files, 1):
-        logger.info(f"Progress: {i}/{len(png_files)} ({i/len(png_files)*100:.1f}%)")
+    def save_entry(png_file: Path, entry: Optional[LogbookEntry], error: Optional[Exception]):
+        """Write per-page files as soon as a page finishes."""
+        nonlocal saved_pages
+        if entry is None:
+            record_failure(png_file, error)
+            return
         try:
-            entry = await digitizer.process_image(str(png_file))
-            entries.append(entry)
-            
-            # Update statistics
-            processing_stats[entry.processing_method] += 1
-            confidence_scores.append(entry.confidence_score)
-            
-            # Save individual entry
-            entry_file = output_dir / f"{entry.filename.replace('.png', '.json')}"
-            with open(entry_file, 'w', encoding='utf-8') as f:
-                json.dump(asdict(entry), f, indent=2, ensure_ascii=False)
-            
-            # Save text version
-            text_file = output_dir / f"{entry.filename.replace('.png', '.txt')}"
-            with open(text_file, 'w', encoding='utf-8') as f:
-                f.write(entry.content)
+            with digitizer.metrics.stage("file_write"):
+                entry_data = asdict(entry)
+                # Save individual entry and text version
+                stem = output_dir / entry.filename.replace('.png', '')
+                Path(f"{stem}.json").write_text(json.dumps(entry_data, indent=2, ensure_ascii=False), encoding='utf-8')
+                Path(f"{stem}.txt").write_text(entry.content, encoding='utf-8')
                 
+                # Checkpoint last, so a journaled page always has its per-page files
+                journal.record(entry_data)
         except Exception as e:
-            error_msg = f"Failed to process {png_file}: {e}"
-            logger.error(error_msg)
-            failed_files.append({
-                "filename": png_file.name,
-                "error": str(e),
-                "timestamp": datetime.now().isoformat()
-            })
-            processing_stats["failed"] += 1
+            logger.error(f"Failed to save results for {png_file}: {e}")
+            record_failure(png_file, e)
+            return
+        
+        saved_pages += 1
+        # Keep the website's master file current while the run is in progress
+        if args.logbook_interval and saved_pages % args.logbook_interval == 0:
+            write_master_dataset(datetime.now())
     
-    # Calculate final statistics
+    # Process files; entries are not kept in memory, the journal holds them
+    try:
+        await process_pages(digitizer, pending_files, args.concurrency, on_complete=save_entry,
+                            collect_results=False)
+    finally:
+        journal.close()
+        digitizer.close()
+    
+    # Save complete dataset, streamed from the journal in page order
     end_time = datetime.now()
+    summary, processing_stats = write_master_dataset(end_time)
+    failed_files = [failures[name] for name in page_names if name in failures]
+    
+    # Calculate final statistics
     total_time = end_time - start_time
-    successful_files = len(entries)
+    successful_files = summary["total_entries"]
     total_files = len(png_files)
     success_rate = (successful_files / total_files * 100) if total_files > 0 else 0
-    avg_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0
+    avg_confidence = summary["confidence_average"]
+    
+    # Per-stage latency, traffic, token and cost figures
+    stage_metrics = digitizer.metrics.summary()
     
     # Create comprehensive report
     report = {
@@ -378,13 +947,16 @@ async def main():
         },
         "method_statistics": processing_stats,
         "confidence_distribution": {
-            "min": min(confidence_scores) if confidence_scores else 0,
-            "max": max(confidence_scores) if confidence_scores else 0,
+            "min": summary["confidence_min"] or 0,
+            "max": summary["confidence_max"] or 0,
             "average": round(avg_confidence, 3),
-            "high_confidence_files": len([c for c in confidence_scores if c >= 0.9]),
-            "medium_confidence_files": len([c for c in confidence_scores if 0.7 <= c < 0.9]),
-            "low_confidence_files": len([c for c in confidence_scores if c < 0.7])
+            "high_confidence_files": summary["high_confidence_files"],
+            "medium_confidence_files": summary["medium_confidence_files"],
+            "low_confidence_files": summary["low_confidence_files"]
         },
+        "cache": cache.get_stats(),
+        "rate_limits": {provider: limiter.get_stats() for provider, limiter in digitizer.rate_limiters.items()},
+        "stage_metrics": stage_metrics,
         "failed_files": failed_files
     }
     
@@ -393,6 +965,9 @@ async def main():
     with open(report_file, 'w', encoding='utf-8') as f:
         json.dump(report, f, indent=2, ensure_ascii=False)
     
+    # Save machine-readable metrics
+    digitizer.metrics.write(str(output_dir / "metrics.json"))
+    
     # Save failed files list
     if failed_files:
         failed_file = output_dir / "failed_files.json"
@@ -407,22 +982,6 @@ async def main():
             for fail in failed_files:
                 f.write(f"{fail['filename']}: {fail['error']}\n")
     
-    # Save complete dataset
-    complete_data = {
-        "metadata": {
-            "total_entries": successful_files,
-            "processing_date": end_time.isoformat(),
-            "source": "Ernest K. Gann 1933 World Tour Logbook",
-            "processing_stats": processing_stats,
-            "success_rate": success_rate,
-            "average_confidence": avg_confidence
-        },
-        "entries": [asdict(entry) for entry in entries]
-    }
-    
-    with open(output_dir / "complete_logbook.json", 'w', encoding='utf-8') as f:
-        json.dump(complete_data, f, indent=2, ensure_ascii=False)
-    
     # Generate detailed summary log
     summary_log = output_dir / "processing_summary.txt"
     with open(summary_log, 'w', encoding='utf-8') as f:
@@ -471,7 +1030,10 @@ async def main():
     logger.info(f"Output files:")
     logger.info(f"  • Master dataset: complete_logbook.json")
     logger.info(f"  • Processing report: processing_report.json")
+    logger.info(f"  • Stage metrics: metrics.json (estimated cost ${stage_metrics['totals']['cost_usd']:.2f})")
     logger.info(f"  • Summary: processing_summary.txt")
+    if digitizer.word_boxes_dir:
+        logger.info(f"  • Word boxes: word_boxes/ (for pdf_aggregator.py --word-boxes)")
     logger.info(f"  • Individual files: {successful_files} JSON + TXT files")
     logger.info(f"Output directory: {output_dir.absolute()}")
     logger.info(f"="*60)
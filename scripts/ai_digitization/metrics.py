@@ -0,0 +1,136 @@
+"""
+Per-stage cost and latency metrics for the AI digitization pipeline.
+
+Every stage of a page (preprocessing, each OCR engine, each GPT call, file
+writes) records a sample with its wall time and, where it applies, the bytes
+uploaded, prompt and completion tokens and estimated cost in dollars. Samples
+are aggregated into totals and p50/p95 latencies per stage for the processing
+report and for metrics.json. Time spent waiting for a backend slot or rate
+budget is recorded separately as queue time, so latencies measure only the
+engine or API call itself.
+"""
+
+import json
+import math
+import time
+import asyncio
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+SAMPLE_FIELDS = ('bytes_uploaded', 'prompt_tokens', 'completion_tokens', 'cost_usd')
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values), max(1, math.ceil(fraction * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+class PipelineMetrics:
+    """Collects timing, traffic, token and cost samples per pipeline stage."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._durations: Dict[str, List[float]] = {}
+        self._queue_waits: Dict[str, List[float]] = {}
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, float]]:
+        """
+        Time a block of work as one sample of a stage.
+
+        The yielded dict can be filled in with any of bytes_uploaded,
+        prompt_tokens, completion_tokens and cost_usd. Works around awaits too,
+        since only wall time is measured.
+
+        Args:
+            name (str): Stage name, e.g. 'tesseract' or 'gpt_improve'
+        """
+        sample = {field: 0 for field in SAMPLE_FIELDS}
+        started = time.monotonic()
+        sample['_started'] = started
+        outcome = 'ok'
+        try:
+            yield sample
+        except asyncio.CancelledError:
+            # Engines abandoned by the OCR race are counted but not timed
+            outcome = 'cancelled'
+            raise
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            queue_seconds = sample.get('queue_seconds', 0.0)
+            fields = {field: sample[field] for field in SAMPLE_FIELDS}
+            self.record(name, time.monotonic() - started - queue_seconds, outcome,
+                        queue_seconds=queue_seconds, **fields)
+
+    @staticmethod
+    def end_queue(sample: Dict[str, float]) -> None:
+        """
+        Mark the end of a stage's wait for a backend slot or rate budget.
+
+        Call it right where the engine or API call starts, e.g. at the top of the
+        function given to a rate limiter. The time since the stage started is
+        recorded as queue time rather than latency. Only the first mark counts, so
+        retries of the call stay part of its latency.
+
+        Args:
+            sample (Dict[str, float]): The dict yielded by stage()
+        """
+        if 'queue_seconds' not in sample:
+            sample['queue_seconds'] = time.monotonic() - sample['_started']
+
+    def record(self, name: str, seconds: float, outcome: str = 'ok', queue_seconds: float = 0.0,
+               **fields: float) -> None:
+        """Add one sample to a stage."""
+        totals = self._totals.setdefault(name, {'calls': 0, 'errors': 0, 'cancelled': 0, 'seconds': 0.0,
+                                                'queue_seconds': 0.0})
+        totals['calls'] += 1
+        if outcome == 'error':
+            totals['errors'] += 1
+        elif outcome == 'cancelled':
+            totals['cancelled'] += 1
+            return
+        totals['seconds'] += seconds
+        totals['queue_seconds'] += queue_seconds
+        for field in SAMPLE_FIELDS:
+            totals[field] = totals.get(field, 0) + fields.get(field, 0)
+        self._durations.setdefault(name, []).append(seconds)
+        self._queue_waits.setdefault(name, []).append(queue_seconds)
+
+    def summary(self) -> Dict:
+        """Return per-stage totals and latency percentiles plus run-wide totals."""
+        stages = {}
+        overall = {field: 0 for field in SAMPLE_FIELDS}
+        for name, totals in self._totals.items():
+            durations = sorted(self._durations.get(name, []))
+            queue_waits = sorted(self._queue_waits.get(name, []))
+            stage = {
+                'calls': totals['calls'],
+                'errors': totals['errors'],
+                'cancelled': totals['cancelled'],
+                'total_seconds': round(totals['seconds'], 3),
+                'p50_seconds': round(percentile(durations, 0.50), 3),
+                'p95_seconds': round(percentile(durations, 0.95), 3),
+                'max_seconds': round(durations[-1], 3) if durations else 0.0,
+                'queue_seconds': round(totals['queue_seconds'], 3),
+                'queue_p95_seconds': round(percentile(queue_waits, 0.95), 3)
+            }
+            for field in SAMPLE_FIELDS:
+                value = totals.get(field, 0)
+                stage[field] = round(value, 6) if field == 'cost_usd' else int(value)
+                overall[field] += value
+            stages[name] = stage
+
+        overall['cost_usd'] = round(overall['cost_usd'], 6)
+        overall['wall_seconds'] = round(time.monotonic() - self.started, 3)
+        return {'totals': overall, 'stages': stages}
+
+    def write(self, path: str) -> None:
+        """Write the summary as JSON."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2, ensure_ascii=False)
@@ -0,0 +1,77 @@
+"""
+Process-pool workers for local Tesseract OCR.
+
+Tesseract is CPU bound, so it runs in worker processes rather than on the
+event loop. Each worker decodes the image itself (only the path crosses the
+process boundary) and keeps its own TesseractEngine, created once by the pool
+initializer, which segments the page into text regions, OCRs them one after
+another (the pool already uses every core) and scores the result by
+Tesseract's own word confidences. Word boxes can be saved from the worker too,
+so they never cross the process boundary. Boxes found on a deskewed Tesseract
+variant are mapped back onto the original page first, so the PDF text layer
+lines up with the page image.
+"""
+
+import os
+import sys
+from typing import Optional, Tuple
+
+from PIL import Image
+
+# Add the scripts directory to the path so the shared OCR engine can be imported
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ai_digitization.preprocessing import to_source_box, variant_geometry
+from ocr.tesseract_engine import DEFAULT_PROFILE, TesseractEngine
+from ocr.word_boxes import WordBoxes, write_word_boxes
+
+_engine: Optional[TesseractEngine] = None
+
+
+def init_worker(profile: str = DEFAULT_PROFILE) -> None:
+    """Create the Tesseract engine once per worker process."""
+    global _engine
+    # Pages are already spread over the pool's processes, so each OCRs its regions one at a time
+    _engine = TesseractEngine(profile, workers=1)
+
+
+def tesseract_ocr(image_path: str, profile: str = DEFAULT_PROFILE,
+                  boxes_path: Optional[str] = None) -> Tuple[str, float]:
+    """
+    OCR one image with a Tesseract profile.
+
+    Args:
+        image_path (str): Path to the image file
+        profile (str): Name of a profile in ocr.tesseract_engine.PROFILES
+        boxes_path (Optional[str]): Where to save the page's word boxes, if anywhere
+
+    Returns:
+        Tuple[str, float]: (extracted text, mean word confidence between 0 and 1)
+    """
+    if _engine is None or _engine.profile.name != profile:
+        init_worker(profile)
+
+    result = _engine.recognize(image_path)
+    if boxes_path:
+        write_word_boxes(boxes_path, source_word_boxes(image_path, result.word_boxes))
+    return result.text.strip(), result.confidence
+
+
+def source_word_boxes(image_path: str, boxes: WordBoxes) -> WordBoxes:
+    """
+    Map word boxes found on a preprocessed Tesseract variant back onto its source page.
+
+    Args:
+        image_path (str): Path of the image Tesseract read
+        boxes (WordBoxes): Word boxes in that image's pixels
+
+    Returns:
+        WordBoxes: Word boxes in the source page's pixels (unchanged for other images)
+    """
+    with Image.open(image_path) as img:
+        angle, source_size = variant_geometry(img)
+    variant_size = (boxes.width, boxes.height)
+    if not angle and source_size == variant_size:
+        return boxes
+    words = [(word, *to_source_box((left, top, right, bottom), angle, variant_size, source_size))
+             for word, left, top, right, bottom in boxes.words]
+    return WordBoxes(source_size[0], source_size[1], words)
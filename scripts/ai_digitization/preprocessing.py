@@ -0,0 +1,232 @@
+"""
+Image preprocessing stage for the AI digitization pipeline.
+
+Before OCR, each page is turned into two variants:
+
+- a deskewed, binarized grayscale PNG for Tesseract
+- a size-capped JPEG (or WebP) for the cloud engines, which cuts upload bytes,
+  request latency and vision token cost
+
+Variants are written to disk under a name derived from the source image hash
+and the preprocessing settings, so each image is only processed once. The
+heavy lifting is done by prepare_variants(), a plain function that can run in
+a worker process. The Tesseract variant records its deskew angle and source
+size, so word boxes found on it can be mapped back onto the original page.
+"""
+
+import os
+import sys
+import math
+import asyncio
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Tuple
+
+from PIL import Image, ImageOps, PngImagePlugin
+
+# Add the parent directory to the path to import other modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ocr.image_utils import otsu_threshold
+
+logger = logging.getLogger(__name__)
+
+# Bump when the variant algorithms change so stale variants are not reused
+PREPROCESS_VERSION = 2
+
+# Skew search range and step, in degrees
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_STEP = 0.25
+# Width of the thumbnail used to estimate skew
+DESKEW_THUMBNAIL_WIDTH = 600
+
+# PNG text keys recording how a Tesseract variant maps back onto its source page
+DESKEW_ANGLE_KEY = 'deskew_angle'
+SOURCE_SIZE_KEY = 'source_size'
+
+CLOUD_FORMATS = {
+    'jpeg': ('JPEG', '.jpg'),
+    'webp': ('WEBP', '.webp')
+}
+
+
+def estimate_skew(gray: Image.Image) -> float:
+    """
+    Estimate page skew in degrees using horizontal projection profiles.
+
+    Text lines produce sharply alternating dark and light rows when the page is
+    level, so the rotation that maximizes the variance of row darkness is taken
+    as the correction angle.
+    """
+    width, height = gray.size
+    if width == 0 or height == 0:
+        return 0.0
+
+    scale = min(1.0, DESKEW_THUMBNAIL_WIDTH / width)
+    thumbnail = gray.resize((max(1, int(width * scale)), max(1, int(height * scale))))
+    threshold = otsu_threshold(thumbnail)
+    # Ink becomes 255 so rotation padding (0) counts as blank paper
+    ink = thumbnail.point(lambda value: 255 if value < threshold else 0)
+
+    best_angle, best_score = 0.0, -1.0
+    steps = int(DESKEW_MAX_ANGLE / DESKEW_STEP)
+    for step in range(-steps, steps + 1):
+        angle = step * DESKEW_STEP
+        rotated = ink.rotate(angle, resample=Image.NEAREST, expand=False)
+        # Averaging each row down to one pixel gives its ink density
+        rows = list(rotated.resize((1, rotated.height), Image.BOX).getdata())
+        mean = sum(rows) / len(rows)
+        score = sum((value - mean) ** 2 for value in rows)
+        if score > best_score:
+            best_angle, best_score = angle, score
+
+    return best_angle
+
+
+def make_tesseract_variant(img: Image.Image) -> Image.Image:
+    """Return a deskewed, binarized grayscale copy of the page, with its deskew angle and source size in info."""
+    gray = ImageOps.exif_transpose(img).convert('L')
+    source_size = gray.size
+    angle = estimate_skew(gray)
+    if angle:
+        gray = gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    threshold = otsu_threshold(gray)
+    variant = gray.point(lambda value: 255 if value >= threshold else 0).convert('1')
+    variant.info[DESKEW_ANGLE_KEY] = str(angle)
+    variant.info[SOURCE_SIZE_KEY] = f"{source_size[0]}x{source_size[1]}"
+    return variant
+
+
+def variant_geometry(img: Image.Image) -> Tuple[float, Tuple[int, int]]:
+    """Return the deskew angle of a Tesseract variant and the size of the page it was made from."""
+    angle = float(img.info.get(DESKEW_ANGLE_KEY) or 0)
+    source_size = img.info.get(SOURCE_SIZE_KEY)
+    if not source_size:
+        return angle, img.size
+    width, height = source_size.split('x')
+    return angle, (int(width), int(height))
+
+
+def to_source_box(box: Tuple[int, int, int, int], angle: float, variant_size: Tuple[int, int],
+                  source_size: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    """
+    Map a (left, top, right, bottom) box on a deskewed variant back onto the source page.
+
+    The variant was rotated by angle about its center and expanded to fit, so the
+    box center is rotated back about the variant's center onto the source's. Words
+    are upright on the variant, so the box keeps its size.
+    """
+    left, top, right, bottom = box
+    theta = math.radians(angle)
+    dx = (left + right) / 2 - variant_size[0] / 2
+    dy = (top + bottom) / 2 - variant_size[1] / 2
+    center_x = dx * math.cos(theta) - dy * math.sin(theta) + source_size[0] / 2
+    center_y = dx * math.sin(theta) + dy * math.cos(theta) + source_size[1] / 2
+    half_width, half_height = (right - left) / 2, (bottom - top) / 2
+    return (max(0, round(center_x - half_width)), max(0, round(center_y - half_height)),
+            min(source_size[0], round(center_x + half_width)), min(source_size[1], round(center_y + half_height)))
+
+
+def make_cloud_variant(img: Image.Image, max_side: int) -> Image.Image:
+    """Return an RGB copy of the page no larger than max_side on its longest edge."""
+    page = ImageOps.exif_transpose(img)
+    if page.mode not in ('RGB', 'L'):
+        page = page.convert('RGB')
+    if max(page.size) > max_side:
+        page.thumbnail((max_side, max_side), Image.LANCZOS)
+    return page
+
+
+def variant_paths(variant_dir: str, source_digest: str, max_side: int, cloud_format: str, quality: int) -> Dict[str, str]:
+    """Return the on-disk locations of both variants for a source image."""
+    settings = f"v{PREPROCESS_VERSION}-{max_side}-{cloud_format}-{quality}"
+    stem = hashlib.sha256(f"{source_digest}:{settings}".encode('utf-8')).hexdigest()[:32]
+    extension = CLOUD_FORMATS[cloud_format][1]
+    return {
+        'tesseract': os.path.join(variant_dir, f"{stem}_tesseract.png"),
+        'cloud': os.path.join(variant_dir, f"{stem}_cloud{extension}")
+    }
+
+
+def prepare_variants(image_path: str, variant_dir: str, source_digest: str,
+                     max_side: int = 2048, cloud_format: str = 'jpeg', quality: int = 85) -> Dict[str, str]:
+    """
+    Create (or reuse) the Tesseract and cloud variants of an image.
+
+    The source image is decoded at most once, and only if a variant is missing.
+
+    Returns:
+        Dict[str, str]: Paths keyed by 'tesseract' and 'cloud'
+    """
+    paths = variant_paths(variant_dir, source_digest, max_side, cloud_format, quality)
+    missing = [kind for kind, path in paths.items() if not os.path.exists(path)]
+    if not missing:
+        return paths
+
+    os.makedirs(variant_dir, exist_ok=True)
+    with Image.open(image_path) as img:
+        img.load()
+        for kind in missing:
+            if kind == 'tesseract':
+                variant = make_tesseract_variant(img)
+                pnginfo = PngImagePlugin.PngInfo()
+                for key in (DESKEW_ANGLE_KEY, SOURCE_SIZE_KEY):
+                    pnginfo.add_text(key, variant.info[key])
+                save_format, save_options = 'PNG', {'optimize': True, 'pnginfo': pnginfo}
+            else:
+                variant = make_cloud_variant(img, max_side)
+                save_format, save_options = CLOUD_FORMATS[cloud_format][0], {'quality': quality}
+
+            # Write under a temporary name so a half-written variant is never picked up
+            temp_path = f"{paths[kind]}.{os.getpid()}.tmp"
+            variant.save(temp_path, format=save_format, **save_options)
+            os.replace(temp_path, paths[kind])
+
+    return paths
+
+
+class ImagePreprocessor:
+    """Produces and remembers per-page variants for the OCR engines."""
+
+    def __init__(self, variant_dir: str, max_side: int = 2048, cloud_format: str = 'jpeg', quality: int = 85):
+        """
+        Initialize the preprocessor.
+
+        Args:
+            variant_dir (str): Directory where variants are stored
+            max_side (int): Longest edge, in pixels, of the cloud variant
+            cloud_format (str): 'jpeg' or 'webp' for the cloud variant
+            quality (int): Encoder quality for the cloud variant
+        """
+        if cloud_format not in CLOUD_FORMATS:
+            raise ValueError(f"Unsupported cloud format: {cloud_format}")
+        self.variant_dir = str(Path(variant_dir))
+        self.max_side = max_side
+        self.cloud_format = cloud_format
+        self.quality = quality
+        self._variants: Dict[str, Dict[str, str]] = {}
+
+    async def prepare(self, image_path: str, source_digest: str, executor=None) -> Dict[str, str]:
+        """Return variant paths for an image, creating them in executor if needed."""
+        cached = self._variants.get(source_digest)
+        if cached and all(os.path.exists(path) for path in cached.values()):
+            return cached
+
+        loop = asyncio.get_running_loop()
+        paths = await loop.run_in_executor(
+            executor, prepare_variants, image_path, self.variant_dir, source_digest,
+            self.max_side, self.cloud_format, self.quality
+        )
+        self._variants[source_digest] = paths
+        return paths
+
+    @staticmethod
+    def mime_type(path: str) -> str:
+        """Return the MIME type to use when uploading a variant."""
+        extension = os.path.splitext(path)[1].lower()
+        return {
+            '.jpg': 'image/jpeg',
+            '.jpeg': 'image/jpeg',
+            '.webp': 'image/webp'
+        }.get(extension, 'image/png')
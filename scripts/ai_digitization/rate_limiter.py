@@ -0,0 +1,248 @@
+"""
+Adaptive rate limiting and retry scheduling for cloud API calls.
+
+Each provider (OpenAI, Google Vision) gets a ProviderRateLimiter holding a
+requests-per-minute bucket and, optionally, a tokens-per-minute bucket. Calls
+wait for budget before they are sent. Rate-limit (429) and server (5xx) errors
+are retried with jittered exponential backoff, honouring Retry-After when the
+service sends it. Every 429 also halves the provider's send rate, which then
+recovers gradually as calls succeed.
+"""
+
+import time
+import random
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate."""
+
+    def __init__(self, per_minute: float, burst_seconds: float = 10.0):
+        """
+        Initialize the bucket.
+
+        Args:
+            per_minute (float): Sustained budget per minute
+            burst_seconds (float): Bucket capacity, expressed as seconds of budget
+        """
+        self.per_minute = per_minute
+        self.capacity = max(1.0, per_minute * burst_seconds / 60.0)
+        self.tokens = self.capacity
+        self.rate_factor = 1.0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def rate_per_second(self) -> float:
+        return self.per_minute * self.rate_factor / 60.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """
+        Wait until amount is available and take it.
+
+        Requests larger than the capacity are let through once the bucket is
+        full and leave it in debt. Callers are served in arrival order.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                needed = min(amount, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return waited
+                delay = (needed - self.tokens) / self.rate_per_second
+                await asyncio.sleep(delay)
+                waited += delay
+
+    def adjust(self, amount: float) -> None:
+        """Charge (or refund, if negative) tokens after the fact."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class ProviderRateLimiter:
+    """Request and token budgets plus retry handling for one API provider."""
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: Optional[float] = None,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        """
+        Initialize the limiter.
+
+        Args:
+            name (str): Provider name used in logs and stats
+            requests_per_minute (float): Request budget
+            tokens_per_minute (Optional[float]): Token budget, or None if the provider has none
+            max_retries (int): Retries after the first attempt before giving up
+            base_delay (float): First backoff delay in seconds
+            max_delay (float): Upper bound for any single backoff delay
+        """
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.started = time.monotonic()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.stats = {
+            'requests': 0,
+            'tokens': 0,
+            'retries': 0,
+            'rate_limited': 0,
+            'failures': 0,
+            'throttle_wait_seconds': 0.0,
+            'backoff_wait_seconds': 0.0
+        }
+
+    async def call(self, func: Callable[[], Awaitable[Any]], estimated_tokens: int = 0) -> Any:
+        """
+        Run func within the provider's budget, retrying transient failures.
+
+        Args:
+            func (Callable): Zero-argument coroutine function making the API call
+            estimated_tokens (int): Tokens to reserve up front; correct it afterwards
+                with record_tokens()
+
+        Returns:
+            Any: Whatever func returns
+        """
+        attempt = 0
+        while True:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            try:
+                waited = await self.requests.acquire(1)
+                if self.tokens and estimated_tokens:
+                    waited += await self.tokens.acquire(estimated_tokens)
+            finally:
+                self.queue_depth -= 1
+            self.stats['throttle_wait_seconds'] += waited
+            self.stats['requests'] += 1
+
+            try:
+                result = await func()
+            except Exception as e:
+                if self.tokens and estimated_tokens:
+                    self.tokens.adjust(-estimated_tokens)
+                status = _status_code(e)
+                if status == 429:
+                    self.stats['rate_limited'] += 1
+                    self._slow_down()
+
+                if attempt >= self.max_retries or not _is_retryable(e, status):
+                    self.stats['failures'] += 1
+                    raise
+
+                delay = _retry_after(e)
+                if delay is None:
+                    # Full jitter: spread retries so concurrent pages do not retry in lockstep
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                delay = min(delay, self.max_delay)
+
+                attempt += 1
+                self.stats['retries'] += 1
+                self.stats['backoff_wait_seconds'] += delay
+                logger.warning(f"{self.name}: {status or type(e).__name__} error, "
+                               f"retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            self._speed_up()
+            return result
+
+    def record_tokens(self, actual_tokens: int, estimated_tokens: int = 0) -> None:
+        """Account for the real token usage of a call that reserved estimated_tokens."""
+        self.stats['tokens'] += actual_tokens
+        if self.tokens:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def get_stats(self) -> Dict:
+        """Return throughput, queue depth and retry counters."""
+        minutes = max((time.monotonic() - self.started) / 60.0, 1e-9)
+        stats = dict(self.stats)
+        stats.update({
+            'requests_per_minute': round(self.stats['requests'] / minutes, 2),
+            'tokens_per_minute': round(self.stats['tokens'] / minutes, 2),
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'current_rate_factor': round(self.requests.rate_factor, 3),
+            'throttle_wait_seconds': round(self.stats['throttle_wait_seconds'], 2),
+            'backoff_wait_seconds': round(self.stats['backoff_wait_seconds'], 2)
+        })
+        return stats
+
+    def _slow_down(self) -> None:
+        """Halve the send rate after a 429."""
+        for bucket in (self.requests, self.tokens):
+            if bucket:
+                bucket.rate_factor = max(0.1, bucket.rate_factor * 0.5)
+        logger.warning(f"{self.name}: rate limited, sending at {self.requests.rate_factor:.0%} of budget")
+
+    def _speed_up(self) -> None:
+        """Recover the send rate a little after each success."""
+        for bucket in (self.requests, self.tokens):
+            if bucket and bucket.rate_factor < 1.0:
+                bucket.rate_factor = min(1.0, bucket.rate_factor + 0.05)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """Find the HTTP status of an OpenAI or Google API error, if it has one."""
+    for attr in ('status_code', 'code'):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, 'response', None)
+    value = getattr(response, 'status_code', None)
+    return value if isinstance(value, int) else None
+
+
+def _is_retryable(error: Exception, status: Optional[int]) -> bool:
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    # Connection resets and client-side timeouts carry no status code
+    name = type(error).__name__
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError)) or 'Timeout' in name or 'Connection' in name
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Read a Retry-After delay (in seconds) from the error's HTTP response."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
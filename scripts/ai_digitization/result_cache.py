@@ -0,0 +1,176 @@
+"""
+Content-addressed result cache for the AI digitization pipeline.
+
+Every OCR engine and GPT stage stores its result under a key derived from a
+hash of its inputs (image bytes, engine, model and prompt), so reruns only pay
+for stages whose inputs actually changed. Entries are small JSON files sharded
+by key prefix; the least recently used entries are evicted once the cache
+grows past its size budget.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(path: str) -> str:
+    """Return the sha256 hex digest of a file's contents."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ResultCache:
+    """On-disk JSON cache keyed by a hash of stage inputs."""
+
+    def __init__(self, cache_dir: str, max_bytes: int = 1024 * 1024 * 1024,
+                 enabled: bool = True, refresh: bool = False):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir (str): Directory that holds cached results
+            max_bytes (int): Size budget; oldest entries are evicted beyond it
+            enabled (bool): When False, get() always misses and set() is a no-op
+            refresh (bool): When True, get() always misses but set() still writes,
+                so a run replaces existing results
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+
+        # key -> (size, last access time), used for size-based eviction
+        self._index: Dict[str, Tuple[int, float]] = {}
+        self._total_bytes = 0
+        # (path, size, mtime_ns) -> sha256 of the file contents
+        self._file_digests: Dict[Tuple[str, int, int], str] = {}
+
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._load_index()
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Build a cache key from any JSON-serializable stage inputs."""
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def file_digest(self, path: str) -> str:
+        """Return the sha256 of a file's bytes, memoized on size and mtime."""
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        digest = self._file_digests.get(memo_key)
+        if digest is None:
+            digest = file_sha256(path)
+            self._file_digests[memo_key] = digest
+        return digest
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss."""
+        if not self.enabled or self.refresh:
+            self.misses += 1
+            return None
+
+        path = self._path_for(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        # Touch the entry so eviction treats it as recently used
+        try:
+            os.utime(path)
+            stat = path.stat()
+            self._index[key] = (stat.st_size, stat.st_mtime)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable value under key."""
+        if not self.enabled:
+            return
+
+        path = self._path_for(key)
+        try:
+            path.parent.mkdir(exist_ok=True)
+            # Write atomically so an interrupted run never leaves a torn entry
+            fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+            stat = path.stat()
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not write cache entry {key[:12]}: {e}")
+            return
+
+        previous_size = self._index.get(key, (0, 0.0))[0]
+        self._index[key] = (stat.st_size, stat.st_mtime)
+        self._total_bytes += stat.st_size - previous_size
+
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def get_stats(self) -> Dict:
+        """Return hit/miss counters and current cache size."""
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'refresh': self.refresh,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._index),
+            'size_bytes': self._total_bytes
+        }
+
+    def _path_for(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _load_index(self) -> None:
+        """Scan the cache directory to learn entry sizes and ages."""
+        for shard in self.cache_dir.iterdir():
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard):
+                if not entry.name.endswith('.json'):
+                    continue
+                stat = entry.stat()
+                self._index[entry.name[:-5]] = (stat.st_size, stat.st_mtime)
+                self._total_bytes += stat.st_size
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the cache is at 90% of its budget."""
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= target:
+                break
+            try:
+                self._path_for(key).unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not evict cache entry {key[:12]}: {e}")
+                continue
+            del self._index[key]
+            self._total_bytes -= size
+            evicted += 1
+
+        if evicted:
+            logger.info(f"Evicted {evicted} cache entries ({self._total_bytes} bytes remain)")
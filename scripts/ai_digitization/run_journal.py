@@ -0,0 +1,144 @@
+"""
+Checkpoint journal for resumable digitization runs.
+
+Each finished page is appended to a JSON Lines file as soon as it completes.
+Records are flushed to the OS immediately, so a crashed process never loses
+completed (and paid for) work, while fsync is batched so a large archive is
+not throttled by one disk sync per page. The journal keeps only a small
+filename -> offset index in memory; entries are read back one at a time when
+the aggregate output files are built, and a resumed run uses the index to
+skip the pages it already holds.
+"""
+
+import os
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RunJournal:
+    """Append-only JSON Lines journal of completed logbook entries."""
+
+    def __init__(self, journal_path: str, fsync_every: int = 16, fsync_interval: float = 2.0):
+        """
+        Initialize the journal.
+
+        Args:
+            journal_path (str): Path of the .jsonl journal file
+            fsync_every (int): Force records to disk after this many writes
+            fsync_interval (float): ...or once this many seconds have passed since the last sync
+        """
+        self.journal_path = Path(journal_path)
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        # filename -> byte offset of its latest record
+        self.offsets: Dict[str, int] = {}
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def start(self, resume: bool = False) -> None:
+        """
+        Open the journal for appending.
+
+        Args:
+            resume (bool): Keep and index existing records; otherwise the journal is truncated
+        """
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        self.offsets = {}
+        if resume and self.journal_path.exists():
+            valid_length = self._scan()
+            self._file = open(self.journal_path, 'r+b')
+            # Drop a torn final line so the next record starts on a clean line
+            self._file.truncate(valid_length)
+            self._file.seek(valid_length)
+            logger.info(f"Loaded {len(self.offsets)} completed entries from {self.journal_path}")
+        else:
+            self._file = open(self.journal_path, 'wb')
+
+    def record(self, entry: Dict) -> None:
+        """Append one completed entry; it is synced to disk with the next batch."""
+        if self._file is None:
+            raise RuntimeError("Journal is not open; call start() first")
+
+        offset = self._file.tell()
+        self._file.write(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n')
+        # Flush to the OS right away so readers (and a crashed process) see the record
+        self._file.flush()
+        self.offsets[entry['filename']] = offset
+
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        """Force all written records to disk."""
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def get(self, filename: str) -> Optional[Dict]:
+        """Read the latest record for one page, or None if it is not journaled."""
+        offset = self.offsets.get(filename)
+        if offset is None:
+            return None
+        with open(self.journal_path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def iter_entries(self, filenames: Iterable[str]) -> Iterator[Dict]:
+        """
+        Yield the latest record of each journaled page, in the order given.
+
+        Pages that are not in the journal are skipped. Only one entry is held in
+        memory at a time.
+        """
+        with open(self.journal_path, 'rb') as f:
+            for filename in filenames:
+                offset = self.offsets.get(filename)
+                if offset is None:
+                    continue
+                f.seek(offset)
+                yield json.loads(f.readline())
+
+    def close(self) -> None:
+        """Sync and close the journal file."""
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def _scan(self) -> int:
+        """
+        Index existing records and return the length of the readable prefix.
+
+        If a page was journaled more than once, the latest record wins.
+        """
+        valid_length = 0
+        with open(self.journal_path, 'rb') as f:
+            line_number = 0
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                line_number += 1
+                if not line.strip():
+                    valid_length = f.tell()
+                    continue
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("unterminated record")
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crash mid-write can leave a torn final line; that page is simply redone
+                    logger.warning(f"Ignoring unreadable journal line {line_number} in {self.journal_path}")
+                    continue
+                self.offsets[entry['filename']] = offset
+                valid_length = f.tell()
+        return valid_length
@@ -3,20 +3,26 @@ Image Format Converter
 
 This module provides functionality to convert images between various formats (HEIC, JPEG, PNG)
 and organize them into a standardized directory structure. It's designed for processing
-Ernest K Gann's 1933 logbook images.
+Ernest K Gann's 1933 logbook images. HEIC files are decoded in parallel by the
+shared HEIC conversion engine.
 
 Author: Ernest K Gann Digital Archive Project
 Date: 2024
 """
 
 import os
+import sys
 import shutil
-import pyheif
-from PIL import Image
-from typing import List, Optional, Tuple
+from typing import List, Optional
 import logging
 import re
 
+# Add the parent directory to the path to import other modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converters.heic_engine import ConversionTarget, HEICConversionEngine, decode_heic, save_image
+from ocr.batch_worker import is_up_to_date
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -40,6 +46,7 @@ class ImageFormatConverter:
         """
         self.source_dir = source_dir
         self.target_dir = target_dir
+        self.jpeg_target = ConversionTarget("JPEG", target_dir, extension=".jpg", quality=95)
         self._ensure_directories()
     
     def _ensure_directories(self) -> None:
@@ -58,25 +65,8 @@ class ImageFormatConverter:
             bool: True if conversion successful, False otherwise
         """
         try:
-            # Read the HEIC file
-            heif_file = pyheif.read(heic_file_path)
-            
-            # Convert to PIL Image
-            image = Image.frombytes(
-                heif_file.mode,
-                heif_file.size,
-                heif_file.data,
-                "raw",
-                heif_file.mode,
-                heif_file.stride,
-            )
-            
-            # Convert to RGB if necessary
-            if image.mode in ('RGBA', 'LA'):
-                image = image.convert('RGB')
-            
-            # Save as JPEG
-            image.save(jpeg_file_path, format="JPEG", quality=95)
+            image = decode_heic(heic_file_path)
+            save_image(image, self.jpeg_target, jpeg_file_path)
             logger.info(f"Converted {heic_file_path} to {jpeg_file_path}")
             return True
             
@@ -119,12 +109,17 @@ class ImageFormatConverter:
         
         return sorted(file_list, key=extract_number)
     
-    def process_directory(self, recursive: bool = True) -> dict:
+    def process_directory(self, recursive: bool = True, workers: Optional[int] = None, force: bool = False) -> dict:
         """
         Process all images in the source directory.
         
+        HEIC files are decoded in a process pool. Targets at least as new as
+        their source are skipped unless force is set.
+        
         Args:
             recursive (bool): Whether to search subdirectories recursively
+            workers (Optional[int]): HEIC decode processes (default: one per CPU core)
+            force (bool): Convert and copy files even if their target is up to date
             
         Returns:
             dict: Processing statistics
@@ -132,59 +127,43 @@ class ImageFormatConverter:
         processed_files = []
         heic_conversions = 0
         jpeg_copies = 0
+        skipped = 0
         errors = 0
         
         if recursive:
             # Walk through all subdirectories
-            for root, dirs, files in os.walk(self.source_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    
-                    if file.lower().endswith('.heic'):
-                        # Convert HEIC to JPEG
-                        jpeg_filename = os.path.splitext(file)[0] + '.jpg'
-                        jpeg_path = os.path.join(self.target_dir, jpeg_filename)
-                        
-                        if self.convert_heic_to_jpeg(file_path, jpeg_path):
-                            processed_files.append(jpeg_path)
-                            heic_conversions += 1
-                        else:
-                            errors += 1
-                    
-                    elif file.lower().endswith(('.jpg', '.jpeg')):
-                        # Copy JPEG files directly
-                        jpeg_path = os.path.join(self.target_dir, file)
-                        
-                        if self.copy_jpeg_file(file_path, jpeg_path):
-                            processed_files.append(jpeg_path)
-                            jpeg_copies += 1
-                        else:
-                            errors += 1
+            source_files = [os.path.join(root, file) for root, dirs, files in os.walk(self.source_dir)
+                            for file in files]
         else:
             # Process only files in the source directory
-            for file in os.listdir(self.source_dir):
-                file_path = os.path.join(self.source_dir, file)
-                
-                if file.lower().endswith('.heic'):
-                    # Convert HEIC to JPEG
-                    jpeg_filename = os.path.splitext(file)[0] + '.jpg'
-                    jpeg_path = os.path.join(self.target_dir, jpeg_filename)
-                    
-                    if self.convert_heic_to_jpeg(file_path, jpeg_path):
-                        processed_files.append(jpeg_path)
-                        heic_conversions += 1
-                    else:
-                        errors += 1
-                
-                elif file.lower().endswith(('.jpg', '.jpeg')):
-                    # Copy JPEG files directly
-                    jpeg_path = os.path.join(self.target_dir, file)
-                    
-                    if self.copy_jpeg_file(file_path, jpeg_path):
-                        processed_files.append(jpeg_path)
-                        jpeg_copies += 1
-                    else:
-                        errors += 1
+            source_files = [os.path.join(self.source_dir, file) for file in os.listdir(self.source_dir)]
+        heic_files = [path for path in source_files if path.lower().endswith('.heic')]
+        jpeg_files = [path for path in source_files if path.lower().endswith(('.jpg', '.jpeg'))]
+        
+        # Convert HEIC files to JPEG
+        engine = HEICConversionEngine([self.jpeg_target], workers, force)
+        for result in engine.convert(heic_files):
+            if not result.success:
+                errors += 1
+            elif result.outputs:
+                processed_files.append(result.outputs[self.jpeg_target])
+                heic_conversions += 1
+            else:
+                processed_files.append(result.skipped[self.jpeg_target])
+                skipped += 1
+        
+        # Copy JPEG files directly
+        for file_path in jpeg_files:
+            jpeg_path = os.path.join(self.target_dir, os.path.basename(file_path))
+            
+            if not force and is_up_to_date(file_path, jpeg_path):
+                processed_files.append(jpeg_path)
+                skipped += 1
+            elif self.copy_jpeg_file(file_path, jpeg_path):
+                processed_files.append(jpeg_path)
+                jpeg_copies += 1
+            else:
+                errors += 1
         
         # Sort processed files numerically
         processed_files = self.sort_files_numerically(processed_files)
@@ -193,6 +172,7 @@ class ImageFormatConverter:
             'total_processed': len(processed_files),
             'heic_conversions': heic_conversions,
             'jpeg_copies': jpeg_copies,
+            'skipped': skipped,
             'errors': errors,
             'processed_files': processed_files
         }
@@ -237,6 +217,8 @@ def main():
     parser.add_argument("--source-dir", default="logbook1933", help="Source directory containing images")
     parser.add_argument("--target-dir", default="data/jpeg", help="Target directory for JPEG files")
     parser.add_argument("--recursive", action="store_true", help="Search subdirectories recursively")
+    parser.add_argument("--workers", type=int, help="Number of HEIC decode processes (default: one per CPU core)")
+    parser.add_argument("--force", action="store_true", help="Convert and copy files even if their target is up to date")
     parser.add_argument("--test", action="store_true", help="Run in test mode")
     
     args = parser.parse_args()
@@ -253,11 +235,12 @@ def main():
         print(f"  Processing rate: {stats['processing_rate']:.2%}")
     else:
         # Run processing
-        stats = converter.process_directory(args.recursive)
+        stats = converter.process_directory(args.recursive, args.workers, args.force)
         print(f"Processing completed:")
         print(f"  Total processed: {stats['total_processed']}")
         print(f"  HEIC conversions: {stats['heic_conversions']}")
         print(f"  JPEG copies: {stats['jpeg_copies']}")
+        print(f"  Up to date: {stats['skipped']}")
         print(f"  Errors: {stats['errors']}")
 
 
@@ -3,21 +3,31 @@ HEIC to PNG/JPEG Converter
 
 This module provides functionality to convert HEIC image files to PNG or JPEG format.
 It's specifically designed for processing Ernest K Gann's 1933 logbook images.
+Batches are decoded in parallel by the shared HEIC conversion engine, which can
+also write web JPEGs from the same decode.
 
 Author: Ernest K Gann Digital Archive Project
 Date: 2024
 """
 
 import os
-import pyheif
-from PIL import Image
-from typing import Optional, Tuple
+import sys
+from typing import List, Optional
 import logging
 
+# Add the parent directory to the path to import other modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converters.heic_engine import ConversionTarget, HEICConversionEngine, convert_file, find_heic_files
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Web JPEGs are sized for the website rather than for OCR
+WEB_JPEG_QUALITY = 85
+WEB_JPEG_MAX_SIZE = 2000
+
 
 class HEICConverter:
     """
@@ -55,71 +65,69 @@ class HEICConverter:
         Returns:
             Optional[str]: Path to the converted file, or None if conversion failed
         """
-        try:
-            # Read the HEIC file
-            heif_file = pyheif.read(heic_file_path)
-            
-            # Convert to PIL Image
-            image = Image.frombytes(
-                heif_file.mode,
-                heif_file.size,
-                heif_file.data,
-                "raw",
-                heif_file.mode,
-                heif_file.stride,
-            )
-            
-            # Convert to RGB if necessary for JPEG
-            if output_format.upper() == "JPEG" and image.mode in ('RGBA', 'LA'):
-                image = image.convert('RGB')
-            
-            # Generate output filename
-            base_name = os.path.splitext(os.path.basename(heic_file_path))[0]
-            output_filename = f"{base_name}.{output_format.lower()}"
-            output_path = os.path.join(self.output_dir, output_filename)
-            
-            # Save the converted image
-            image.save(output_path, format=output_format)
-            logger.info(f"Converted {heic_file_path} to {output_path}")
-            
-            return output_path
-            
-        except Exception as e:
-            logger.error(f"Error converting {heic_file_path}: {e}")
+        target = self._target(output_format)
+        result = convert_file(heic_file_path, [target], force=True)
+        if not result.success:
+            logger.error(f"Error converting {heic_file_path}: {result.error}")
             return None
+        
+        output_path = result.outputs[target]
+        logger.info(f"Converted {heic_file_path} to {output_path}")
+        return output_path
     
-    def batch_convert(self, output_format: str = "PNG", recursive: bool = True) -> list:
+    def _target(self, output_format: str) -> ConversionTarget:
+        """Conversion target writing output_format files to the output directory."""
+        # JPEG quality 75 is Pillow's default, which these conversions have always used
+        return ConversionTarget(output_format.upper(), self.output_dir, quality=75)
+    
+    def batch_convert(self, output_format: str = "PNG", recursive: bool = True, workers: Optional[int] = None,
+                      force: bool = False, jpeg_dir: Optional[str] = None,
+                      jpeg_max_size: Optional[int] = WEB_JPEG_MAX_SIZE) -> List[str]:
         """
         Convert all HEIC files in the input directory.
         
+        Files are decoded in a process pool. Outputs at least as new as their
+        HEIC file are skipped unless force is set, but still listed.
+        
         Args:
             output_format (str): Output format ("PNG" or "JPEG")
             recursive (bool): Whether to search subdirectories recursively
+            workers (Optional[int]): Decode processes (default: one per CPU core)
+            force (bool): Convert files even if their output is up to date
+            jpeg_dir (Optional[str]): Also write web JPEGs here from the same decode
+            jpeg_max_size (Optional[int]): Longest side of the web JPEGs in pixels
             
         Returns:
-            list: List of successfully converted file paths
+            List[str]: List of successfully converted file paths, including
+                those that were already up to date
         """
-        converted_files = []
+        target = self._target(output_format)
+        targets = [target]
+        if jpeg_dir:
+            targets.append(ConversionTarget("JPEG", jpeg_dir, extension=".jpg", quality=WEB_JPEG_QUALITY,
+                                            max_size=jpeg_max_size))
+        engine = HEICConversionEngine(targets, workers, force)
         
-        if recursive:
-            # Walk through all subdirectories
-            for root, dirs, files in os.walk(self.input_dir):
-                for file in files:
-                    if file.lower().endswith('.heic'):
-                        heic_path = os.path.join(root, file)
-                        converted_path = self.convert_single_file(heic_path, output_format)
-                        if converted_path:
-                            converted_files.append(converted_path)
-        else:
-            # Process only files in the input directory
-            for file in os.listdir(self.input_dir):
-                if file.lower().endswith('.heic'):
-                    heic_path = os.path.join(self.input_dir, file)
-                    converted_path = self.convert_single_file(heic_path, output_format)
-                    if converted_path:
-                        converted_files.append(converted_path)
+        converted_files = []
+        converted = 0
+        up_to_date = 0
+        web_only = 0
+        errors = 0
+        for result in engine.convert(find_heic_files(self.input_dir, recursive)):
+            if not result.success:
+                errors += 1
+            elif target in result.outputs:
+                converted_files.append(result.outputs[target])
+                converted += 1
+            else:
+                converted_files.append(result.skipped[target])
+                up_to_date += 1
+                if result.outputs:
+                    # Only the web JPEG was missing or stale
+                    web_only += 1
         
-        logger.info(f"Successfully converted {len(converted_files)} files")
+        logger.info(f"Successfully converted {converted} files ({up_to_date} already up to date, "
+                    f"{web_only} of which only needed a web JPEG; {errors} errors)")
         return converted_files
     
     def get_conversion_stats(self) -> dict:
@@ -160,6 +168,9 @@ def main():
     parser.add_argument("--output-dir", default="data/png", help="Output directory for converted files")
     parser.add_argument("--format", choices=["PNG", "JPEG"], default="PNG", help="Output format")
     parser.add_argument("--recursive", action="store_true", help="Search subdirectories recursively")
+    parser.add_argument("--jpeg-dir", help="Also write web JPEGs to this directory from the same decode")
+    parser.add_argument("--workers", type=int, help="Number of decode processes (default: one per CPU core)")
+    parser.add_argument("--force", action="store_true", help="Convert files even if their output is up to date")
     parser.add_argument("--test", action="store_true", help="Run in test mode")
     
     args = parser.parse_args()
@@ -176,8 +187,9 @@ def main():
         print(f"  Conversion rate: {stats['conversion_rate']:.2%}")
     else:
         # Run conversion
-        converted_files = converter.batch_convert(args.format, args.recursive)
-        print(f"Conversion completed. {len(converted_files)} files converted.")
+        converted_files = converter.batch_convert(args.format, args.recursive, args.workers, args.force,
+                                                  args.jpeg_dir)
+        print(f"Conversion completed. {len(converted_files)} files converted or up to date.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,241 @@
+"""
+HEIC Conversion Engine
+
+This module is the shared HEIC decode pipeline behind HEICConverter,
+ImageFormatConverter and the HEIC to PDF script. Decoding a phone photo is
+CPU bound, so files are spread over a process pool sized to the CPU cores.
+Each file is decoded once and written to every requested target: PNG pages
+for OCR, JPEG images for the website, and prepared pages for a PDF, which
+the caller appends to a StreamingPDFWriter in file order.
+
+File outputs at least as new as their source are skipped, and a file whose
+outputs are all up to date is not decoded at all. Outputs are written to a
+temporary file and renamed, so an interrupted run never leaves a partial
+image that looks up to date.
+
+Author: Ernest K Gann Digital Archive Project
+Date: 2024
+"""
+
+import os
+import sys
+import logging
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional
+
+import pyheif
+from PIL import Image
+
+# Add the parent directory to the path to import other modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregation.pdf_profiles import DEFAULT_PDF_PROFILE, PagePreparer
+from ocr.batch_worker import is_up_to_date
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TARGET_FORMATS = ('PNG', 'JPEG', 'PDF')
+
+
+@dataclass(frozen=True)
+class ConversionTarget:
+    """One output written from each decoded file"""
+    format: str                        # 'PNG', 'JPEG' or 'PDF'
+    output_dir: Optional[str] = None   # Where image files go; unused for PDF pages
+    extension: Optional[str] = None    # File extension, e.g. '.jpg' (default: from the format)
+    quality: int = 95                  # JPEG quality
+    max_size: Optional[int] = None     # Longest side in pixels; None keeps full resolution
+    pdf_profile: str = DEFAULT_PDF_PROFILE
+
+    def output_path(self, heic_path: str) -> Optional[str]:
+        """Path of the file this target writes for a HEIC file, or None for PDF pages."""
+        if self.format == 'PDF':
+            return None
+        extension = self.extension or f".{self.format.lower()}"
+        base_name = os.path.splitext(os.path.basename(heic_path))[0]
+        return os.path.join(self.output_dir, base_name + extension)
+
+
+@dataclass
+class ConversionResult:
+    """What happened to one HEIC file"""
+    source: str
+    outputs: Dict[ConversionTarget, str] = field(default_factory=dict)   # Written files by target
+    skipped: Dict[ConversionTarget, str] = field(default_factory=dict)   # Up-to-date files by target
+    pdf_page: Optional[Dict] = None       # Prepared page for StreamingPDFWriter.add_image
+    error: Optional[str] = None
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+
+def decode_heic(heic_path: str) -> Image.Image:
+    """
+    Decode a HEIC file into a PIL image.
+
+    Args:
+        heic_path (str): Path to the HEIC file
+
+    Returns:
+        Image.Image: The decoded image
+    """
+    heif_file = pyheif.read(heic_path)
+    return Image.frombytes(
+        heif_file.mode,
+        heif_file.size,
+        heif_file.data,
+        "raw",
+        heif_file.mode,
+        heif_file.stride,
+    )
+
+
+def save_image(image: Image.Image, target: ConversionTarget, output_path: str) -> None:
+    """
+    Write a decoded image to output_path in a target's format, resized and
+    flattened as the target requires.
+
+    Args:
+        image (Image.Image): Decoded image
+        target (ConversionTarget): PNG or JPEG target
+        output_path (str): Path of the file to write
+    """
+    if target.max_size and max(image.size) > target.max_size:
+        image = image.copy()
+        image.thumbnail((target.max_size, target.max_size), Image.LANCZOS)
+    options = {}
+    if target.format == 'JPEG':
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        options['quality'] = target.quality
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        image.save(temp_path, format=target.format, **options)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def convert_file(heic_path: str, targets: List[ConversionTarget], force: bool = False) -> ConversionResult:
+    """
+    Decode one HEIC file and write it to every target.
+
+    Args:
+        heic_path (str): Path to the HEIC file
+        targets (List[ConversionTarget]): Outputs to produce
+        force (bool): Rewrite files even if they are up to date
+
+    Returns:
+        ConversionResult: Written, skipped and prepared outputs, or the error
+    """
+    result = ConversionResult(heic_path)
+    pending = []
+    for target in targets:
+        output_path = target.output_path(heic_path)
+        if output_path and not force and is_up_to_date(heic_path, output_path):
+            result.skipped[target] = output_path
+        else:
+            pending.append((target, output_path))
+    if not pending:
+        return result
+
+    try:
+        image = decode_heic(heic_path)
+        for target, output_path in pending:
+            if target.format == 'PDF':
+                result.pdf_page = PagePreparer(target.pdf_profile).prepare_decoded(image)
+            else:
+                save_image(image, target, output_path)
+                result.outputs[target] = output_path
+    except Exception as e:
+        result.error = str(e)
+    return result
+
+
+class HEICConversionEngine:
+    """
+    Converts HEIC files to several targets from a single decode per file.
+    """
+
+    def __init__(self, targets: List[ConversionTarget], workers: Optional[int] = None, force: bool = False):
+        """
+        Initialize the engine.
+
+        Args:
+            targets (List[ConversionTarget]): Outputs to produce for every file
+            workers (Optional[int]): Decode processes (default: one per CPU core)
+            force (bool): Rewrite files even if they are up to date
+        """
+        for target in targets:
+            if target.format not in TARGET_FORMATS:
+                raise ValueError(f"Unknown target format: {target.format}")
+            if target.format != 'PDF' and not target.output_dir:
+                raise ValueError(f"{target.format} target needs an output directory")
+        self.targets = list(targets)
+        self.workers = workers or os.cpu_count() or 1
+        self.force = force
+
+    def convert(self, heic_paths: List[str],
+                progress: Optional[Callable[[int, int, ConversionResult], None]] = None) -> Iterator[ConversionResult]:
+        """
+        Convert HEIC files, yielding their results in input order.
+
+        Args:
+            heic_paths (List[str]): HEIC files to convert
+            progress (Optional[Callable]): Called with (done, total, result) after
+                each file; by default each file is logged
+
+        Yields:
+            ConversionResult: Result for each file, in the order given
+        """
+        for target in self.targets:
+            if target.output_dir:
+                os.makedirs(target.output_dir, exist_ok=True)
+        progress = progress or _log_progress
+        total = len(heic_paths)
+        jobs = [(path, self.targets, self.force) for path in heic_paths]
+
+        if self.workers > 1 and total > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, total)) as executor:
+                results = executor.map(convert_file, *zip(*jobs))
+                for done, result in enumerate(results, 1):
+                    progress(done, total, result)
+                    yield result
+        else:
+            for done, job in enumerate(jobs, 1):
+                result = convert_file(*job)
+                progress(done, total, result)
+                yield result
+
+
+def _log_progress(done: int, total: int, result: ConversionResult) -> None:
+    if result.error:
+        logger.error(f"[{done}/{total}] Error converting {result.source}: {result.error}")
+    elif result.outputs or result.pdf_page:
+        written = ', '.join(list(result.outputs.values()) + (['PDF page'] if result.pdf_page else []))
+        logger.info(f"[{done}/{total}] Converted {result.source} to {written}")
+    else:
+        logger.info(f"[{done}/{total}] Up to date: {result.source}")
+
+
+def find_heic_files(input_dir: str, recursive: bool = True) -> List[str]:
+    """
+    List the HEIC files in a directory.
+
+    Args:
+        input_dir (str): Directory to search
+        recursive (bool): Whether to search subdirectories recursively
+
+    Returns:
+        List[str]: HEIC file paths
+    """
+    if not recursive:
+        return [os.path.join(input_dir, file) for file in os.listdir(input_dir) if file.lower().endswith('.heic')]
+    return [os.path.join(root, file)
+            for root, dirs, files in os.walk(input_dir)
+            for file in files if file.lower().endswith('.heic')]
@@ -10,12 +10,19 @@ Date: 2024
 """
 
 import os
+import sys
 import pytesseract
-from PIL import Image
+from itertools import repeat
 from typing import List, Optional, Dict
 import logging
 import re
 
+# Add the parent directory to the path to import other modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ocr.batch_worker import call, create_executor, is_up_to_date
+from ocr.tesseract_engine import DEFAULT_PROFILE, PROFILES, TesseractEngine
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -29,16 +36,22 @@ class BasicOCRProcessor:
     and provides utilities for batch processing and text cleaning.
     """
     
-    def __init__(self, input_dir: str = "data/png", output_dir: str = "data/text_output"):
+    def __init__(self, input_dir: str = "data/png", output_dir: str = "data/text_output",
+                 profile: str = DEFAULT_PROFILE, region_workers: Optional[int] = None):
         """
         Initialize the OCR processor.
         
         Args:
             input_dir (str): Directory containing images to process
             output_dir (str): Directory to save extracted text files
+            profile (str): Tesseract profile (see tesseract_engine.PROFILES)
+            region_workers (Optional[int]): Threads OCRing the regions of a page
         """
         self.input_dir = input_dir
         self.output_dir = output_dir
+        # Passed on to batch worker processes, which build their own engines
+        self.engine_options = {'profile': profile, 'region_workers': region_workers}
+        self._engines: Dict[str, TesseractEngine] = {}
         self._ensure_directories()
         self._validate_tesseract()
     
@@ -68,15 +81,9 @@ class BasicOCRProcessor:
             Optional[str]: Extracted text, or None if extraction failed
         """
         try:
-            # Open and preprocess the image
-            image = Image.open(image_path)
-            
-            # Convert to RGB if necessary
-            if image.mode in ('RGBA', 'LA'):
-                image = image.convert('RGB')
-            
-            # Perform OCR
-            text = pytesseract.image_to_string(image, lang=lang)
+            # Segment the page and OCR its text regions
+            result = self.get_engine(lang).recognize(image_path)
+            text = result.text
             
             # Basic text cleaning
             text = self._clean_text(text)
@@ -88,6 +95,13 @@ class BasicOCRProcessor:
             logger.error(f"Error extracting text from {image_path}: {e}")
             return None
     
+    def get_engine(self, lang: str = 'eng') -> TesseractEngine:
+        """Return the Tesseract engine for a language, creating it on first use."""
+        if lang not in self._engines:
+            self._engines[lang] = TesseractEngine(self.engine_options['profile'], lang,
+                                                  self.engine_options['region_workers'])
+        return self._engines[lang]
+    
     def _clean_text(self, text: str) -> str:
         """
         Clean and normalize extracted text.
@@ -144,12 +158,28 @@ class BasicOCRProcessor:
         
         # Generate output filename
         if output_filename is None:
-            base_name = os.path.splitext(os.path.basename(image_path))[0]
-            output_filename = f"{base_name}.txt"
+            output_path = self.output_path_for(image_path)
+        else:
+            output_path = os.path.join(self.output_dir, output_filename)
         
-        output_path = os.path.join(self.output_dir, output_filename)
+        return self.save_text(text, output_path)
+    
+    def output_path_for(self, image_path: str) -> str:
+        """Return the text file path for an image."""
+        base_name = os.path.splitext(os.path.basename(image_path))[0]
+        return os.path.join(self.output_dir, f"{base_name}.txt")
+    
+    def save_text(self, text: str, output_path: str) -> bool:
+        """
+        Save extracted text to a file.
         
-        # Save extracted text
+        Args:
+            text (str): Text to save
+            output_path (str): Destination path
+            
+        Returns:
+            bool: True if the text was saved
+        """
         try:
             with open(output_path, 'w', encoding='utf-8') as f:
                 f.write(text)
@@ -159,12 +189,21 @@ class BasicOCRProcessor:
             logger.error(f"Error saving text to {output_path}: {e}")
             return False
     
-    def batch_process(self, image_extensions: List[str] = None) -> Dict:
+    def batch_process(self, image_extensions: List[str] = None, workers: int = 1,
+                      force: bool = False, lang: str = 'eng') -> Dict:
         """
         Process all images in the input directory.
         
+        With more than one worker, pages are OCR'd in a process pool. Text files
+        are still written in page order, each as soon as it and all earlier
+        pages are done. Images whose text file is newer than the image are
+        skipped unless force is set.
+        
         Args:
             image_extensions (List[str]): List of image extensions to process
+            workers (int): Number of OCR worker processes
+            force (bool): Reprocess images even if their text file is up to date
+            lang (str): Language code for OCR
             
         Returns:
             Dict: Processing statistics
@@ -183,30 +222,44 @@ class BasicOCRProcessor:
         
         logger.info(f"Found {len(image_files)} images to process")
         
+        # Skip images whose text is already up to date
+        pending = [
+            image_file for image_file in image_files
+            if force or not is_up_to_date(os.path.join(self.input_dir, image_file),
+                                                       self.output_path_for(image_file))
+        ]
+        skipped_count = len(image_files) - len(pending)
+        if skipped_count:
+            logger.info(f"Skipping {skipped_count} images with up-to-date text files")
+        
         # Process each image
         processed_count = 0
         error_count = 0
         processed_files = []
         
-        for image_file in image_files:
-            image_path = os.path.join(self.input_dir, image_file)
-            logger.info(f"Processing: {image_file}")
-            
-            if self.process_single_image(image_path):
-                processed_count += 1
-                processed_files.append(image_file)
-            else:
-                error_count += 1
+        image_paths = [os.path.join(self.input_dir, image_file) for image_file in pending]
+        with create_executor(self, workers) as executor:
+            texts = executor.map(call, repeat('extract_text_from_image'), image_paths, repeat(lang))
+            for image_file, image_path, text in zip(pending, image_paths, texts):
+                logger.info(f"Processing: {image_file}")
+                
+                if text is not None and self.save_text(text, self.output_path_for(image_path)):
+                    processed_count += 1
+                    processed_files.append(image_file)
+                else:
+                    error_count += 1
         
         stats = {
             'total_files': len(image_files),
             'processed_count': processed_count,
+            'skipped_count': skipped_count,
             'error_count': error_count,
-            'success_rate': processed_count / len(image_files) if image_files else 0,
+            'success_rate': (processed_count + skipped_count) / len(image_files) if image_files else 0,
             'processed_files': processed_files
         }
         
-        logger.info(f"Batch processing completed: {processed_count}/{len(image_files)} files processed successfully")
+        logger.info(f"Batch processing completed: {processed_count}/{len(image_files)} files processed successfully"
+                    f" ({skipped_count} up to date)")
         return stats
     
     def get_ocr_stats(self) -> Dict:
@@ -246,12 +299,15 @@ def main():
     parser.add_argument("--output-dir", default="data/text_output", help="Output directory for text files")
     parser.add_argument("--lang", default="eng", help="Language code for OCR")
     parser.add_argument("--single-file", help="Process a single image file")
+    parser.add_argument("--workers", type=int, default=1, help="Number of OCR worker processes")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default=DEFAULT_PROFILE, help="Tesseract profile")
+    parser.add_argument("--force", action="store_true", help="Reprocess images whose text files are up to date")
     parser.add_argument("--test", action="store_true", help="Run in test mode")
     
     args = parser.parse_args()
     
     # Initialize processor
-    processor = BasicOCRProcessor(args.input_dir, args.output_dir)
+    processor = BasicOCRProcessor(args.input_dir, args.output_dir, args.profile)
     
     if args.test:
         # Test mode - just show stats
@@ -269,10 +325,11 @@ def main():
             print(f"Failed to process {args.single_file}")
     else:
         # Run batch processing
-        stats = processor.batch_process()
+        stats = processor.batch_process(workers=args.workers, force=args.force, lang=args.lang)
         print(f"OCR processing completed:")
         print(f"  Total files: {stats['total_files']}")
         print(f"  Processed: {stats['processed_count']}")
+        print(f"  Up to date: {stats['skipped_count']}")
         print(f"  Errors: {stats['error_count']}")
         print(f"  Success rate: {stats['success_rate']:.2%}")
 
@@ -0,0 +1,63 @@
+"""
+Worker pool for batch OCR.
+
+Tesseract and spell checking are CPU bound, so batch runs with --workers spread
+pages over worker processes. Each worker builds its own processor once, in the
+pool initializer, so dictionaries and the spelling index are loaded once per
+process and only image paths and results cross the process boundary. With a
+single worker, pages run one at a time on a thread of the calling process,
+reusing the caller's processor.
+
+Author: Ernest K Gann Digital Archive Project
+Date: 2024
+"""
+
+import os
+from typing import Dict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+# Processor used by call() in this process
+_processor = None
+
+
+def init_worker(processor_class, input_dir: str, output_dir: str, options: Dict) -> None:
+    """Create the worker's processor once per worker process."""
+    global _processor
+    _processor = processor_class(input_dir, output_dir, **options)
+
+
+def _use_processor(processor) -> None:
+    global _processor
+    _processor = processor
+
+
+def call(method: str, *args):
+    """Run one processor method on the worker's processor."""
+    return getattr(_processor, method)(*args)
+
+
+def create_executor(processor, workers: int) -> Executor:
+    """
+    Create the executor that runs call() for a batch.
+
+    Args:
+        processor: OCR processor; its class and directories configure the workers
+        workers (int): Number of worker processes; 1 or less runs in this process
+
+    Returns:
+        Executor: Executor to use as a context manager
+    """
+    if workers <= 1:
+        return ThreadPoolExecutor(max_workers=1, initializer=_use_processor, initargs=(processor,))
+    # Pages are already spread over processes, so each OCRs its regions one at a time
+    options = dict(processor.engine_options, region_workers=1)
+    return ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                               initargs=(type(processor), processor.input_dir, processor.output_dir, options))
+
+
+def is_up_to_date(source_path: str, output_path: str) -> bool:
+    """True if output_path exists and is at least as new as source_path."""
+    try:
+        return os.path.getmtime(output_path) >= os.path.getmtime(source_path)
+    except OSError:
+        return False
@@ -0,0 +1,37 @@
+"""
+Image helpers shared by the OCR, preprocessing and PDF modules.
+
+Author: Ernest K Gann Digital Archive Project
+Date: 2024
+"""
+
+from PIL import Image
+
+
+def otsu_threshold(gray: Image.Image) -> int:
+    """Pick the threshold that best separates ink from paper (Otsu's method)."""
+    histogram = gray.histogram()[:256]
+    total = sum(histogram)
+    if total == 0:
+        return 128
+
+    sum_all = sum(level * count for level, count in enumerate(histogram))
+    sum_background = 0.0
+    weight_background = 0
+    best_threshold, best_variance = 128, -1.0
+
+    for level, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += level * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = level, variance
+
+    return best_threshold
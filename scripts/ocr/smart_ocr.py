@@ -10,14 +10,22 @@ Date: 2024
 """
 
 import os
+import sys
+import asyncio
 import pytesseract
-from PIL import Image
 from spellchecker import SpellChecker
 import openai
+from openai import AsyncOpenAI
 from typing import List, Optional, Dict, Tuple
 import logging
 import re
 
+# Add the parent directory to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ocr.batch_worker import call, create_executor, is_up_to_date
+from ocr.tesseract_engine import DEFAULT_PROFILE, PROFILES, TesseractEngine
+from text_processing.symspell_index import domain_vocabulary, load_default_index
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,17 +39,27 @@ class SmartOCRProcessor:
     text refinement to achieve high-quality text extraction from historical documents.
     """
     
-    def __init__(self, input_dir: str = "data/png", output_dir: str = "data/text_output"):
+    def __init__(self, input_dir: str = "data/png", output_dir: str = "data/text_output",
+                 profile: str = DEFAULT_PROFILE, region_workers: Optional[int] = None):
         """
         Initialize the smart OCR processor.
         
         Args:
             input_dir (str): Directory containing images to process
             output_dir (str): Directory to save extracted text files
+            profile (str): Tesseract profile (see tesseract_engine.PROFILES)
+            region_workers (Optional[int]): Threads OCRing the regions of a page
         """
         self.input_dir = input_dir
         self.output_dir = output_dir
+        # Passed on to batch worker processes, which build their own engines
+        self.engine_options = {'profile': profile, 'region_workers': region_workers}
+        self._engines: Dict[str, TesseractEngine] = {}
         self.spell_checker = SpellChecker()
+        # Aviation, telephony and place names count as correctly spelled
+        self.spell_checker.word_frequency.load_words(domain_vocabulary())
+        # Corrections use the memory-mapped symmetric-delete index
+        self.spelling_index = load_default_index()
         self._ensure_directories()
         self._validate_dependencies()
         self._setup_openai()
@@ -81,15 +99,9 @@ class SmartOCRProcessor:
             Optional[str]: Extracted text, or None if extraction failed
         """
         try:
-            # Open and preprocess the image
-            image = Image.open(image_path)
-            
-            # Convert to RGB if necessary
-            if image.mode in ('RGBA', 'LA'):
-                image = image.convert('RGB')
-            
-            # Perform OCR
-            text = pytesseract.image_to_string(image, lang=lang)
+            # Segment the page and OCR its text regions
+            result = self.get_engine(lang).recognize(image_path)
+            text = result.text
             
             # Basic text cleaning
             text = self._clean_text(text)
@@ -101,6 +113,13 @@ class SmartOCRProcessor:
             logger.error(f"Error extracting text from {image_path}: {e}")
             return None
     
+    def get_engine(self, lang: str = 'eng') -> TesseractEngine:
+        """Return the Tesseract engine for a language, creating it on first use."""
+        if lang not in self._engines:
+            self._engines[lang] = TesseractEngine(self.engine_options['profile'], lang,
+                                                  self.engine_options['region_workers'])
+        return self._engines[lang]
+    
     def _clean_text(self, text: str) -> str:
         """
         Clean and normalize extracted text.
@@ -142,7 +161,7 @@ class SmartOCRProcessor:
                 continue
             
             # Get correction
-            correction = self.spell_checker.correction(word)
+            correction = self.spelling_index.correction(word)
             corrected_words.append(correction if correction else word)
         
         return ' '.join(corrected_words)
@@ -165,6 +184,24 @@ class SmartOCRProcessor:
         correct_count = len(words) - len(misspelled)
         return correct_count / len(words)
     
+    def _gpt_request(self, text: str, context: str) -> Dict:
+        """Build the chat completion arguments for refining text."""
+        prompt = f"""Please refine the following text from a {context}. 
+            Correct errors, improve clarity, and fill in any missing information while 
+            preserving the original meaning and historical context:
+            
+            {text}"""
+        
+        return {
+            'model': "gpt-4",
+            'messages': [
+                {"role": "system", "content": "You are an expert in historical document transcription and aviation terminology."},
+                {"role": "user", "content": prompt}
+            ],
+            'max_tokens': 1000,
+            'temperature': 0.3
+        }
+    
     def improve_text_with_gpt(self, text: str, context: str = "aviation logbook") -> Optional[str]:
         """
         Use OpenAI GPT to refine and improve the OCR text.
@@ -181,23 +218,33 @@ class SmartOCRProcessor:
             return text
         
         try:
-            prompt = f"""Please refine the following text from a {context}. 
-            Correct errors, improve clarity, and fill in any missing information while 
-            preserving the original meaning and historical context:
+            response = openai.chat.completions.create(**self._gpt_request(text, context))
             
-            {text}"""
+            improved_text = response.choices[0].message.content.strip()
+            logger.info("GPT enhancement completed successfully")
+            return improved_text
+            
+        except Exception as e:
+            logger.error(f"Error during OpenAI API call: {e}")
+            return text  # Return original text if API call fails
+    
+    async def improve_text_with_gpt_async(self, client: AsyncOpenAI, text: str,
+                                          context: str = "aviation logbook") -> str:
+        """
+        Asynchronous version of improve_text_with_gpt() for batch runs.
+        
+        Args:
+            client (AsyncOpenAI): Client shared by the batch
+            text (str): Text to improve
+            context (str): Context for the text (e.g., "aviation logbook")
             
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an expert in historical document transcription and aviation terminology."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.3
-            )
+        Returns:
+            str: Improved text, or the original text if the API call failed
+        """
+        try:
+            response = await client.chat.completions.create(**self._gpt_request(text, context))
             
-            improved_text = response['choices'][0]['message']['content'].strip()
+            improved_text = response.choices[0].message.content.strip()
             logger.info("GPT enhancement completed successfully")
             return improved_text
             
@@ -205,21 +252,21 @@ class SmartOCRProcessor:
             logger.error(f"Error during OpenAI API call: {e}")
             return text  # Return original text if API call fails
     
-    def process_image_with_quality_check(self, image_path: str, threshold: float = 0.9) -> Tuple[bool, str, float]:
+    def ocr_page(self, image_path: str, lang: str = 'eng') -> Optional[Tuple[str, float]]:
         """
-        Process an image with quality assessment and enhancement.
+        Extract and spell-correct the text of one image (the CPU-bound part of a page).
         
         Args:
             image_path (str): Path to the image file
-            threshold (float): Minimum spelling accuracy threshold for GPT enhancement
+            lang (str): Language code for OCR
             
         Returns:
-            Tuple[bool, str, float]: (success, processed_text, accuracy_score)
+            Optional[Tuple[str, float]]: (corrected_text, accuracy_score), or None if extraction failed
         """
         # Extract text
-        text = self.extract_text_from_image(image_path)
+        text = self.extract_text_from_image(image_path, lang)
         if text is None:
-            return False, "", 0.0
+            return None
         
         # Correct spelling
         corrected_text = self.correct_spelling(text)
@@ -227,6 +274,23 @@ class SmartOCRProcessor:
         # Calculate accuracy
         accuracy = self.calculate_spelling_accuracy(corrected_text)
         logger.info(f"Spelling accuracy: {accuracy:.2%}")
+        return corrected_text, accuracy
+    
+    def process_image_with_quality_check(self, image_path: str, threshold: float = 0.9) -> Tuple[bool, str, float]:
+        """
+        Process an image with quality assessment and enhancement.
+        
+        Args:
+            image_path (str): Path to the image file
+            threshold (float): Minimum spelling accuracy threshold for GPT enhancement
+            
+        Returns:
+            Tuple[bool, str, float]: (success, processed_text, accuracy_score)
+        """
+        result = self.ocr_page(image_path)
+        if result is None:
+            return False, "", 0.0
+        corrected_text, accuracy = result
         
         # Enhance with GPT if accuracy is above threshold
         if accuracy >= threshold and openai.api_key:
@@ -251,12 +315,27 @@ class SmartOCRProcessor:
         
         return sorted(file_list, key=extract_number)
     
-    def batch_process(self, threshold: float = 0.9) -> Dict:
+    def output_path_for(self, image_file: str) -> str:
+        """Return the text file path for an image."""
+        return os.path.join(self.output_dir, f"{os.path.splitext(os.path.basename(image_file))[0]}.txt")
+    
+    def batch_process(self, threshold: float = 0.9, workers: int = 1, gpt_concurrency: int = 4,
+                      force: bool = False) -> Dict:
         """
         Process all images in the input directory with quality assessment.
         
+        OCR and spelling correction run in a pool of worker processes; pages that
+        qualify for GPT enhancement then go to an asynchronous stage with at most
+        gpt_concurrency requests in flight, so OCR of later pages continues while
+        earlier ones are being enhanced. Text files are written in page order,
+        each as soon as it and all earlier pages are done. Images whose text file
+        is newer than the image are skipped unless force is set.
+        
         Args:
             threshold (float): Minimum spelling accuracy threshold for GPT enhancement
+            workers (int): Number of OCR worker processes
+            gpt_concurrency (int): Maximum number of GPT requests in flight
+            force (bool): Reprocess images even if their text file is up to date
             
         Returns:
             Dict: Processing statistics
@@ -272,58 +351,100 @@ class SmartOCRProcessor:
         
         logger.info(f"Found {len(image_files)} images to process")
         
-        # Process each image
-        processed_count = 0
-        error_count = 0
-        gpt_enhanced_count = 0
-        total_accuracy = 0.0
-        processed_files = []
-        
-        for image_file in image_files:
-            image_path = os.path.join(self.input_dir, image_file)
-            logger.info(f"Processing: {image_file}")
-            
-            success, text, accuracy = self.process_image_with_quality_check(image_path, threshold)
-            
-            if success:
-                # Save processed text
-                output_filename = f"{os.path.splitext(image_file)[0]}.txt"
-                output_path = os.path.join(self.output_dir, output_filename)
-                
-                try:
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        f.write(text)
-                    
-                    processed_count += 1
-                    total_accuracy += accuracy
-                    processed_files.append(image_file)
-                    
-                    if accuracy >= threshold and openai.api_key:
-                        gpt_enhanced_count += 1
-                        logger.info(f"GPT enhanced: {image_file}")
-                    else:
-                        logger.info(f"Basic processing: {image_file}")
-                        
-                except Exception as e:
-                    logger.error(f"Error saving text for {image_file}: {e}")
-                    error_count += 1
-            else:
-                error_count += 1
+        # Skip images whose text is already up to date
+        pending = [
+            image_file for image_file in image_files
+            if force or not is_up_to_date(os.path.join(self.input_dir, image_file),
+                                                       self.output_path_for(image_file))
+        ]
+        skipped_count = len(image_files) - len(pending)
+        if skipped_count:
+            logger.info(f"Skipping {skipped_count} images with up-to-date text files")
         
-        avg_accuracy = total_accuracy / processed_count if processed_count > 0 else 0.0
+        counts = asyncio.run(self._process_batch(pending, threshold, workers, gpt_concurrency))
+        processed_count = counts['processed_count']
+        avg_accuracy = counts['total_accuracy'] / processed_count if processed_count > 0 else 0.0
         
         stats = {
             'total_files': len(image_files),
             'processed_count': processed_count,
-            'error_count': error_count,
-            'gpt_enhanced_count': gpt_enhanced_count,
+            'skipped_count': skipped_count,
+            'error_count': counts['error_count'],
+            'gpt_enhanced_count': counts['gpt_enhanced_count'],
             'average_accuracy': avg_accuracy,
-            'success_rate': processed_count / len(image_files) if image_files else 0,
-            'processed_files': processed_files
+            'success_rate': (processed_count + skipped_count) / len(image_files) if image_files else 0,
+            'processed_files': counts['processed_files']
         }
         
-        logger.info(f"Smart OCR processing completed: {processed_count}/{len(image_files)} files processed successfully")
+        logger.info(f"Smart OCR processing completed: {processed_count}/{len(image_files)} files processed successfully"
+                    f" ({skipped_count} up to date)")
         return stats
+    
+    async def _process_batch(self, image_files: List[str], threshold: float, workers: int,
+                             gpt_concurrency: int) -> Dict:
+        """Run the OCR and GPT stages for a batch and write the results in page order."""
+        loop = asyncio.get_running_loop()
+        client = AsyncOpenAI(api_key=openai.api_key) if openai.api_key else None
+        gpt_slots = asyncio.Semaphore(max(1, gpt_concurrency))
+        counts = {
+            'processed_count': 0,
+            'error_count': 0,
+            'gpt_enhanced_count': 0,
+            'total_accuracy': 0.0,
+            'processed_files': []
+        }
+        
+        with create_executor(self, workers) as executor:
+            
+            async def process_page(image_file: str) -> Optional[Tuple[str, float, bool]]:
+                image_path = os.path.join(self.input_dir, image_file)
+                result = await loop.run_in_executor(executor, call, 'ocr_page', image_path)
+                if result is None:
+                    return None
+                text, accuracy = result
+                
+                # Enhance with GPT if accuracy is above threshold
+                if client is not None and accuracy >= threshold:
+                    async with gpt_slots:
+                        text = await self.improve_text_with_gpt_async(client, text)
+                    return text, accuracy, True
+                return text, accuracy, False
+            
+            tasks = [asyncio.ensure_future(process_page(image_file)) for image_file in image_files]
+            try:
+                for image_file, task in zip(image_files, tasks):
+                    result = await task
+                    logger.info(f"Processing: {image_file}")
+                    if result is None:
+                        counts['error_count'] += 1
+                        continue
+                    text, accuracy, enhanced = result
+                    
+                    # Save processed text
+                    try:
+                        with open(self.output_path_for(image_file), 'w', encoding='utf-8') as f:
+                            f.write(text)
+                    except Exception as e:
+                        logger.error(f"Error saving text for {image_file}: {e}")
+                        counts['error_count'] += 1
+                        continue
+                    
+                    counts['processed_count'] += 1
+                    counts['total_accuracy'] += accuracy
+                    counts['processed_files'].append(image_file)
+                    
+                    if enhanced:
+                        counts['gpt_enhanced_count'] += 1
+                        logger.info(f"GPT enhanced: {image_file}")
+                    else:
+                        logger.info(f"Basic processing: {image_file}")
+            finally:
+                for task in tasks:
+                    task.cancel()
+                if client is not None:
+                    await client.close()
+        
+        return counts
 
 
 def main():
@@ -335,12 +456,16 @@ def main():
     parser.add_argument("--output-dir", default="data/text_output", help="Output directory for text files")
     parser.add_argument("--threshold", type=float, default=0.9, help="Spelling accuracy threshold for GPT enhancement")
     parser.add_argument("--single-file", help="Process a single image file")
+    parser.add_argument("--workers", type=int, default=1, help="Number of OCR worker processes")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default=DEFAULT_PROFILE, help="Tesseract profile")
+    parser.add_argument("--gpt-concurrency", type=int, default=4, help="Maximum number of GPT requests in flight")
+    parser.add_argument("--force", action="store_true", help="Reprocess images whose text files are up to date")
     parser.add_argument("--test", action="store_true", help="Run in test mode")
     
     args = parser.parse_args()
     
     # Initialize processor
-    processor = SmartOCRProcessor(args.input_dir, args.output_dir)
+    processor = SmartOCRProcessor(args.input_dir, args.output_dir, args.profile)
     
     if args.test:
         # Test mode - process a single file if available
@@ -364,10 +489,12 @@ def main():
             print(f"Failed to process {args.single_file}")
     else:
         # Run batch processing
-        stats = processor.batch_process(args.threshold)
+        stats = processor.batch_process(args.threshold, workers=args.workers,
+                                        gpt_concurrency=args.gpt_concurrency, force=args.force)
         print(f"Smart OCR processing completed:")
         print(f"  Total files: {stats['total_files']}")
         print(f"  Processed: {stats['processed_count']}")
+        print(f"  Up to date: {stats['skipped_count']}")
         print(f"  Errors: {stats['error_count']}")
         print(f"  GPT enhanced: {stats['gpt_enhanced_count']}")
         print(f"  Average accuracy: {stats['average_accuracy']:.2%}")
@@ -0,0 +1,425 @@
+"""
+Tesseract OCR Engine
+
+This module provides a tuned local OCR engine for Ernest K Gann's 1933 logbook
+pages. Instead of running Tesseract once over a whole page with default
+settings, a page is split into its text regions with a recursive XY-cut on ink
+projection profiles, and the regions are recognized in parallel with the page
+segmentation (psm) and engine (oem) modes of a named profile.
+
+Recognition goes through tesserocr when it is installed, keeping one Tesseract
+API handle per thread for the life of the engine, and otherwise through
+pytesseract.image_to_data. Both report per-word confidences, which replace the
+spelling-based confidence estimate, and per-word bounding boxes, which the PDF
+aggregator uses for its searchable text layer.
+
+Author: Ernest K Gann Digital Archive Project
+Date: 2024
+"""
+
+import os
+import sys
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+
+import pytesseract
+from PIL import Image
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# Add the parent directory to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ocr.image_utils import otsu_threshold
+from ocr.word_boxes import WordBox, WordBoxes
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bump when segmentation or result assembly changes; part of OCR cache keys
+ENGINE_VERSION = 1
+
+# Width of the downscaled page used to find text regions
+ANALYSIS_WIDTH = 800
+# A row or column counts as ink if its mean darkness (0-255) exceeds this
+INK_LEVEL = 3
+# Minimum blank gap, as a fraction of page height/width, that separates regions
+MIN_ROW_GAP = 0.015
+MIN_COLUMN_GAP = 0.04
+# Regions smaller than this fraction of the page area are specks, not text
+MIN_REGION_AREA = 0.0005
+# Padding around each region, as a fraction of the page width
+REGION_PADDING = 0.01
+# XY-cut recursion depth, and the region count above which the page is OCR'd whole
+MAX_CUT_DEPTH = 6
+MAX_REGIONS = 24
+
+Box = Tuple[int, int, int, int]
+# (word, confidence 0-100, box)
+RecognizedWord = Tuple[str, float, Box]
+
+
+@dataclass(frozen=True)
+class TesseractProfile:
+    """Tesseract settings for one kind of page"""
+    name: str
+    psm: int                     # Page segmentation mode for each image Tesseract sees
+    oem: int = 1                 # 1 = LSTM engine
+    segment: bool = True         # Split the page into regions first
+    variables: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def config(self) -> str:
+        """Command-line configuration for pytesseract."""
+        options = [f"--oem {self.oem}", f"--psm {self.psm}"]
+        options.extend(f"-c {name}={value}" for name, value in sorted(self.variables.items()))
+        return ' '.join(options)
+
+    @property
+    def cache_key(self) -> str:
+        """Identifies everything that affects results, e.g. for OCR result caches."""
+        return f"tesseract-engine/{ENGINE_VERSION} {self.name} segment={self.segment} {self.config}"
+
+
+PROFILES: Dict[str, TesseractProfile] = {
+    # Each detected text region as a uniform block of text (the default)
+    'regions': TesseractProfile('regions', psm=6),
+    # Each detected region with Tesseract's own layout analysis, for mixed regions
+    'regions_auto': TesseractProfile('regions_auto', psm=3),
+    # The whole page as one block of text; the previous --psm 6 behaviour
+    'block': TesseractProfile('block', psm=6, segment=False),
+    # The whole page with Tesseract's own layout analysis
+    'page': TesseractProfile('page', psm=3, segment=False),
+    # Scattered text such as margin notes and stamps
+    'sparse': TesseractProfile('sparse', psm=11, segment=False)
+}
+DEFAULT_PROFILE = 'regions'
+
+
+@dataclass
+class OCRResult:
+    """Text and confidence for one page"""
+    text: str
+    confidence: float            # Mean word confidence (0-1), weighted by word length
+    word_count: int
+    regions: int
+    size: Tuple[int, int] = (0, 0)                         # Size of the page image in pixels
+    words: List[WordBox] = field(default_factory=list)     # Words with boxes in page pixels
+
+    @property
+    def word_boxes(self) -> WordBoxes:
+        """The recognized words with their boxes, for word_boxes.write_word_boxes."""
+        return WordBoxes(self.size[0], self.size[1], self.words)
+
+
+def get_profile(profile: Union[str, TesseractProfile]) -> TesseractProfile:
+    """Look up a profile by name (profiles may also be passed directly)."""
+    if isinstance(profile, TesseractProfile):
+        return profile
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown Tesseract profile: {profile} (choose from {', '.join(PROFILES)})")
+    return PROFILES[profile]
+
+
+def _ink_runs(profile: List[int], min_gap: int) -> List[Tuple[int, int]]:
+    """Return (start, end) of ink runs in a projection profile, merging gaps shorter than min_gap."""
+    runs = []
+    start = None
+    gap = 0
+    for position, level in enumerate(profile):
+        if level > INK_LEVEL:
+            if start is None:
+                start = position
+            gap = 0
+        elif start is not None:
+            gap += 1
+            if gap >= min_gap:
+                runs.append((start, position - gap + 1))
+                start = None
+                gap = 0
+    if start is not None:
+        runs.append((start, len(profile) - gap))
+    return runs
+
+
+def _xy_cut(mask: Image.Image, box: Box, horizontal: bool, depth: int,
+            min_gaps: Tuple[int, int], boxes: List[Box], tried_other_axis: bool = False) -> None:
+    """Recursively split box at blank bands, alternating between rows and columns."""
+    left, top, right, bottom = box
+    region = mask.crop(box)
+
+    # Projection profiles by box-filter resampling: one mean per row or column
+    if horizontal:
+        runs = _ink_runs(list(region.resize((1, bottom - top), Image.BOX).getdata()), min_gaps[0])
+    else:
+        runs = _ink_runs(list(region.resize((right - left, 1), Image.BOX).getdata()), min_gaps[1])
+
+    if len(runs) <= 1 or depth >= MAX_CUT_DEPTH:
+        # Nothing to cut along this axis; try the other one once before keeping the box
+        if len(runs) <= 1 and not tried_other_axis and depth < MAX_CUT_DEPTH:
+            _xy_cut(mask, box, not horizontal, depth + 1, min_gaps, boxes, True)
+        else:
+            boxes.append(box)
+        return
+
+    for start, end in runs:
+        if horizontal:
+            child = (left, top + start, right, top + end)
+        else:
+            child = (left + start, top, left + end, bottom)
+        # Trim the child to its ink before cutting it along the other axis
+        bbox = mask.crop(child).getbbox()
+        if bbox is None:
+            continue
+        child = (child[0] + bbox[0], child[1] + bbox[1], child[0] + bbox[2], child[1] + bbox[3])
+        _xy_cut(mask, child, not horizontal, depth + 1, min_gaps, boxes)
+
+
+def segment_regions(gray: Image.Image) -> List[Box]:
+    """
+    Find the text regions of a page in reading order.
+
+    Args:
+        gray (Image.Image): Grayscale page image
+
+    Returns:
+        List[Box]: (left, top, right, bottom) boxes in page coordinates
+    """
+    width, height = gray.size
+    if width == 0 or height == 0:
+        return []
+    scale = min(1.0, ANALYSIS_WIDTH / width)
+    small = gray.resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.BOX) if scale < 1 else gray
+
+    # Ink is white in the mask, so getbbox() and box-filter means measure ink
+    threshold = otsu_threshold(small)
+    mask = small.point(lambda value: 255 if value <= threshold else 0)
+    page_box = mask.getbbox()
+    if page_box is None:
+        return []
+
+    small_width, small_height = mask.size
+    min_gaps = (max(2, int(small_height * MIN_ROW_GAP)), max(2, int(small_width * MIN_COLUMN_GAP)))
+    boxes: List[Box] = []
+    _xy_cut(mask, page_box, True, 0, min_gaps, boxes)
+
+    min_area = MIN_REGION_AREA * small_width * small_height
+    padding = int(REGION_PADDING * width)
+    regions = []
+    for left, top, right, bottom in boxes:
+        if (right - left) * (bottom - top) < min_area:
+            continue
+        regions.append((
+            max(0, int(left / scale) - padding),
+            max(0, int(top / scale) - padding),
+            min(width, int(right / scale) + padding),
+            min(height, int(bottom / scale) + padding)
+        ))
+    return regions
+
+
+class _PytesseractBackend:
+    """Runs the tesseract command through pytesseract.image_to_data."""
+
+    def __init__(self, lang: str, profile: TesseractProfile):
+        self.lang = lang
+        self.config = profile.config
+
+    def recognize(self, image: Image.Image) -> Tuple[str, List[RecognizedWord]]:
+        data = pytesseract.image_to_data(image, lang=self.lang, config=self.config,
+                                         output_type=pytesseract.Output.DICT)
+        lines: Dict[Tuple[int, int, int], List[str]] = {}
+        words = []
+        for i, word in enumerate(data['text']):
+            word = word.strip()
+            confidence = float(data['conf'][i])
+            if not word or confidence < 0:
+                continue
+            line = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            lines.setdefault(line, []).append(word)
+            left, top = data['left'][i], data['top'][i]
+            words.append((word, confidence, (left, top, left + data['width'][i], top + data['height'][i])))
+        return '\n'.join(' '.join(line_words) for line_words in lines.values()), words
+
+    def close(self) -> None:
+        pass
+
+
+class _TesserocrBackend:
+    """Keeps one initialized Tesseract API handle per thread."""
+
+    def __init__(self, lang: str, profile: TesseractProfile):
+        self.lang = lang
+        self.profile = profile
+        self._local = threading.local()
+        self._handles = []
+        self._lock = threading.Lock()
+
+    def _api(self):
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(lang=self.lang, psm=self.profile.psm, oem=self.profile.oem)
+            for name, value in self.profile.variables.items():
+                api.SetVariable(name, str(value))
+            self._local.api = api
+            with self._lock:
+                self._handles.append(api)
+        return api
+
+    def recognize(self, image: Image.Image) -> Tuple[str, List[RecognizedWord]]:
+        api = self._api()
+        api.SetImage(image)
+        text = api.GetUTF8Text()
+        words = []
+        level = tesserocr.RIL.WORD
+        iterator = api.GetIterator()
+        if iterator is not None:
+            for word_iterator in tesserocr.iterate_level(iterator, level):
+                word = (word_iterator.GetUTF8Text(level) or '').strip()
+                confidence = float(word_iterator.Confidence(level))
+                box = word_iterator.BoundingBox(level)
+                if word and confidence >= 0 and box:
+                    words.append((word, confidence, tuple(box)))
+        return text.strip(), words
+
+    def close(self) -> None:
+        with self._lock:
+            for api in self._handles:
+                api.End()
+            self._handles = []
+        self._local = threading.local()
+
+
+class TesseractEngine:
+    """
+    Region-aware Tesseract OCR with real confidence scores.
+
+    Engines are meant to be long-lived: API handles and the region thread pool
+    are created on first use and reused for every page until close().
+    """
+
+    def __init__(self, profile: Union[str, TesseractProfile] = DEFAULT_PROFILE, lang: str = 'eng',
+                 workers: Optional[int] = None, backend: str = 'auto'):
+        """
+        Initialize the engine.
+
+        Args:
+            profile: Profile name from PROFILES, or a TesseractProfile
+            lang (str): Language code for OCR
+            workers (Optional[int]): Threads recognizing regions of a page (default: CPU count)
+            backend (str): 'tesserocr', 'pytesseract' or 'auto' (tesserocr if installed)
+        """
+        self.profile = get_profile(profile)
+        self.lang = lang
+        self.workers = max(1, workers or os.cpu_count() or 1)
+
+        if backend == 'auto':
+            backend = 'tesserocr' if tesserocr is not None else 'pytesseract'
+        if backend == 'tesserocr':
+            if tesserocr is None:
+                raise RuntimeError("tesserocr is not installed, install with: pip install tesserocr")
+            self._backend = _TesserocrBackend(lang, self.profile)
+        elif backend == 'pytesseract':
+            self._backend = _PytesseractBackend(lang, self.profile)
+        else:
+            raise ValueError(f"Unknown Tesseract backend: {backend}")
+        self.backend = backend
+
+        if self.workers > 1:
+            # Regions already run in parallel; Tesseract's own OpenMP threads would oversubscribe
+            os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def recognize(self, image: Union[str, Image.Image]) -> OCRResult:
+        """
+        OCR one page.
+
+        Args:
+            image: Path to an image file, or a PIL image
+
+        Returns:
+            OCRResult: Page text (regions in reading order, separated by blank lines) and confidence
+        """
+        if isinstance(image, str):
+            with Image.open(image) as opened:
+                gray = opened.convert('L')
+        else:
+            gray = image.convert('L')
+
+        boxes = segment_regions(gray) if self.profile.segment else []
+        if not boxes or len(boxes) > MAX_REGIONS:
+            boxes = [(0, 0) + gray.size]
+            crops = [gray]
+        else:
+            crops = [gray.crop(box) for box in boxes]
+
+        if len(crops) > 1 and self.workers > 1:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            results = list(self._executor.map(self._backend.recognize, crops))
+        else:
+            results = [self._backend.recognize(crop) for crop in crops]
+
+        texts = [text for text, _ in results if text]
+        words = [word for _, region_words in results for word in region_words]
+        weight = sum(len(word) for word, _, _ in words)
+        confidence = sum(len(word) * value for word, value, _ in words) / weight / 100 if weight else 0.0
+
+        # Word boxes are relative to their region; move them into page coordinates
+        page_words = [
+            (word, left + region[0], top + region[1], right + region[0], bottom + region[1])
+            for region, (_, region_words) in zip(boxes, results)
+            for word, _, (left, top, right, bottom) in region_words
+        ]
+
+        return OCRResult(
+            text='\n\n'.join(texts),
+            confidence=max(0.0, min(1.0, confidence)),
+            word_count=len(words),
+            regions=len(crops),
+            size=gray.size,
+            words=page_words
+        )
+
+    def close(self) -> None:
+        """Release the region threads and Tesseract handles."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._backend.close()
+
+
+def main():
+    """Main function to OCR images with a chosen profile."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="OCR images with tuned Tesseract profiles")
+    parser.add_argument("images", nargs="+", help="Image files to OCR")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default=DEFAULT_PROFILE, help="Tesseract profile")
+    parser.add_argument("--lang", default="eng", help="Language code for OCR")
+    parser.add_argument("--workers", type=int, help="Threads recognizing regions of a page")
+    parser.add_argument("--backend", choices=["auto", "tesserocr", "pytesseract"], default="auto",
+                        help="Tesseract binding")
+
+    args = parser.parse_args()
+
+    engine = TesseractEngine(args.profile, args.lang, args.workers, args.backend)
+    try:
+        for image_path in args.images:
+            result = engine.recognize(image_path)
+            print(f"{image_path}: {result.regions} regions, {result.word_count} words, "
+                  f"confidence {result.confidence:.2f}")
+            print(result.text)
+            print()
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Word bounding boxes from Tesseract, saved next to the OCR output.
+
+Each page gets a small JSON file holding the size of the image Tesseract read
+and every recognized word with its (left, top, right, bottom) box in that
+image's pixels. The PDF aggregator uses them to place an invisible, searchable
+text layer exactly over the words on the page image.
+
+Author: Ernest K Gann Digital Archive Project
+Date: 2024
+"""
+
+import os
+import json
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# (word, left, top, right, bottom)
+WordBox = Tuple[str, int, int, int, int]
+
+
+@dataclass
+class WordBoxes:
+    """Recognized words of one page and the image size their boxes refer to"""
+    width: int
+    height: int
+    words: List[WordBox]
+
+
+def word_boxes_path(boxes_dir: str, image_name: str) -> str:
+    """Path of the word box file for a page image."""
+    return os.path.join(boxes_dir, os.path.splitext(os.path.basename(image_name))[0] + '.json')
+
+
+def write_word_boxes(path: str, boxes: WordBoxes) -> None:
+    """Write a page's word boxes, replacing any previous file atomically."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'width': boxes.width, 'height': boxes.height, 'words': boxes.words}, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def read_word_boxes(path: str) -> Optional[WordBoxes]:
+    """Read a page's word boxes, or return None if there are none."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    words = [tuple(word) for word in data.get('words', [])]
+    if not words or not data.get('width') or not data.get('height'):
+        return None
+    return WordBoxes(data['width'], data['height'], words)
@@ -11,14 +11,33 @@ Date: 2024
 
 import os
 import re
+import sys
+from functools import lru_cache
 from spellchecker import SpellChecker
 from typing import List, Dict, Tuple, Optional
 import logging
 
+# Add the parent directory to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from text_processing.symspell_index import SymSpellIndex, domain_vocabulary, ensure_default_index
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Words containing digits or characters other than letters, hyphens and apostrophes
+# are left alone (times, altitudes, registrations, punctuation-attached tokens)
+SKIP_WORD_PATTERN = re.compile(r"[0-9]|[^a-zA-Z'-]")
+
+# Common abbreviations that are never spell checked
+ABBREVIATIONS = frozenset(['mph', 'kts', 'ft', 'm', 'km', 'nm', 'alt', 'hdg', 'spd'])
+
+# Default number of word -> correction results kept across documents
+DEFAULT_CORRECTION_CACHE_SIZE = 65536
+
+# Correction engines: the symmetric-delete index, or pyspellchecker's own search
+CORRECTION_ENGINES = ('symspell', 'pyspellchecker')
+
 
 class AdvancedSpellChecker:
     """
@@ -28,16 +47,29 @@ class AdvancedSpellChecker:
     custom dictionaries for aviation terminology and historical context.
     """
     
-    def __init__(self, custom_words: List[str] = None):
+    def __init__(self, custom_words: List[str] = None,
+                 cache_size: int = DEFAULT_CORRECTION_CACHE_SIZE, engine: str = 'symspell'):
         """
         Initialize the advanced spell checker.
         
         Args:
             custom_words (List[str]): List of custom words to add to dictionary
+            cache_size (int): Number of word corrections to memoize
+            engine (str): Correction engine, 'symspell' (default) or 'pyspellchecker'
         """
+        if engine not in CORRECTION_ENGINES:
+            raise ValueError(f"Unknown correction engine: {engine}")
+        self.engine = engine
         self.spell_checker = SpellChecker()
+        # Each checker maps its own view of the index, since custom words are added to it
+        self.index = SymSpellIndex(ensure_default_index()) if engine == 'symspell' else None
         self._setup_custom_dictionary(custom_words)
-        self._setup_aviation_terms()
+        self._setup_domain_terms()
+        
+        # Edit-distance searches are by far the most expensive step, and logbook
+        # pages repeat the same place names, terms and OCR errors, so each
+        # distinct word is corrected once and the result reused
+        self._cached_correction = lru_cache(maxsize=cache_size)(self._lookup_correction)
     
     def _setup_custom_dictionary(self, custom_words: List[str] = None) -> None:
         """
@@ -50,47 +82,23 @@ class AdvancedSpellChecker:
             custom_words = []
         
         # Add custom words to the spell checker
-        for word in custom_words:
-            self.spell_checker.word_frequency.load_words([word])
+        self.spell_checker.word_frequency.load_words(custom_words)
+        if self.index is not None:
+            self.index.add_words(custom_words)
         
         logger.info(f"Added {len(custom_words)} custom words to dictionary")
     
-    def _setup_aviation_terms(self) -> None:
-        """Setup aviation-specific terminology."""
-        aviation_terms = [
-            # Aircraft types
-            'biplane', 'monoplane', 'airliner', 'fighter', 'bomber', 'transport',
-            'seaplane', 'flying_boat', 'amphibian', 'glider', 'helicopter',
-            
-            # Aviation equipment
-            'altimeter', 'airspeed', 'compass', 'gyroscope', 'radio', 'transponder',
-            'landing_gear', 'propeller', 'rudder', 'aileron', 'elevator', 'flaps',
-            
-            # Weather terms
-            'ceiling', 'visibility', 'turbulence', 'crosswind', 'headwind', 'tailwind',
-            'downdraft', 'updraft', 'icing', 'fog', 'mist', 'overcast',
-            
-            # Navigation terms
-            'heading', 'bearing', 'course', 'waypoint', 'beacon', 'navaid',
-            'VOR', 'ILS', 'NDB', 'GPS', 'dead_reckoning',
-            
-            # Flight operations
-            'takeoff', 'landing', 'approach', 'departure', 'cruise', 'climb',
-            'descent', 'pattern', 'runway', 'taxiway', 'hangar', 'maintenance',
-            
-            # Historical aviation terms (1930s)
-            'aerodrome', 'aeroplane', 'airship', 'zeppelin', 'biplane', 'monoplane',
-            'flying_field', 'air_mail', 'barnstormer', 'wing_walker', 'stunt_pilot',
-            
-            # Ernest K Gann specific terms
-            'gann', 'ernest', 'logbook', 'flight_log', 'pilot_log', 'aviation_log'
-        ]
+    def _setup_domain_terms(self) -> None:
+        """
+        Setup aviation and telephony terminology and the journey places.
         
-        # Add aviation terms to the spell checker
-        for term in aviation_terms:
-            self.spell_checker.word_frequency.load_words([term])
+        The terms live in dictionaries/domain_terms.json and the gazetteer; the
+        spelling index is built from the same vocabulary.
+        """
+        domain_words = domain_vocabulary()
+        self.spell_checker.word_frequency.load_words(domain_words)
         
-        logger.info(f"Added {len(aviation_terms)} aviation terms to dictionary")
+        logger.info(f"Added {len(domain_words)} aviation, telephony and place terms to dictionary")
     
     def should_skip_word(self, word: str) -> bool:
         """
@@ -102,29 +110,57 @@ class AdvancedSpellChecker:
         Returns:
             bool: True if word should be skipped
         """
-        # Skip words with numbers
-        if re.search(r'[0-9]', word):
-            return True
-        
-        # Skip words with special characters (except hyphens and apostrophes)
-        if re.search(r'[^a-zA-Z\'-]', word):
-            return True
-        
-        # Skip very short words
-        if len(word) <= 2:
+        # Skip very short words, and words with numbers or special characters
+        # (except hyphens and apostrophes)
+        if len(word) <= 2 or SKIP_WORD_PATTERN.search(word):
             return True
         
         # Skip common abbreviations
-        abbreviations = ['mph', 'kts', 'ft', 'm', 'km', 'nm', 'alt', 'hdg', 'spd']
-        if word.lower() in abbreviations:
-            return True
+        return word.lower() in ABBREVIATIONS
+    
+    def _lookup_correction(self, word: str) -> Optional[str]:
+        """Run the dictionary search for one word (memoized per instance)."""
+        if self.index is not None:
+            return self.index.correction(word)
+        return self.spell_checker.correction(word)
+    
+    def correct_word(self, word: str, preserve_case: bool = True) -> str:
+        """
+        Correct a single word.
         
-        return False
+        Args:
+            word (str): Word to correct
+            preserve_case (bool): Whether to preserve original case
+            
+        Returns:
+            str: Corrected word, or the word itself if it is skipped or has no correction
+        """
+        if self.should_skip_word(word):
+            return word
+        
+        # Get correction
+        correction = self._cached_correction(word)
+        if correction is None:
+            return word
+        
+        # Preserve case if requested
+        if preserve_case:
+            if word.isupper():
+                correction = correction.upper()
+            elif word.istitle():
+                correction = correction.title()
+            elif word.islower():
+                correction = correction.lower()
+        
+        return correction
     
     def correct_text(self, text: str, preserve_case: bool = True) -> str:
         """
         Correct spelling errors in text while preserving context.
         
+        Each distinct word in the text is corrected once and the result mapped
+        back onto every occurrence.
+        
         Args:
             text (str): Text to correct
             preserve_case (bool): Whether to preserve original case
@@ -133,31 +169,57 @@ class AdvancedSpellChecker:
             str: Corrected text
         """
         words = text.split()
-        corrected_words = []
+        corrections = {word: self.correct_word(word, preserve_case) for word in dict.fromkeys(words)}
+        return ' '.join(corrections[word] for word in words)
+    
+    def clear_cache(self) -> None:
+        """Forget memoized corrections, e.g. after adding words to the dictionary."""
+        self._cached_correction.cache_clear()
+    
+    def cache_info(self):
+        """Hit/miss statistics of the correction memo."""
+        return self._cached_correction.cache_info()
+    
+    def analyze_text(self, text: str) -> Tuple[int, List[str]]:
+        """
+        Count checkable words and find misspelled ones in a single pass.
+        
+        Args:
+            text (str): Text to analyze
+            
+        Returns:
+            Tuple[int, List[str]]: Number of checkable words, and the misspelled words in text order
+        """
+        words = text.split()
+        # Distinct word -> None if skipped, else whether it is misspelled
+        status: Dict[str, Optional[bool]] = {}
+        checkable_count = 0
+        misspelled = []
         
         for word in words:
-            if self.should_skip_word(word):
-                corrected_words.append(word)
-                continue
-            
-            # Get correction
-            correction = self.spell_checker.correction(word)
+            if word not in status:
+                if self.should_skip_word(word):
+                    status[word] = None
+                else:
+                    status[word] = word.lower() not in self.spell_checker
             
-            if correction is not None:
-                # Preserve case if requested
-                if preserve_case:
-                    if word.isupper():
-                        correction = correction.upper()
-                    elif word.istitle():
-                        correction = correction.title()
-                    elif word.islower():
-                        correction = correction.lower()
-                
-                corrected_words.append(correction)
-            else:
-                corrected_words.append(word)
+            word_status = status[word]
+            if word_status is None:
+                continue
+            checkable_count += 1
+            if word_status:
+                misspelled.append(word)
         
-        return ' '.join(corrected_words)
+        return checkable_count, misspelled
+    
+    @staticmethod
+    def _accuracy(text: str, checkable_count: int, misspelled_count: int) -> float:
+        """Accuracy score from analyze_text() results."""
+        if not text.split():
+            return 0.0
+        if not checkable_count:
+            return 1.0
+        return (checkable_count - misspelled_count) / checkable_count
     
     def get_misspelled_words(self, text: str) -> List[str]:
         """
@@ -169,16 +231,7 @@ class AdvancedSpellChecker:
         Returns:
             List[str]: List of misspelled words
         """
-        words = text.split()
-        misspelled = []
-        
-        for word in words:
-            if not self.should_skip_word(word):
-                if word.lower() in self.spell_checker:
-                    continue
-                misspelled.append(word)
-        
-        return misspelled
+        return self.analyze_text(text)[1]
     
     def calculate_accuracy(self, text: str) -> float:
         """
@@ -190,18 +243,8 @@ class AdvancedSpellChecker:
         Returns:
             float: Accuracy score between 0 and 1
         """
-        words = text.split()
-        if not words:
-            return 0.0
-        
-        checkable_words = [word for word in words if not self.should_skip_word(word)]
-        if not checkable_words:
-            return 1.0
-        
-        misspelled = self.get_misspelled_words(text)
-        correct_count = len(checkable_words) - len(misspelled)
-        
-        return correct_count / len(checkable_words)
+        checkable_count, misspelled = self.analyze_text(text)
+        return self._accuracy(text, checkable_count, len(misspelled))
     
     def process_file(self, input_file: str, output_file: str) -> Dict:
         """
@@ -221,16 +264,16 @@ class AdvancedSpellChecker:
             
             # Get original statistics
             original_words = text.split()
-            original_misspelled = self.get_misspelled_words(text)
-            original_accuracy = self.calculate_accuracy(text)
+            original_checkable, original_misspelled = self.analyze_text(text)
+            original_accuracy = self._accuracy(text, original_checkable, len(original_misspelled))
             
             # Correct text
             corrected_text = self.correct_text(text)
             
             # Get corrected statistics
             corrected_words = corrected_text.split()
-            corrected_misspelled = self.get_misspelled_words(corrected_text)
-            corrected_accuracy = self.calculate_accuracy(corrected_text)
+            corrected_checkable, corrected_misspelled = self.analyze_text(corrected_text)
+            corrected_accuracy = self._accuracy(corrected_text, corrected_checkable, len(corrected_misspelled))
             
             # Save corrected text
             with open(output_file, 'w', encoding='utf-8') as f:
@@ -316,7 +359,9 @@ class AdvancedSpellChecker:
             'file_stats': file_stats
         }
         
-        logger.info(f"Batch processing completed: {processed_count}/{len(text_files)} files processed successfully")
+        cache = self.cache_info()
+        logger.info(f"Batch processing completed: {processed_count}/{len(text_files)} files processed successfully "
+                    f"(correction cache: {cache.hits} hits, {cache.misses} misses)")
         return batch_stats
 
 
@@ -330,12 +375,13 @@ def main():
     parser.add_argument("--input-dir", default="data/text_output", help="Input directory containing text files")
     parser.add_argument("--output-dir", default="output", help="Output directory for corrected files")
     parser.add_argument("--batch", action="store_true", help="Process all files in input directory")
+    parser.add_argument("--engine", choices=CORRECTION_ENGINES, default="symspell", help="Correction engine")
     parser.add_argument("--test", action="store_true", help="Run in test mode")
     
     args = parser.parse_args()
     
     # Initialize spell checker
-    spell_checker = AdvancedSpellChecker()
+    spell_checker = AdvancedSpellChecker(engine=args.engine)
     
     if args.test:
         # Test mode - analyze a sample text
@@ -0,0 +1,485 @@
+"""
+Symmetric-Delete Spelling Index
+
+This module provides a SymSpell-style spelling correction index for the OCR text
+of Ernest K Gann's 1933 logbook. Every dictionary word is stored under all the
+strings obtained by deleting up to max_distance characters from it; a misspelled
+word is corrected by generating its own deletes and looking them up, instead of
+generating every insertion, replacement and transposition as pyspellchecker does.
+
+The vocabulary is pyspellchecker's English word frequencies plus the period
+aviation and telephony terms in dictionaries/domain_terms.json and the journey
+places of the gazetteer. Domain terms are ranked as common words, so OCR errors
+are resolved towards the vocabulary of the logbook.
+
+The index is written once to a compact binary file and memory-mapped when it is
+loaded, so processes share it and start without rebuilding it.
+
+Author: Ernest K Gann Digital Archive Project
+Date: 2024
+"""
+
+import os
+import re
+import sys
+import json
+import mmap
+import struct
+import hashlib
+import logging
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Add the parent directory to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ai_cleanup.gazetteer import DEFAULT_GAZETTEER_PATH
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DOMAIN_TERMS_PATH = os.path.join(MODULE_DIR, 'dictionaries', 'domain_terms.json')
+DEFAULT_INDEX_PATH = os.path.join(MODULE_DIR, '.cache', 'symspell_en.idx')
+
+DEFAULT_MAX_DISTANCE = 2
+# Only the first characters of a word are used for deletes; longer words are
+# verified by their full edit distance, which keeps the index small
+DEFAULT_PREFIX_LENGTH = 7
+# Domain terms rank at least like this percentile of dictionary words
+DOMAIN_FREQUENCY_PERCENTILE = 0.99
+
+# File layout: header, sorted delete keys (uint64), term frequencies (uint64),
+# term offsets into the UTF-8 term blob (uint32, one extra end offset), term blob
+MAGIC = b'SYMSPELL'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sIIIIQQ32s')
+
+# Each delete key packs a 40-bit hash of the delete string above a 24-bit term id.
+# Hash collisions only add candidates, which are verified by edit distance anyway.
+TERM_BITS = 24
+TERM_MASK = (1 << TERM_BITS) - 1
+
+
+@dataclass(frozen=True)
+class Suggestion:
+    """A correction candidate for a word"""
+    term: str
+    distance: int
+    frequency: int
+
+
+def _delete_hash(delete: str) -> int:
+    return int.from_bytes(hashlib.blake2b(delete.encode('utf-8'), digest_size=5).digest(), 'little')
+
+
+def generate_deletes(word: str, max_distance: int) -> Dict[str, int]:
+    """
+    Return every string reachable by deleting up to max_distance characters.
+
+    Args:
+        word (str): Word to delete characters from
+        max_distance (int): Maximum number of deletions
+
+    Returns:
+        Dict[str, int]: Delete -> number of deletions, in increasing order of deletions
+    """
+    deletes = {word: 0}
+    frontier = [word]
+    for depth in range(1, max_distance + 1):
+        next_frontier = []
+        for current in frontier:
+            for i in range(len(current)):
+                delete = current[:i] + current[i + 1:]
+                if delete not in deletes:
+                    deletes[delete] = depth
+                    next_frontier.append(delete)
+        frontier = next_frontier
+    return deletes
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent transpositions).
+
+    Args:
+        a (str): First string
+        b (str): Second string
+        limit (int): Largest distance of interest
+
+    Returns:
+        int: The distance, or -1 if it is larger than limit
+    """
+    if abs(len(a) - len(b)) > limit:
+        return -1
+
+    # Common prefixes and suffixes never contribute to the distance
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    if not a or not b:
+        distance = max(len(a), len(b))
+        return distance if distance <= limit else -1
+
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        char_a = a[i - 1]
+        for j in range(1, len(b) + 1):
+            cost = 0 if char_a == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and j > 1
+                    and char_a == b[j - 2] and a[i - 2] == b[j - 1]):
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return -1
+        previous_previous, previous = previous, current
+
+    distance = previous[-1]
+    return distance if distance <= limit else -1
+
+
+def build_index(frequencies: Dict[str, int], index_path: str,
+                max_distance: int = DEFAULT_MAX_DISTANCE,
+                prefix_length: int = DEFAULT_PREFIX_LENGTH,
+                fingerprint: bytes = b'') -> int:
+    """
+    Build an index file from word frequencies.
+
+    Args:
+        frequencies (Dict[str, int]): Lowercase word -> frequency
+        index_path (str): Destination file; replaced atomically
+        max_distance (int): Largest edit distance the index can correct
+        prefix_length (int): Number of leading characters deletes are generated from
+        fingerprint (bytes): Up to 32 bytes identifying the sources, stored in the header
+
+    Returns:
+        int: Number of delete keys in the index
+    """
+    terms = sorted(word for word in frequencies if word)
+    if len(terms) > TERM_MASK:
+        raise ValueError(f"Too many terms for the index format: {len(terms)}")
+
+    keys = array('Q')
+    for term_id, term in enumerate(terms):
+        for delete in generate_deletes(term[:prefix_length], max_distance):
+            keys.append(_delete_hash(delete) << TERM_BITS | term_id)
+    keys = array('Q', sorted(keys))
+
+    term_frequencies = array('Q', (frequencies[term] for term in terms))
+    offsets = array('I', [0])
+    blob = bytearray()
+    for term in terms:
+        blob += term.encode('utf-8')
+        offsets.append(len(blob))
+
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    temp_path = f"{index_path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, max_distance, prefix_length,
+                            len(terms), len(keys), len(blob), fingerprint[:32].ljust(32, b'\0')))
+        for table in (keys, term_frequencies, offsets):
+            if sys.byteorder != 'little':
+                table.byteswap()
+            table.tofile(f)
+        f.write(blob)
+    os.replace(temp_path, index_path)
+
+    logger.info(f"Built spelling index with {len(terms)} terms and {len(keys)} delete keys: {index_path}")
+    return len(keys)
+
+
+def read_fingerprint(index_path: str) -> Optional[bytes]:
+    """Return the source fingerprint stored in an index file, or None if it is not a valid index."""
+    try:
+        with open(index_path, 'rb') as f:
+            header = f.read(HEADER.size)
+    except OSError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, version = HEADER.unpack(header)[:2]
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None
+    return HEADER.unpack(header)[7]
+
+
+class SymSpellIndex:
+    """
+    A memory-mapped symmetric-delete index with frequency-ranked lookups.
+
+    Words are looked up case-insensitively. Words added with add_words() are
+    kept in memory alongside the mapped file, e.g. per-run custom vocabulary.
+    """
+
+    def __init__(self, index_path: str):
+        """
+        Map an index file built by build_index().
+
+        Args:
+            index_path (str): Path of the index file
+        """
+        self.index_path = index_path
+        self._file = open(index_path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.max_distance, self.prefix_length,
+         self.term_count, self.key_count, blob_size, self.fingerprint) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Not a spelling index (or an unsupported version): {index_path}")
+        if sys.byteorder != 'little':
+            self.close()
+            raise ValueError("Spelling index files can only be mapped on little-endian machines")
+
+        view = memoryview(self._map)
+        position = HEADER.size
+        self._keys = view[position:position + 8 * self.key_count].cast('Q')
+        position += 8 * self.key_count
+        self._frequencies = view[position:position + 8 * self.term_count].cast('Q')
+        position += 8 * self.term_count
+        self._offsets = view[position:position + 4 * (self.term_count + 1)].cast('I')
+        position += 4 * (self.term_count + 1)
+        self._blob = view[position:position + blob_size]
+
+        # In-memory additions: word -> frequency, and delete -> words
+        self._extra_frequencies: Dict[str, int] = {}
+        self._extra_deletes: Dict[str, List[str]] = {}
+
+    def close(self) -> None:
+        """Release the memory map."""
+        for name in ('_keys', '_frequencies', '_offsets', '_blob'):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+                setattr(self, name, None)
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def add_words(self, words: Iterable[str], frequency: int = 1) -> None:
+        """
+        Add words to this index in memory only.
+
+        Args:
+            words (Iterable[str]): Words to add
+            frequency (int): Frequency to rank them with
+        """
+        for word in words:
+            word = word.lower()
+            if not word:
+                continue
+            if word not in self._extra_frequencies:
+                for delete in generate_deletes(word[:self.prefix_length], self.max_distance):
+                    self._extra_deletes.setdefault(delete, []).append(word)
+            self._extra_frequencies[word] = max(frequency, self._extra_frequencies.get(word, 0))
+
+    def _term(self, term_id: int) -> str:
+        return bytes(self._blob[self._offsets[term_id]:self._offsets[term_id + 1]]).decode('utf-8')
+
+    def _term_ids(self, delete: str) -> Iterator[int]:
+        """Yield the ids of terms stored under a delete (plus any hash collisions)."""
+        bucket = _delete_hash(delete)
+        position = bisect_left(self._keys, bucket << TERM_BITS)
+        while position < self.key_count:
+            key = self._keys[position]
+            if key >> TERM_BITS != bucket:
+                return
+            yield key & TERM_MASK
+            position += 1
+
+    def _candidates(self, delete: str) -> Iterator[tuple]:
+        """Yield (term, frequency) for every term stored under a delete."""
+        for term_id in self._term_ids(delete):
+            yield self._term(term_id), self._frequencies[term_id]
+        for term in self._extra_deletes.get(delete, ()):
+            yield term, self._extra_frequencies[term]
+
+    def frequency(self, word: str) -> int:
+        """Return the frequency of a word, or 0 if it is not in the index."""
+        word = word.lower()
+        best = self._extra_frequencies.get(word, 0)
+        # A term is stored under its own prefix, which is its zero-deletion delete
+        for term_id in self._term_ids(word[:self.prefix_length]):
+            if self._term(term_id) == word:
+                return max(best, self._frequencies[term_id])
+        return best
+
+    def __contains__(self, word: str) -> bool:
+        return self.frequency(word) > 0
+
+    def lookup(self, word: str, max_distance: Optional[int] = None) -> List[Suggestion]:
+        """
+        Find the closest dictionary words.
+
+        Args:
+            word (str): Word to look up
+            max_distance (Optional[int]): Largest edit distance to consider
+                (at most the distance the index was built for)
+
+        Returns:
+            List[Suggestion]: All words at the smallest distance found, most frequent first
+        """
+        word = word.lower()
+        limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+
+        frequency = self.frequency(word)
+        if frequency:
+            return [Suggestion(word, 0, frequency)]
+
+        best_distance = limit
+        found: Dict[str, Suggestion] = {}
+        checked = {word}
+        for delete, depth in generate_deletes(word[:self.prefix_length], limit).items():
+            # Words reached through more deletions than the best distance cannot be closer
+            if depth > best_distance:
+                break
+            for term, term_frequency in self._candidates(delete):
+                if term in checked:
+                    continue
+                checked.add(term)
+                distance = edit_distance(word, term, best_distance)
+                if distance < 0:
+                    continue
+                if distance < best_distance:
+                    best_distance = distance
+                    found = {key: value for key, value in found.items() if value.distance <= distance}
+                found[term] = Suggestion(term, distance, term_frequency)
+
+        return sorted(found.values(), key=lambda suggestion: (suggestion.distance, -suggestion.frequency, suggestion.term))
+
+    def correction(self, word: str) -> Optional[str]:
+        """
+        The most probable spelling of a word.
+
+        Like pyspellchecker's correction(): a known word is returned unchanged,
+        otherwise the most frequent of the closest words (in lowercase), or None.
+        """
+        if word.lower() in self:
+            return word
+        suggestions = self.lookup(word)
+        return suggestions[0].term if suggestions else None
+
+
+def load_domain_terms(domain_terms_path: str = DEFAULT_DOMAIN_TERMS_PATH) -> Dict[str, List[str]]:
+    """Load the domain term lists (aviation, telephony)."""
+    with open(domain_terms_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def domain_vocabulary(domain_terms_path: str = DEFAULT_DOMAIN_TERMS_PATH,
+                      gazetteer_path: str = DEFAULT_GAZETTEER_PATH) -> List[str]:
+    """
+    Return the lowercase words of the domain terms and the gazetteer places.
+
+    Multi-word terms ('flying_boat', 'San Francisco') contribute each word.
+    """
+    terms = [term for group in load_domain_terms(domain_terms_path).values() for term in group]
+    with open(gazetteer_path, 'r', encoding='utf-8') as f:
+        terms.extend(json.load(f)['places'])
+
+    words = []
+    for term in terms:
+        words.extend(re.findall(r"[a-z']+", term.lower()))
+    return list(dict.fromkeys(words))
+
+
+def _sources_fingerprint(domain_terms_path: str, gazetteer_path: str,
+                         max_distance: int, prefix_length: int) -> bytes:
+    """Identify everything a default index is built from."""
+    import spellchecker
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps([FORMAT_VERSION, max_distance, prefix_length, DOMAIN_FREQUENCY_PERCENTILE,
+                              getattr(spellchecker, '__version__', '')]).encode('utf-8'))
+    for path in (domain_terms_path, gazetteer_path):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.digest()
+
+
+def build_default_index(index_path: str = DEFAULT_INDEX_PATH,
+                        domain_terms_path: str = DEFAULT_DOMAIN_TERMS_PATH,
+                        gazetteer_path: str = DEFAULT_GAZETTEER_PATH,
+                        max_distance: int = DEFAULT_MAX_DISTANCE,
+                        prefix_length: int = DEFAULT_PREFIX_LENGTH) -> int:
+    """
+    Build the logbook index from pyspellchecker's English dictionary and the domain vocabulary.
+
+    Returns:
+        int: Number of delete keys in the index
+    """
+    from spellchecker import SpellChecker
+
+    frequencies = dict(SpellChecker().word_frequency.dictionary)
+    ranked = sorted(frequencies.values())
+    domain_frequency = ranked[int(len(ranked) * DOMAIN_FREQUENCY_PERCENTILE)] if ranked else 1
+    for word in domain_vocabulary(domain_terms_path, gazetteer_path):
+        frequencies[word] = max(frequencies.get(word, 0), domain_frequency)
+
+    fingerprint = _sources_fingerprint(domain_terms_path, gazetteer_path, max_distance, prefix_length)
+    return build_index(frequencies, index_path, max_distance, prefix_length, fingerprint)
+
+
+def ensure_default_index(index_path: str = DEFAULT_INDEX_PATH,
+                         domain_terms_path: str = DEFAULT_DOMAIN_TERMS_PATH,
+                         gazetteer_path: str = DEFAULT_GAZETTEER_PATH) -> str:
+    """Build the logbook index if it is missing or its sources changed; returns its path."""
+    fingerprint = _sources_fingerprint(domain_terms_path, gazetteer_path,
+                                       DEFAULT_MAX_DISTANCE, DEFAULT_PREFIX_LENGTH)
+    if read_fingerprint(index_path) != fingerprint:
+        logger.info("Building spelling index (one-time)...")
+        build_default_index(index_path, domain_terms_path, gazetteer_path)
+    return index_path
+
+
+@lru_cache(maxsize=None)
+def load_default_index(index_path: str = DEFAULT_INDEX_PATH,
+                       domain_terms_path: str = DEFAULT_DOMAIN_TERMS_PATH,
+                       gazetteer_path: str = DEFAULT_GAZETTEER_PATH) -> SymSpellIndex:
+    """
+    Map the logbook index, building it first if needed.
+
+    The mapped index is shared, so each file is only opened once per process;
+    callers that add their own words should create a SymSpellIndex of their own.
+    """
+    return SymSpellIndex(ensure_default_index(index_path, domain_terms_path, gazetteer_path))
+
+
+def main():
+    """Main function to build or query the spelling index."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or query the symmetric-delete spelling index")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Index file")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index even if it is up to date")
+    parser.add_argument("words", nargs="*", help="Words to look up")
+
+    args = parser.parse_args()
+
+    if args.rebuild:
+        build_default_index(args.index)
+    index = load_default_index(args.index)
+    print(f"Spelling index: {index.term_count} terms, {index.key_count} delete keys ({args.index})")
+
+    for word in args.words:
+        suggestions = index.lookup(word)[:5]
+        listed = ', '.join(f"{s.term} (distance {s.distance}, frequency {s.frequency})" for s in suggestions)
+        print(f"  {word}: {listed or 'no suggestions'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -37,6 +37,8 @@ class TextAggregator:
         """
         self.input_dir = input_dir
         self.output_file = output_file
+        # Sorted input filenames, filled by the first directory scan
+        self._input_files: Optional[List[str]] = None
         self._ensure_directories()
     
     def _ensure_directories(self) -> None:
@@ -102,21 +104,58 @@ class TextAggregator:
             logger.error(f"Error reading file {file_path}: {e}")
             return None
     
-    def aggregate_text_files(self, separator: str = '\n\n') -> Dict:
+    def scan_input_files(self, refresh: bool = False) -> List[str]:
+        """
+        List the text files in the input directory in page order.
+        
+        The directory is only scanned once; later calls reuse the result.
+        
+        Args:
+            refresh (bool): Scan the directory again instead of using the cached list
+            
+        Returns:
+            List[str]: Sorted list of text filenames
+        """
+        if self._input_files is None or refresh:
+            text_files = []
+            if os.path.isdir(self.input_dir):
+                with os.scandir(self.input_dir) as entries:
+                    for entry in entries:
+                        if entry.name.lower().endswith('.txt') and entry.is_file():
+                            text_files.append(entry.name)
+            self._input_files = self.sort_files_numerically(text_files)
+        return self._input_files
+    
+    def _write_chapter(self, output_dir: str, index: int, text_file: str, cleaned_text: str) -> bool:
+        """Write one cleaned page as a chapter file; returns True on success."""
+        chapter_filename = f"chapter_{index:03d}_{os.path.splitext(text_file)[0]}.txt"
+        chapter_path = os.path.join(output_dir, chapter_filename)
+        try:
+            with open(chapter_path, 'w', encoding='utf-8') as f:
+                f.write(cleaned_text)
+            logger.info(f"Created chapter file: {chapter_filename}")
+            return True
+        except Exception as e:
+            logger.error(f"Error creating chapter file {chapter_filename}: {e}")
+            return False
+    
+    def aggregate_text_files(self, separator: str = '\n\n', chapters_dir: Optional[str] = None) -> Dict:
         """
         Aggregate all text files in the input directory.
         
+        Pages are read, cleaned and written to the output file one at a time,
+        so memory use does not grow with the number of pages. When chapters_dir
+        is given, the chapter files are written in the same pass. The output
+        file is replaced only once it is complete.
+        
         Args:
             separator (str): Separator to use between files
+            chapters_dir (Optional[str]): Directory for chapter files, if wanted
             
         Returns:
             Dict: Aggregation statistics
         """
-        # Get list of text files
-        text_files = []
-        for file in os.listdir(self.input_dir):
-            if file.lower().endswith('.txt'):
-                text_files.append(file)
+        text_files = self.scan_input_files()
         
         if not text_files:
             logger.warning("No text files found in input directory")
@@ -128,47 +167,49 @@ class TextAggregator:
                 'output_file': self.output_file
             }
         
-        # Sort files numerically
-        text_files = self.sort_files_numerically(text_files)
         logger.info(f"Found {len(text_files)} text files to aggregate")
+        if chapters_dir is not None:
+            os.makedirs(chapters_dir, exist_ok=True)
         
-        # Process each file
-        aggregated_text = ''
         processed_count = 0
         error_count = 0
         total_characters = 0
+        chapters_created = 0
+        temp_file = f"{self.output_file}.tmp"
         
-        for text_file in text_files:
-            file_path = os.path.join(self.input_dir, text_file)
-            logger.info(f"Processing: {text_file}")
-            
-            # Read and clean text
-            text_content = self.read_text_file(file_path)
-            
-            if text_content is not None:
-                # Clean the text
-                cleaned_text = self.clean_text(text_content)
-                
-                # Add to aggregated text
-                if aggregated_text:
-                    aggregated_text += separator + cleaned_text
-                else:
-                    aggregated_text = cleaned_text
-                
-                processed_count += 1
-                total_characters += len(cleaned_text)
-                logger.info(f"Added {len(cleaned_text)} characters from {text_file}")
-            else:
-                error_count += 1
-        
-        # Save aggregated text
         try:
-            with open(self.output_file, 'w', encoding='utf-8') as f:
-                f.write(aggregated_text)
+            with open(temp_file, 'w', encoding='utf-8', buffering=1024 * 1024) as out:
+                for i, text_file in enumerate(text_files, 1):
+                    file_path = os.path.join(self.input_dir, text_file)
+                    logger.info(f"Processing: {text_file}")
+                    
+                    # Read and clean text
+                    text_content = self.read_text_file(file_path)
+                    if text_content is None:
+                        error_count += 1
+                        continue
+                    
+                    cleaned_text = self.clean_text(text_content)
+                    
+                    # Append to the output file
+                    if processed_count:
+                        out.write(separator)
+                    out.write(cleaned_text)
+                    
+                    processed_count += 1
+                    total_characters += len(cleaned_text)
+                    logger.info(f"Added {len(cleaned_text)} characters from {text_file}")
+                    
+                    if chapters_dir is not None and self._write_chapter(chapters_dir, i, text_file, cleaned_text):
+                        chapters_created += 1
+            
+            os.replace(temp_file, self.output_file)
             logger.info(f"Aggregated text saved to {self.output_file}")
         except Exception as e:
             logger.error(f"Error saving aggregated text: {e}")
             error_count += 1
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
         
         stats = {
             'total_files': len(text_files),
@@ -178,6 +219,12 @@ class TextAggregator:
             'output_file': self.output_file,
             'success_rate': processed_count / len(text_files) if text_files else 0
         }
+        if chapters_dir is not None:
+            stats['chapters'] = {
+                'chapters_created': chapters_created,
+                'total_chapters': len(text_files),
+                'output_directory': chapters_dir
+            }
         
         logger.info(f"Text aggregation completed: {processed_count}/{len(text_files)} files processed successfully")
         return stats
@@ -189,13 +236,7 @@ class TextAggregator:
         Returns:
             Dict: Statistics including file counts and processing status
         """
-        input_files = []
-        
-        # Count input files
-        if os.path.exists(self.input_dir):
-            for file in os.listdir(self.input_dir):
-                if file.lower().endswith('.txt'):
-                    input_files.append(file)
+        input_files = self.scan_input_files()
         
         # Check if output file exists
         output_exists = os.path.exists(self.output_file)
@@ -216,7 +257,10 @@ class TextAggregator:
     
     def create_chapter_breakdown(self, output_dir: str = "output") -> Dict:
         """
-        Create individual chapter files from the aggregated text.
+        Create individual chapter files, one per input text file.
+        
+        Prefer passing chapters_dir to aggregate_text_files(), which writes the
+        chapters while aggregating instead of reading every page a second time.
         
         Args:
             output_dir (str): Directory to save chapter files
@@ -224,25 +268,7 @@ class TextAggregator:
         Returns:
             Dict: Chapter breakdown statistics
         """
-        # Read aggregated text
-        if not os.path.exists(self.output_file):
-            logger.error("Aggregated text file not found")
-            return {'chapters_created': 0, 'error': 'No aggregated text file'}
-        
-        try:
-            with open(self.output_file, 'r', encoding='utf-8') as f:
-                full_text = f.read()
-        except Exception as e:
-            logger.error(f"Error reading aggregated text: {e}")
-            return {'chapters_created': 0, 'error': str(e)}
-        
-        # Split into chapters (assuming each file is a chapter)
-        text_files = []
-        for file in os.listdir(self.input_dir):
-            if file.lower().endswith('.txt'):
-                text_files.append(file)
-        
-        text_files = self.sort_files_numerically(text_files)
+        text_files = self.scan_input_files()
         
         # Create chapter files
         os.makedirs(output_dir, exist_ok=True)
@@ -253,17 +279,8 @@ class TextAggregator:
             text_content = self.read_text_file(file_path)
             
             if text_content is not None:
-                cleaned_text = self.clean_text(text_content)
-                chapter_filename = f"chapter_{i:03d}_{os.path.splitext(text_file)[0]}.txt"
-                chapter_path = os.path.join(output_dir, chapter_filename)
-                
-                try:
-                    with open(chapter_path, 'w', encoding='utf-8') as f:
-                        f.write(cleaned_text)
+                if self._write_chapter(output_dir, i, text_file, self.clean_text(text_content)):
                     chapters_created += 1
-                    logger.info(f"Created chapter file: {chapter_filename}")
-                except Exception as e:
-                    logger.error(f"Error creating chapter file {chapter_filename}: {e}")
         
         return {
             'chapters_created': chapters_created,
@@ -298,8 +315,9 @@ def main():
             print(f"  Output file size: {stats['output_file_size']} bytes")
         print(f"  Processing rate: {stats['processing_rate']:.2%}")
     else:
-        # Run aggregation
-        stats = aggregator.aggregate_text_files(args.separator)
+        # Run aggregation, writing chapter files in the same pass if requested
+        chapters_dir = "output" if args.create_chapters else None
+        stats = aggregator.aggregate_text_files(args.separator, chapters_dir)
         print(f"Text aggregation completed:")
         print(f"  Total files: {stats['total_files']}")
         print(f"  Processed: {stats['processed_files']}")
@@ -309,7 +327,7 @@ def main():
         print(f"  Output file: {stats['output_file']}")
         
         if args.create_chapters:
-            chapter_stats = aggregator.create_chapter_breakdown()
+            chapter_stats = stats['chapters']
             print(f"Chapter breakdown:")
             print(f"  Chapters created: {chapter_stats['chapters_created']}")
             print(f"  Total chapters: {chapter_stats['total_chapters']}")